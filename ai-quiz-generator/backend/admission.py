@@ -0,0 +1,195 @@
+"""
+Admission control for expensive endpoints
+A bounded, per-client fair queue in front of quiz generation that sheds load with 503/429 and Retry-After
+"""
+import asyncio
+import logging
+import math
+import os
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import Deque, Dict
+
+from fastapi import HTTPException, Request
+
+import metrics
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+ADMISSION_ENABLED = os.getenv("ADMISSION_ENABLED", "true").lower() in ("1", "true", "yes")
+# Generations (scrape + LLM call + save) running at once; the rest wait in the queue
+GENERATE_CONCURRENCY = int(os.getenv("GENERATE_CONCURRENCY", "4"))
+GENERATE_QUEUE_SIZE = int(os.getenv("GENERATE_QUEUE_SIZE", "32"))
+# Reject instead of queueing when the estimated wait is longer than this (seconds)
+GENERATE_MAX_WAIT = float(os.getenv("GENERATE_MAX_WAIT", "30"))
+# Generations one client may have running or queued
+GENERATE_PER_CLIENT = int(os.getenv("GENERATE_PER_CLIENT", "2"))
+# Starting estimate of a generation's duration, replaced by measurements as requests complete
+GENERATE_EXPECTED_SECONDS = float(os.getenv("GENERATE_EXPECTED_SECONDS", "8"))
+# Identify clients by X-Forwarded-For (only behind a proxy that sets it). Each proxy appends the
+# address it received the request from, so the client is TRUSTED_PROXY_HOPS entries from the
+# right; anything further left was sent by the client and cannot be trusted.
+TRUST_FORWARDED_FOR = os.getenv("TRUST_FORWARDED_FOR", "false").lower() in ("1", "true", "yes")
+TRUSTED_PROXY_HOPS = max(1, int(os.getenv("TRUSTED_PROXY_HOPS", "1")))
+
+SERVICE_TIME_SMOOTHING = 0.2  # Weight of the newest duration in the moving average
+
+def client_id(request: Request) -> str:
+    """Address the fair-share limits are applied to"""
+    if TRUST_FORWARDED_FOR:
+        addresses = [address.strip() for address in request.headers.get("x-forwarded-for", "").split(",")]
+        # Fewer entries than trusted proxies means the header did not come through all of them
+        if len(addresses) >= TRUSTED_PROXY_HOPS and addresses[-TRUSTED_PROXY_HOPS]:
+            return addresses[-TRUSTED_PROXY_HOPS]
+    return request.client.host if request.client else "unknown"
+
+class AdmissionController:
+    """
+    Limits concurrent work and queues the excess per client.
+
+    Waiting requests are admitted round-robin across clients, so one client with many queued
+    requests cannot starve the others. A request is rejected at once when its client is at its
+    limit (429), the queue is full or its estimated wait exceeds the limit (503). The estimate
+    is the queue length over the concurrency times a moving average of recent durations, and
+    is returned in Retry-After.
+
+    Usage:
+        async with generate_admission.admit(client_id(request)):
+            ...
+    """
+
+    def __init__(self, name: str, concurrency: int, queue_size: int, max_wait: float, per_client: int, expected_seconds: float):
+        self.name = name
+        self.concurrency = concurrency
+        self.queue_size = queue_size
+        self.max_wait = max_wait
+        self.per_client = per_client
+        self.service_time = expected_seconds
+        self.active = 0
+        self.queued = 0
+        self._waiters: "OrderedDict[str, Deque[asyncio.Future]]" = OrderedDict()
+        self._clients: Dict[str, int] = {}  # Running plus queued requests per client
+        self._update_gauges()
+
+    def estimated_wait(self) -> float:
+        """Seconds a request arriving now would wait for a slot"""
+        if self.active < self.concurrency and not self.queued:
+            return 0.0
+        return (self.queued + 1) / self.concurrency * self.service_time
+
+    @asynccontextmanager
+    async def admit(self, client: str):
+        """Hold a slot for the duration of the block, waiting in the queue if necessary"""
+        await self._acquire(client)
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self._release(client, time.monotonic() - started)
+
+    async def _acquire(self, client: str) -> None:
+        if self._clients.get(client, 0) >= self.per_client:
+            self._reject("client_limit", 429, self.service_time, f"Too many quiz generations in progress for this client (limit {self.per_client})")
+        if self.active < self.concurrency and not self.queued:
+            self.active += 1
+            self._clients[client] = self._clients.get(client, 0) + 1
+            metrics.admission_wait.observe(0.0, self.name)
+            self._update_gauges()
+            return
+        wait = self.estimated_wait()
+        if self.queued >= self.queue_size:
+            self._reject("queue_full", 503, wait, "Server busy: the generation queue is full")
+        if wait > self.max_wait:
+            self._reject("wait_too_long", 503, wait, f"Server busy: estimated wait is {wait:.0f}s")
+
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.setdefault(client, deque()).append(future)
+        self.queued += 1
+        self._clients[client] = self._clients.get(client, 0) + 1
+        self._update_gauges()
+        enqueued = time.monotonic()
+        try:
+            await future
+        except asyncio.CancelledError:
+            # Client went away; give the slot back if it was granted in the meantime
+            if future.done() and not future.cancelled():
+                self._release(client, None)
+            else:
+                waiters = self._waiters.get(client)
+                if waiters is not None and future in waiters:
+                    waiters.remove(future)
+                    if not waiters:
+                        del self._waiters[client]
+                self.queued -= 1
+                self._leave(client)
+                self._update_gauges()
+            raise
+        metrics.admission_wait.observe(time.monotonic() - enqueued, self.name)
+
+    def _release(self, client: str, duration) -> None:
+        self.active -= 1
+        self._leave(client)
+        if duration is not None:
+            self.service_time += SERVICE_TIME_SMOOTHING * (duration - self.service_time)
+        # Hand free slots to the next waiting client in turn
+        while self.active < self.concurrency and self._waiters:
+            waiting_client, waiters = self._waiters.popitem(last=False)
+            future = waiters.popleft()
+            if waiters:
+                self._waiters[waiting_client] = waiters  # Back of the line
+            if future.cancelled():
+                continue  # Its cancellation handler does the accounting
+            self.queued -= 1
+            self.active += 1
+            future.set_result(None)
+        self._update_gauges()
+
+    def _leave(self, client: str) -> None:
+        remaining = self._clients.get(client, 0) - 1
+        if remaining > 0:
+            self._clients[client] = remaining
+        else:
+            self._clients.pop(client, None)
+
+    def _reject(self, reason: str, status_code: int, retry_after: float, detail: str) -> None:
+        metrics.admission_rejections.inc(1, self.name, reason)
+        logger.warning(f"Rejected {self.name} request ({reason}): {self.active} running, {self.queued} queued")
+        raise HTTPException(status_code=status_code, detail=detail, headers={"Retry-After": str(max(1, math.ceil(retry_after)))})
+
+    def _update_gauges(self) -> None:
+        metrics.admission_active.set(self.active, self.name)
+        metrics.admission_queued.set(self.queued, self.name)
+
+    def stats(self) -> Dict[str, float]:
+        """Current load, for /health"""
+        return {
+            "running": self.active,
+            "queued": self.queued,
+            "concurrency": self.concurrency,
+            "queue_size": self.queue_size,
+            "clients": len(self._clients),
+            "estimated_wait_seconds": round(self.estimated_wait(), 1),
+            "average_duration_seconds": round(self.service_time, 2),
+        }
+
+class _NoAdmission:
+    """Stand-in when admission control is disabled"""
+
+    @asynccontextmanager
+    async def admit(self, client: str):
+        yield
+
+    def stats(self) -> str:
+        return "disabled"
+
+# Quiz generation and refresh share the LLM capacity, so they share one controller
+generate_admission = AdmissionController(
+    "generate",
+    concurrency=GENERATE_CONCURRENCY,
+    queue_size=GENERATE_QUEUE_SIZE,
+    max_wait=GENERATE_MAX_WAIT,
+    per_client=GENERATE_PER_CLIENT,
+    expected_seconds=GENERATE_EXPECTED_SECONDS
+) if ADMISSION_ENABLED else _NoAdmission()
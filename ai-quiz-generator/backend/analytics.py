@@ -0,0 +1,377 @@
+"""
+Incrementally maintained quiz statistics
+Aggregates are updated when quizzes are created and answers are submitted, so reads are O(1)
+"""
+import argparse
+import json
+import logging
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import bindparam, delete, insert, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session, selectinload, undefer
+
+from database import DailyStats, Quiz, QuestionStats, ScoreHistogram, SessionLocal, StatsCounter, create_tables
+from scoring import AnswerKey
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+DIFFICULTIES = ("easy", "medium", "hard")
+HISTOGRAM_BUCKETS = 11  # 0-9%, 10-19%, ..., 90-99%, 100%
+
+def _increment(session: Session, model, key: Dict[str, Any], defaults: Optional[Dict[str, Any]] = None, **deltas: int) -> None:
+    """
+    Atomically add deltas to a row's counters, creating the row on first use.
+
+    UPDATE ... SET col = col + delta is atomic on every backend, so concurrent writers
+    never lose increments. Only the very first write for a key inserts (with `defaults`).
+    """
+    conditions = [getattr(model, column) == value for column, value in key.items()]
+    increments = {column: getattr(model, column) + delta for column, delta in deltas.items()}
+    statement = update(model).where(*conditions).values(increments)
+
+    if session.execute(statement).rowcount:
+        return
+    try:
+        with session.begin_nested():
+            session.execute(insert(model).values(**key, **(defaults or {}), **deltas))
+    except IntegrityError:
+        # Another transaction created the row first
+        session.execute(statement)
+
+def _apply_increments(
+    session: Session,
+    model,
+    key_columns: Tuple[str, ...],
+    rows: Dict[tuple, Dict[str, int]],
+    defaults: Optional[Dict[tuple, Dict[str, Any]]] = None
+) -> None:
+    """
+    Apply many keyed increments with one executemany UPDATE and one executemany INSERT.
+
+    Args:
+        session (Session): Database session
+        model: Aggregate model class
+        key_columns (Tuple[str, ...]): Primary key columns, in the order used by the row keys
+        rows (Dict[tuple, Dict[str, int]]): Deltas per key
+        defaults (Optional[Dict[tuple, Dict[str, Any]]]): Extra values for newly inserted rows
+    """
+    if not rows:
+        return
+    table = model.__table__
+    delta_columns = sorted({column for deltas in rows.values() for column in deltas})
+
+    # Find which keys already exist (filtering on the leading key column, then in Python)
+    leading = table.c[key_columns[0]]
+    leading_values = list({key[0] for key in rows})
+    existing = set()
+    for start in range(0, len(leading_values), 500):
+        existing.update(
+            tuple(row) for row in session.execute(
+                select(*(table.c[column] for column in key_columns)).where(leading.in_(leading_values[start:start + 500]))
+            )
+        )
+
+    updates = [
+        {**{f"k_{column}": value for column, value in zip(key_columns, key)},
+         **{f"d_{column}": deltas.get(column, 0) for column in delta_columns}}
+        for key, deltas in rows.items() if key in existing
+    ]
+    if updates:
+        session.execute(
+            update(table)
+            .where(*(table.c[column] == bindparam(f"k_{column}") for column in key_columns))
+            .values({column: table.c[column] + bindparam(f"d_{column}") for column in delta_columns}),
+            updates
+        )
+
+    missing = [key for key in rows if key not in existing]
+    if not missing:
+        return
+    try:
+        with session.begin_nested():
+            session.execute(insert(table), [
+                {**dict(zip(key_columns, key)), **((defaults or {}).get(key, {})), **rows[key]}
+                for key in missing
+            ])
+    except IntegrityError:
+        # A concurrent transaction created some of these rows - fall back to per-row upserts
+        for key in missing:
+            _increment(session, model, dict(zip(key_columns, key)), (defaults or {}).get(key), **rows[key])
+
+def score_bucket(correct: int, total: int) -> int:
+    """
+    Map a score to its histogram bucket.
+
+    Args:
+        correct (int): Correct answers
+        total (int): Questions in the quiz
+
+    Returns:
+        int: Bucket index (score percentage // 10, 10 for a perfect score)
+    """
+    if total <= 0:
+        return 0
+    return min(10, (100 * correct // total) // 10)
+
+class AnalyticsBatch:
+    """
+    Accumulates aggregate increments in memory so that any number of events is written
+    with a handful of statements (one UPDATE and at most one INSERT per aggregate table).
+    """
+
+    def __init__(self):
+        self.counters: Dict[tuple, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+        self.daily: Dict[tuple, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+        self.histogram: Dict[tuple, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+        self.questions: Dict[tuple, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+        self.question_difficulties: Dict[tuple, Dict[str, Any]] = {}
+
+    def _count(self, name: str, delta: int = 1) -> None:
+        self.counters[(name,)]["value"] += delta
+
+    def quiz_created(self, question_count: int, created_at: Optional[datetime] = None) -> None:
+        """
+        Add a newly saved quiz.
+
+        Args:
+            question_count (int): Number of questions in the quiz
+            created_at (Optional[datetime]): Creation time (defaults to now, UTC)
+        """
+        day = (created_at or datetime.utcnow()).date()
+        self._count("quizzes_created")
+        self._count("questions_generated", question_count)
+        self.daily[(day,)]["quizzes_created"] += 1
+
+    def submission(self, answer_key: AnswerKey, graded: Dict[int, bool], submitted_at: Optional[datetime] = None) -> None:
+        """
+        Add a graded answer submission.
+
+        Args:
+            answer_key (AnswerKey): Answer key of the quiz
+            graded (Dict[int, bool]): Correctness per answered question index (AnswerKey.grade)
+            submitted_at (Optional[datetime]): Submission time (defaults to now, UTC)
+        """
+        correct = sum(graded.values())
+        day = (submitted_at or datetime.utcnow()).date()
+
+        self._count("submissions")
+        self._count("questions_answered", len(graded))
+        self._count("correct_answers", correct)
+        daily = self.daily[(day,)]
+        daily["submissions"] += 1
+        daily["questions_answered"] += len(graded)
+        daily["correct_answers"] += correct
+        self.histogram[(score_bucket(correct, len(answer_key)),)]["submissions"] += 1
+
+        for index, is_correct in graded.items():
+            difficulty = answer_key.difficulties[index]
+            if difficulty in DIFFICULTIES:
+                self._count(f"questions_answered:{difficulty}")
+                self._count(f"correct_answers:{difficulty}", int(is_correct))
+            key = (answer_key.quiz_id, index)
+            self.questions[key]["attempts"] += 1
+            self.questions[key]["correct"] += int(is_correct)
+            self.question_difficulties[key] = {"difficulty": difficulty}
+
+    def apply(self, session: Session) -> None:
+        """Write the accumulated increments (call inside the transaction that stores the events)"""
+        _apply_increments(session, StatsCounter, ("name",), self.counters)
+        _apply_increments(session, DailyStats, ("day",), self.daily)
+        _apply_increments(session, ScoreHistogram, ("bucket",), self.histogram)
+        _apply_increments(session, QuestionStats, ("quiz_id", "question_index"), self.questions, self.question_difficulties)
+
+def record_quiz_created(session: Session, question_count: int, created_at: Optional[datetime] = None) -> None:
+    """
+    Update aggregates for a newly saved quiz (call inside the same transaction).
+
+    Args:
+        session (Session): Database session
+        question_count (int): Number of questions in the quiz
+        created_at (Optional[datetime]): Creation time (defaults to now, UTC)
+    """
+    batch = AnalyticsBatch()
+    batch.quiz_created(question_count, created_at)
+    batch.apply(session)
+
+def record_submission(
+    session: Session,
+    answer_key: AnswerKey,
+    graded: Dict[int, bool],
+    submitted_at: Optional[datetime] = None
+) -> None:
+    """
+    Update aggregates for a graded submission (call inside the same transaction).
+
+    Args:
+        session (Session): Database session
+        answer_key (AnswerKey): Answer key of the quiz
+        graded (Dict[int, bool]): Correctness per answered question index (AnswerKey.grade)
+        submitted_at (Optional[datetime]): Submission time (defaults to now, UTC)
+    """
+    batch = AnalyticsBatch()
+    batch.submission(answer_key, graded, submitted_at)
+    batch.apply(session)
+
+def _rate(numerator: int, denominator: int) -> Optional[float]:
+    return round(numerator / denominator, 4) if denominator else None
+
+def get_stats(session: Session, days: int = 30) -> Dict[str, Any]:
+    """
+    Read the global aggregates.
+
+    Args:
+        session (Session): Database session
+        days (int): Number of most recent days to include in the daily breakdown
+
+    Returns:
+        Dict[str, Any]: Totals, accuracy by difficulty, score histogram and daily counts
+    """
+    counters = dict(session.execute(select(StatsCounter.name, StatsCounter.value)).all())
+    histogram = dict(session.execute(select(ScoreHistogram.bucket, ScoreHistogram.submissions)).all())
+    since = datetime.utcnow().date() - timedelta(days=days - 1)
+    daily = session.execute(
+        select(DailyStats).where(DailyStats.day >= since).order_by(DailyStats.day)
+    ).scalars().all()
+
+    questions_answered = counters.get("questions_answered", 0)
+    return {
+        "total_quizzes": counters.get("quizzes_created", 0),
+        "total_questions": counters.get("questions_generated", 0),
+        "total_submissions": counters.get("submissions", 0),
+        "questions_answered": questions_answered,
+        "correct_answers": counters.get("correct_answers", 0),
+        "accuracy": _rate(counters.get("correct_answers", 0), questions_answered),
+        "accuracy_by_difficulty": {
+            difficulty: _rate(
+                counters.get(f"correct_answers:{difficulty}", 0),
+                counters.get(f"questions_answered:{difficulty}", 0)
+            )
+            for difficulty in DIFFICULTIES
+        },
+        "score_histogram": [
+            {
+                "range": "100" if bucket == 10 else f"{bucket * 10}-{bucket * 10 + 9}",
+                "submissions": histogram.get(bucket, 0)
+            }
+            for bucket in range(HISTOGRAM_BUCKETS)
+        ],
+        "daily": [
+            {
+                "date": row.day.isoformat(),
+                "quizzes_created": row.quizzes_created,
+                "submissions": row.submissions,
+                "questions_answered": row.questions_answered,
+                "correct_answers": row.correct_answers
+            }
+            for row in daily
+        ]
+    }
+
+def get_question_stats(session: Session, quiz_id: int) -> List[Dict[str, Any]]:
+    """
+    Read per-question correctness rates for one quiz (a primary key range scan).
+
+    Args:
+        session (Session): Database session
+        quiz_id (int): Quiz ID
+
+    Returns:
+        List[Dict[str, Any]]: Attempts, correct answers and correct rate per question index
+    """
+    rows = session.execute(
+        select(QuestionStats).where(QuestionStats.quiz_id == quiz_id).order_by(QuestionStats.question_index)
+    ).scalars().all()
+    return [
+        {
+            "index": row.question_index,
+            "difficulty": row.difficulty,
+            "attempts": row.attempts,
+            "correct": row.correct,
+            "correct_rate": _rate(row.correct, row.attempts)
+        }
+        for row in rows
+    ]
+
+def is_initialized(session: Session) -> bool:
+    """Whether aggregates exist (False on databases created before analytics were added)"""
+    return session.get(StatsCounter, "quizzes_created") is not None
+
+def rebuild(session: Session, batch_size: int = 200) -> int:
+    """
+    Recompute all aggregates from the quizzes table (one full scan).
+
+    Only the latest submission per quiz is stored, so rebuilt submission counts
+    reflect quizzes that have answers rather than every historical submission.
+
+    Args:
+        session (Session): Database session
+        batch_size (int): Quizzes loaded per query
+
+    Returns:
+        int: Number of quizzes processed
+    """
+    for model in (StatsCounter, DailyStats, ScoreHistogram, QuestionStats):
+        session.execute(delete(model))
+    # Make sure the counter exists even for an empty database so is_initialized() is True
+    _increment(session, StatsCounter, {"name": "quizzes_created"}, value=0)
+
+    processed = 0
+    last_id = 0
+    while True:
+        # Quiz JSON blobs (or the legacy column) for the whole batch in two queries, not one per quiz
+        batch = session.execute(
+            select(Quiz)
+            .options(selectinload(Quiz.quiz_content), undefer(Quiz.full_quiz_data_legacy))
+            .where(Quiz.id > last_id)
+            .order_by(Quiz.id)
+            .limit(batch_size)
+        ).scalars().all()
+        if not batch:
+            break
+
+        aggregates = AnalyticsBatch()
+        for quiz in batch:
+            try:
+                questions = json.loads(quiz.full_quiz_data)["quiz"]
+            except (ValueError, KeyError, TypeError):
+                logger.warning(f"Skipping quiz {quiz.id}: quiz data is not valid JSON")
+                continue
+            aggregates.quiz_created(len(questions), quiz.date_generated)
+            if quiz.user_answers:
+                try:
+                    answers = json.loads(quiz.user_answers)
+                except ValueError:
+                    continue
+                answer_key = AnswerKey.from_questions(quiz.id, questions)
+                aggregates.submission(answer_key, answer_key.grade(answers), quiz.date_generated)
+        aggregates.apply(session)
+
+        processed += len(batch)
+        last_id = batch[-1].id
+        session.expunge_all()
+
+    session.commit()
+    logger.info(f"Rebuilt analytics from {processed} quizzes")
+    return processed
+
+def main() -> None:
+    """Command line entry point: rebuild or show"""
+    parser = argparse.ArgumentParser(description="Quiz analytics aggregates")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("rebuild", help="Recompute aggregates from existing quizzes")
+    subparsers.add_parser("show", help="Print the current aggregates")
+    args = parser.parse_args()
+
+    create_tables()
+    with SessionLocal() as session:
+        if args.command == "rebuild":
+            print(f"Processed {rebuild(session)} quizzes")
+        print(json.dumps(get_stats(session), indent=2))
+
+if __name__ == "__main__":
+    main()
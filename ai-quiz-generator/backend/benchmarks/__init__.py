@@ -0,0 +1,4 @@
+"""
+Performance benchmarks for the AI Wiki Quiz Generator backend
+Run from the backend folder, e.g. python -m benchmarks.bench_database
+"""
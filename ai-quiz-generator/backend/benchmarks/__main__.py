@@ -0,0 +1,34 @@
+"""
+Offline benchmark suite
+Runs the pipeline micro-benchmarks and the end-to-end load test, each in its own process
+(the load test needs a scratch database configured before the app modules are imported)
+
+Usage:
+    python -m benchmarks                  # run both and print the results
+    python -m benchmarks --check          # exit non-zero on regressions against baseline.json
+    python -m benchmarks --save-baseline  # record this machine's numbers
+"""
+import argparse
+import subprocess
+import sys
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Offline benchmark suite (micro-benchmarks and load test)")
+    parser.add_argument("--check", action="store_true", help="Exit non-zero on regressions against baseline.json")
+    parser.add_argument("--save-baseline", action="store_true", help="Store these results as the new baseline")
+    parser.add_argument("--skip-load", action="store_true", help="Only run the micro-benchmarks")
+    args = parser.parse_args()
+
+    flags = [flag for flag, enabled in (("--check", args.check), ("--save-baseline", args.save_baseline)) if enabled]
+    suites = ["benchmarks.bench_pipeline"] + ([] if args.skip_load else ["benchmarks.load_test"])
+    failed = []
+    for module in suites:
+        print(f"\n=== {module} ===", flush=True)
+        if subprocess.run([sys.executable, "-m", module, *flags]).returncode != 0:
+            failed.append(module)
+    if failed:
+        print(f"\nFAILED: {', '.join(failed)}")
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,195 @@
+"""
+Database concurrency benchmark
+Compares concurrent read/write throughput of the old sync setup against the async engine with SQLite tuning
+
+Usage:
+    python -m benchmarks.bench_database --workers 32 --duration 10
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import tempfile
+import time
+from typing import Callable, Dict, List
+
+from sqlalchemy import create_engine, select, update
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from sqlalchemy.orm import sessionmaker
+from starlette.concurrency import run_in_threadpool
+
+from database import Base, Quiz, create_async_db_engine, create_sync_engine
+
+SEED_QUIZZES = 500
+
+def _seed(url: str) -> None:
+    """Create a fresh database with SEED_QUIZZES rows"""
+    seed_engine = create_engine(url)
+    Base.metadata.create_all(seed_engine)
+    with sessionmaker(bind=seed_engine)() as session:
+        session.add_all(
+            Quiz(url=f"https://en.wikipedia.org/wiki/Article_{i}", title=f"Article {i}", full_quiz_data_legacy="{}")
+            for i in range(SEED_QUIZZES)
+        )
+        session.commit()
+    seed_engine.dispose()
+
+def _answers() -> str:
+    return json.dumps({str(i): random.choice("ABCD") for i in range(10)})
+
+def _sync_operation(session_factory: Callable, write: bool) -> None:
+    """One request's worth of ORM work with a sync session"""
+    quiz_id = random.randint(1, SEED_QUIZZES)
+    with session_factory() as session:
+        if write:
+            session.execute(update(Quiz).where(Quiz.id == quiz_id).values(user_answers=_answers()))
+            session.commit()
+        else:
+            session.execute(select(Quiz.id, Quiz.title).order_by(Quiz.date_generated.desc()).limit(20)).all()
+            session.get(Quiz, quiz_id)
+
+async def _async_operation(session_factory: Callable, write: bool) -> None:
+    """One request's worth of ORM work with an async session"""
+    quiz_id = random.randint(1, SEED_QUIZZES)
+    async with session_factory() as session:
+        if write:
+            await session.execute(update(Quiz).where(Quiz.id == quiz_id).values(user_answers=_answers()))
+            await session.commit()
+        else:
+            (await session.execute(select(Quiz.id, Quiz.title).order_by(Quiz.date_generated.desc()).limit(20))).all()
+            await session.get(Quiz, quiz_id)
+
+async def _drive(operation: Callable, workers: int, duration: float, write_ratio: float) -> Dict[str, float]:
+    """Run `workers` concurrent clients issuing operations for `duration` seconds"""
+    latencies: List[float] = []
+    loop_lag: List[float] = []
+    errors: Dict[str, int] = {}
+    deadline = time.perf_counter() + duration
+
+    async def lag_probe() -> None:
+        # How late the event loop wakes a 1 ms sleep - the delay every other request would see
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            await asyncio.sleep(0.001)
+            loop_lag.append(time.perf_counter() - started - 0.001)
+
+    async def client() -> None:
+        while time.perf_counter() < deadline:
+            write = random.random() < write_ratio
+            started = time.perf_counter()
+            try:
+                await operation(write)
+                latencies.append(time.perf_counter() - started)
+            except Exception as e:
+                message = str(e).split("\n")[0][:60]
+                errors[message] = errors.get(message, 0) + 1
+            await asyncio.sleep(0)
+
+    started = time.perf_counter()
+    await asyncio.gather(lag_probe(), *(client() for _ in range(workers)))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    loop_lag.sort()
+    return {
+        "ops": len(latencies),
+        "ops_per_sec": len(latencies) / elapsed,
+        "p50_ms": 1000 * statistics.median(latencies) if latencies else 0.0,
+        "p95_ms": 1000 * latencies[int(0.95 * (len(latencies) - 1))] if latencies else 0.0,
+        "loop_lag_max_ms": 1000 * loop_lag[-1] if loop_lag else 0.0,
+        "errors": sum(errors.values()),
+        "error_kinds": errors,
+    }
+
+async def bench_sync_in_loop(url: str, workers: int, duration: float, write_ratio: float) -> Dict[str, float]:
+    """Before: sync sessions called directly inside async endpoints, default SQLite settings"""
+    engine = create_engine(url)
+    session_factory = sessionmaker(bind=engine)
+
+    async def operation(write: bool) -> None:
+        _sync_operation(session_factory, write)
+
+    try:
+        return await _drive(operation, workers, duration, write_ratio)
+    finally:
+        engine.dispose()
+
+async def bench_threadpool_default(url: str, workers: int, duration: float, write_ratio: float) -> Dict[str, float]:
+    """Sync sessions moved to the threadpool with default SQLite settings (rollback journal)"""
+    engine = create_engine(url)
+    session_factory = sessionmaker(bind=engine)
+
+    async def operation(write: bool) -> None:
+        await run_in_threadpool(_sync_operation, session_factory, write)
+
+    try:
+        return await _drive(operation, workers, duration, write_ratio)
+    finally:
+        engine.dispose()
+
+async def bench_threadpool_tuned(url: str, workers: int, duration: float, write_ratio: float) -> Dict[str, float]:
+    """Sync engine from database.py (pool sizing + WAL pragmas) in the threadpool"""
+    engine = create_sync_engine(url)
+    session_factory = sessionmaker(bind=engine)
+
+    async def operation(write: bool) -> None:
+        await run_in_threadpool(_sync_operation, session_factory, write)
+
+    try:
+        return await _drive(operation, workers, duration, write_ratio)
+    finally:
+        engine.dispose()
+
+async def bench_async_tuned(url: str, workers: int, duration: float, write_ratio: float) -> Dict[str, float]:
+    """After: async engine from database.py with WAL, synchronous=NORMAL, mmap and busy_timeout"""
+    engine = create_async_db_engine(url)
+    session_factory = async_sessionmaker(engine, expire_on_commit=False)
+
+    async def operation(write: bool) -> None:
+        await _async_operation(session_factory, write)
+
+    try:
+        return await _drive(operation, workers, duration, write_ratio)
+    finally:
+        await engine.dispose()
+
+SCENARIOS = {
+    "sync-in-event-loop (before)": bench_sync_in_loop,
+    "threadpool, default sqlite": bench_threadpool_default,
+    "threadpool, tuned sqlite": bench_threadpool_tuned,
+    "async, tuned sqlite (after)": bench_async_tuned,
+}
+
+async def run(workers: int, duration: float, write_ratio: float) -> Dict[str, Dict[str, float]]:
+    """Run every scenario against its own freshly seeded database file"""
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for index, (name, scenario) in enumerate(SCENARIOS.items()):
+            url = f"sqlite:///{os.path.join(tmp, f'bench_{index}.db')}"
+            _seed(url)
+            results[name] = await scenario(url, workers, duration, write_ratio)
+    return results
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Concurrent read/write database benchmark (SQLite)")
+    parser.add_argument("--workers", type=int, default=32, help="Concurrent clients")
+    parser.add_argument("--duration", type=float, default=5.0, help="Seconds per scenario")
+    parser.add_argument("--write-ratio", type=float, default=0.3, help="Fraction of operations that write")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args.workers, args.duration, args.write_ratio))
+
+    print(f"\n{args.workers} workers, {args.duration:.0f}s per scenario, {args.write_ratio:.0%} writes")
+    print(f"{'scenario':<30} {'ops/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'loop lag':>9} {'errors':>7}")
+    for name, stats in results.items():
+        print(
+            f"{name:<30} {stats['ops_per_sec']:>9.0f} {stats['p50_ms']:>9.2f} {stats['p95_ms']:>9.2f} "
+            f"{stats['loop_lag_max_ms']:>9.1f} {stats['errors']:>7}"
+        )
+        for message, count in stats["error_kinds"].items():
+            print(f"    {count} x {message}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+"""
+Pipeline micro-benchmarks
+Times the CPU-bound steps of quiz generation and the history query on checked-in Wikipedia-layout
+HTML fixtures of three sizes, fully offline
+
+Usage:
+    python -m benchmarks.bench_pipeline --iterations 10
+    python -m benchmarks.bench_pipeline --check          # fail on regressions against baseline.json
+    python -m benchmarks.bench_pipeline --save-baseline  # record this machine's numbers
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List
+
+from bs4 import BeautifulSoup
+from sqlalchemy import create_engine, select
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from sqlalchemy.orm import sessionmaker
+
+from benchmarks.fixtures import FIXTURES, load_fixture
+from benchmarks.reporting import DEFAULT_TOLERANCE, Results, calibrate, check_regressions, latency_summary, save_baseline
+from database import Base, Quiz, create_async_db_engine
+from models import QuizOutput
+from scraper import _clean_text, _extract_and_clean_content, _remove_unwanted_elements
+
+HISTORY_SIZES = (1000, 10000)
+CHECKED_METRICS = ("min_ms",)  # Best of N, as timeit reports: least affected by other load on the machine
+
+def sample_quiz(questions: int = 10) -> Dict[str, Any]:
+    """A typical LLM response: summary, entities, sections and 10 questions"""
+    return {
+        "summary": "The analytical engine was a proposed general-purpose mechanical computer. " * 3,
+        "key_entities": {
+            "people": ["Charles Babbage", "Ada Lovelace", "Luigi Menabrea"],
+            "organizations": ["Royal Society", "Science Museum"],
+            "locations": ["London", "Turin"],
+        },
+        "sections": ["Design", "Construction", "Instruction set", "Influence", "Modern reconstruction"],
+        "quiz": [
+            {
+                "question": f"Question {i} about the design of the analytical engine?",
+                "options": [f"Option {letter} for question {i}" for letter in "ABCD"],
+                "answer": f"Option B for question {i}",
+                "difficulty": ("easy", "medium", "hard")[i % 3],
+                "explanation": "The article describes this in the section on the engine's design. " * 2,
+            }
+            for i in range(questions)
+        ],
+        "related_topics": ["Difference engine", "Charles Babbage", "Turing completeness", "History of computing"],
+    }
+
+def time_calls(fn: Callable[[], Any], iterations: int, setup: Callable[[], Any] = None) -> List[float]:
+    """Wall-clock seconds per call; setup() runs untimed before each call and its result is passed in"""
+    samples = []
+    for _ in range(iterations + 1):  # The first call warms up
+        argument = setup() if setup else None
+        started = time.perf_counter()
+        fn(argument) if setup else fn()
+        samples.append(time.perf_counter() - started)
+    return samples[1:]
+
+def _raw_text(html: bytes) -> str:
+    """Article text as _clean_text receives it"""
+    soup = BeautifulSoup(html, "html.parser")
+    content = soup.select_one("#mw-content-text .mw-parser-output")
+    _remove_unwanted_elements(content)
+    return content.get_text()
+
+async def _history_samples(rows: int, iterations: int) -> List[float]:
+    """Time the /api/history query against a temporary database with the given number of quizzes"""
+    with tempfile.TemporaryDirectory() as tmp:
+        url = f"sqlite:///{os.path.join(tmp, 'history.db')}"
+        seed_engine = create_engine(url)
+        Base.metadata.create_all(seed_engine)
+        started = datetime(2024, 1, 1)
+        with sessionmaker(bind=seed_engine)() as session:
+            session.add_all(
+                Quiz(
+                    url=f"https://en.wikipedia.org/wiki/Article_{i}",
+                    title=f"Article {i}",
+                    full_quiz_data_legacy="{}",
+                    date_generated=started + timedelta(minutes=i)
+                )
+                for i in range(rows)
+            )
+            session.commit()
+        seed_engine.dispose()
+
+        async_engine = create_async_db_engine(url)
+        session_factory = async_sessionmaker(async_engine, expire_on_commit=False)
+        query = select(Quiz.id, Quiz.url, Quiz.title, Quiz.date_generated).order_by(Quiz.date_generated.desc())
+        samples = []
+        for _ in range(iterations + 1):
+            started_at = time.perf_counter()
+            async with session_factory() as session:
+                assert len((await session.execute(query)).all()) == rows
+            samples.append(time.perf_counter() - started_at)
+        await async_engine.dispose()
+        return samples[1:]
+
+def run(iterations: int = 10) -> Results:
+    """
+    Run every micro-benchmark.
+
+    Args:
+        iterations (int): Timed calls per benchmark (fast ones run 5-100x as many)
+
+    Returns:
+        Results: {benchmark: latency summary in milliseconds}
+    """
+    results: Results = {"calibration": calibrate()}
+    for name in FIXTURES:
+        html = load_fixture(name)
+        results[f"parse_{name}"] = latency_summary(time_calls(lambda: BeautifulSoup(html, "html.parser"), iterations))
+        # _extract_and_clean_content modifies the soup, so each call gets a freshly parsed one
+        results[f"extract_and_clean_{name}"] = latency_summary(
+            time_calls(_extract_and_clean_content, iterations, setup=lambda: BeautifulSoup(html, "html.parser"))
+        )
+        raw_text = _raw_text(html)
+        results[f"clean_text_{name}"] = latency_summary(time_calls(lambda: _clean_text(raw_text), iterations * 10))
+
+    quiz = sample_quiz()
+    quiz_json = json.dumps(quiz)
+    results["validate_quiz_dict"] = latency_summary(time_calls(lambda: QuizOutput(**quiz), iterations * 100))
+    results["validate_quiz_json"] = latency_summary(time_calls(lambda: QuizOutput.model_validate_json(quiz_json), iterations * 100))
+
+    loop = asyncio.new_event_loop()
+    try:
+        for rows in HISTORY_SIZES:
+            results[f"history_{rows}"] = latency_summary(loop.run_until_complete(_history_samples(rows, iterations * 5)))
+    finally:
+        loop.close()
+    return results
+
+def print_results(results: Results) -> None:
+    print(f"\n{'benchmark':<28} {'min ms':>10} {'mean ms':>10} {'p50 ms':>10} {'p95 ms':>10} {'p99 ms':>10}")
+    for name, summary in results.items():
+        if name == "calibration":
+            continue
+        print(
+            f"{name:<28} {summary['min_ms']:>10.3f} {summary['mean_ms']:>10.3f} {summary['p50_ms']:>10.3f} "
+            f"{summary['p95_ms']:>10.3f} {summary['p99_ms']:>10.3f}"
+        )
+    print(f"calibration workload: {results['calibration']['min_ms']:.1f} ms")
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Pipeline micro-benchmarks")
+    parser.add_argument("--iterations", type=int, default=10)
+    parser.add_argument("--check", action="store_true", help="Exit non-zero on regressions against baseline.json")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE)
+    parser.add_argument("--save-baseline", action="store_true", help="Store these results as the new baseline")
+    args = parser.parse_args()
+
+    results = run(args.iterations)
+    print_results(results)
+    if args.save_baseline:
+        save_baseline("micro", results)
+        print("\nBaseline saved")
+    if args.check:
+        regressions = check_regressions("micro", results, CHECKED_METRICS, args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        sys.exit(1 if regressions else 0)
+
+if __name__ == "__main__":
+    main()
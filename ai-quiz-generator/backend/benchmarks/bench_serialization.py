@@ -0,0 +1,108 @@
+"""
+Quiz response serialization benchmark
+Measures CPU per request for the generate and get-quiz response paths, before and after
+reusing the stored quiz JSON (validate once, splice the serialized bytes, orjson for the rest)
+
+Usage:
+    python -m benchmarks.bench_serialization --iterations 2000
+"""
+import argparse
+import asyncio
+import json
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict
+
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+
+from main import app
+from models import QuizOutput
+from responses import render_quiz
+
+def _large_quiz(questions: int = 10) -> Dict[str, Any]:
+    """A quiz at the top end of what the LLM returns: long text and many entities"""
+    sentence = "The article describes the historical development of the subject in considerable detail. "
+    return {
+        "summary": sentence * 12,
+        "key_entities": {
+            "people": [f"Person {i} of the article" for i in range(60)],
+            "organizations": [f"Organization {i} of the article" for i in range(60)],
+            "locations": [f"Location {i} of the article" for i in range(60)],
+        },
+        "sections": [f"Section {i}: a fairly long section heading" for i in range(40)],
+        "quiz": [
+            {
+                "question": f"Question {i}: " + sentence * 2,
+                "options": [f"Option {letter} " + sentence for letter in "ABCD"],
+                "answer": "Option B " + sentence,
+                "difficulty": ("easy", "medium", "hard")[i % 3],
+                "explanation": sentence * 8,
+            }
+            for i in range(questions)
+        ],
+        "related_topics": [f"Related topic {i}" for i in range(40)],
+    }
+
+def _response_field(path: str):
+    """The response_model field FastAPI validates the endpoint's return value against"""
+    return next(route for route in app.routes if getattr(route, "path", None) == path).response_field
+
+def bench(fn: Callable[[], Any], iterations: int) -> float:
+    """CPU microseconds per call"""
+    fn()  # Warm up
+    started = time.process_time()
+    for _ in range(iterations):
+        fn()
+    return 1e6 * (time.process_time() - started) / iterations
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Quiz response serialization benchmark")
+    parser.add_argument("--iterations", type=int, default=2000)
+    parser.add_argument("--questions", type=int, default=10)
+    args = parser.parse_args()
+
+    quiz_data = _large_quiz(args.questions)
+    stored_json = QuizOutput(**quiz_data).model_dump_json()
+    record = {"id": 1, "url": "https://en.wikipedia.org/wiki/Example", "title": "Example", "date_generated": datetime.utcnow()}
+    generate_field = _response_field("/api/generate-quiz")
+    get_field = _response_field("/api/quiz/{quiz_id}")
+    loop = asyncio.new_event_loop()
+
+    def fastapi_response(field, content: Dict[str, Any]) -> bytes:
+        """What FastAPI did with a returned dict: validate against response_model, encode, json.dumps"""
+        encoded = loop.run_until_complete(serialize_response(field=field, response_content=content))
+        return JSONResponse(encoded).body
+
+    def generate_before() -> bytes:
+        validated = QuizOutput(**quiz_data)
+        validated.model_dump_json()  # Stored
+        return fastapi_response(generate_field, {**record, **quiz_data})
+
+    def generate_after() -> bytes:
+        quiz_json = QuizOutput(**quiz_data).model_dump_json()  # Stored and returned
+        return render_quiz(record["id"], record["url"], record["title"], record["date_generated"], quiz_json)
+
+    def get_before() -> bytes:
+        data = json.loads(stored_json)
+        QuizOutput(**data)
+        return fastapi_response(get_field, {**record, "user_answers": None, **data})
+
+    def get_after() -> bytes:
+        QuizOutput.model_validate_json(stored_json)
+        return render_quiz(record["id"], record["url"], record["title"], record["date_generated"], stored_json)
+
+    # Same JSON either way (key order aside)
+    assert json.loads(generate_before()) == json.loads(generate_after())
+    assert json.loads(get_before()) == json.loads(get_after())
+
+    print(f"\nQuiz JSON {len(stored_json) / 1024:.0f} KB, {args.questions} questions, {args.iterations} iterations")
+    print(f"{'path':<16} {'before us':>10} {'after us':>10} {'saved us':>10} {'speedup':>8}")
+    for name, before, after in (("generate-quiz", generate_before, generate_after), ("get quiz", get_before, get_after)):
+        before_us = bench(before, args.iterations)
+        after_us = bench(after, args.iterations)
+        print(f"{name:<16} {before_us:>10.0f} {after_us:>10.0f} {before_us - after_us:>10.0f} {before_us / after_us:>7.1f}x")
+    loop.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,187 @@
+"""
+Answer submission throughput benchmark
+Compares per-request commits (the old endpoint) with cached answer keys and the write-behind buffer
+
+Usage:
+    python -m benchmarks.bench_submit_answers --clients 64 --duration 10
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import tempfile
+import time
+from typing import Awaitable, Callable, Dict, List
+
+from sqlalchemy import create_engine, select
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from sqlalchemy.orm import sessionmaker, undefer
+
+import analytics
+from database import Base, Quiz, create_async_db_engine
+from scoring import answer_keys, load_answer_key
+from write_behind import AnswerWriteBuffer, Submission, write_submissions
+
+SEED_QUIZZES = 200
+QUESTIONS = 10
+ARTICLE_CHARS = 60000  # Typical cleaned Wikipedia article
+
+def _seed(url: str) -> None:
+    """Create a database in the pre-compression layout (large text columns on every row)"""
+    seed_engine = create_engine(url)
+    Base.metadata.create_all(seed_engine)
+    article = ("Lorem ipsum dolor sit amet, consectetur adipiscing elit. " * (ARTICLE_CHARS // 57 + 1))[:ARTICLE_CHARS]
+    quiz_json = json.dumps({
+        "summary": "Summary",
+        "key_entities": {"people": [], "organizations": [], "locations": []},
+        "sections": ["Section"],
+        "quiz": [
+            {
+                "question": f"Question {i}?",
+                "options": ["A", "B", "C", "D"],
+                "answer": "B",
+                "difficulty": random.choice(["easy", "medium", "hard"]),
+                "explanation": "Explanation"
+            }
+            for i in range(QUESTIONS)
+        ],
+        "related_topics": []
+    })
+    with sessionmaker(bind=seed_engine)() as session:
+        session.add_all(
+            Quiz(url=f"https://en.wikipedia.org/wiki/A{i}", title=f"A{i}", scraped_content_legacy=article, full_quiz_data_legacy=quiz_json)
+            for i in range(SEED_QUIZZES)
+        )
+        session.commit()
+    seed_engine.dispose()
+
+def _answers() -> Dict[str, str]:
+    return {str(i): random.choice("ABCD") for i in range(QUESTIONS)}
+
+async def _drive(submit: Callable[[], Awaitable[None]], clients: int, duration: float) -> Dict[str, float]:
+    latencies: List[float] = []
+    errors: Dict[str, int] = {}
+    deadline = time.perf_counter() + duration
+
+    async def client() -> None:
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            try:
+                await submit()
+                latencies.append(time.perf_counter() - started)
+            except Exception as e:
+                message = str(e).split("\n")[0][:60]
+                errors[message] = errors.get(message, 0) + 1
+            # Yield like a real request would while its response is written
+            await asyncio.sleep(0)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(clients)))
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    return {
+        "submissions": len(latencies),
+        "per_sec": len(latencies) / elapsed,
+        "p50_ms": 1000 * statistics.median(latencies),
+        "p95_ms": 1000 * latencies[int(0.95 * (len(latencies) - 1))],
+        "errors": sum(errors.values()),
+        "error_kinds": errors,
+    }
+
+async def bench_per_request_commit(session_factory: Callable, clients: int, duration: float) -> Dict[str, float]:
+    """Before: load the full row (including the big text columns), overwrite user_answers, commit"""
+    async def submit() -> None:
+        async with session_factory() as session:
+            quiz = (await session.execute(
+                select(Quiz)
+                .options(undefer(Quiz.scraped_content_legacy), undefer(Quiz.full_quiz_data_legacy))
+                .where(Quiz.id == random.randint(1, SEED_QUIZZES))
+            )).scalar_one()
+            quiz.user_answers = json.dumps(_answers())
+            await session.commit()
+
+    return await _drive(submit, clients, duration)
+
+async def bench_sync_mode(session_factory: Callable, clients: int, duration: float) -> Dict[str, float]:
+    """ANSWER_WRITE_MODE=sync: cached answer key, server-side scoring, one commit per submission"""
+    async def submit() -> None:
+        async with session_factory() as session:
+            quiz_id = random.randint(1, SEED_QUIZZES)
+            answer_key = answer_keys.get(quiz_id) or await session.run_sync(load_answer_key, quiz_id)
+            answers = _answers()
+            await session.run_sync(write_submissions, [Submission(answer_key, answers, answer_key.grade(answers))])
+            await session.commit()
+
+    return await _drive(submit, clients, duration)
+
+async def bench_write_behind(session_factory: Callable, clients: int, duration: float) -> Dict[str, float]:
+    """ANSWER_WRITE_MODE=write_behind: submissions are batched into periodic bulk transactions"""
+    buffer = AnswerWriteBuffer(session_factory=session_factory)
+    await buffer.start()
+
+    async def submit() -> None:
+        quiz_id = random.randint(1, SEED_QUIZZES)
+        answer_key = answer_keys.get(quiz_id)
+        if answer_key is None:
+            async with session_factory() as session:
+                answer_key = await session.run_sync(load_answer_key, quiz_id)
+        answers = _answers()
+        await buffer.submit(Submission(answer_key, answers, answer_key.grade(answers)))
+
+    result = await _drive(submit, clients, duration)
+    flush_started = time.perf_counter()
+    await buffer.stop()
+    result["shutdown_flush_ms"] = 1000 * (time.perf_counter() - flush_started)
+    result["transactions"] = buffer.flushes
+    return result
+
+SCENARIOS = {
+    "per-request commit (before)": bench_per_request_commit,
+    "answer key + sync commit": bench_sync_mode,
+    "answer key + write-behind": bench_write_behind,
+}
+
+async def run(clients: int, duration: float) -> Dict[str, Dict[str, float]]:
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for index, (name, scenario) in enumerate(SCENARIOS.items()):
+            url = f"sqlite:///{os.path.join(tmp, f'submit_{index}.db')}"
+            _seed(url)
+            answer_keys.clear()
+            engine = create_async_db_engine(url)
+            session_factory = async_sessionmaker(engine, expire_on_commit=False)
+            try:
+                results[name] = await scenario(session_factory, clients, duration)
+                async with session_factory() as session:
+                    # Submissions counted by analytics - confirms the buffered writes were all persisted
+                    results[name]["recorded"] = await session.run_sync(
+                        lambda sync_session: analytics.get_stats(sync_session)["total_submissions"]
+                    )
+            finally:
+                await engine.dispose()
+    return results
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Answer submission throughput benchmark (SQLite)")
+    parser.add_argument("--clients", type=int, default=64, help="Concurrent clients")
+    parser.add_argument("--duration", type=float, default=5.0, help="Seconds per scenario")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args.clients, args.duration))
+
+    print(f"\n{args.clients} clients, {args.duration:.0f}s per scenario")
+    print(f"{'scenario':<30} {'subs/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'errors':>7} {'recorded':>9}")
+    for name, stats in results.items():
+        print(
+            f"{name:<30} {stats['per_sec']:>9.0f} {stats['p50_ms']:>9.2f} {stats['p95_ms']:>9.2f} "
+            f"{stats['errors']:>7} {stats['recorded']:>9}"
+        )
+        for message, count in stats["error_kinds"].items():
+            print(f"    {count} x {message}")
+    write_behind = results["answer key + write-behind"]
+    print(f"\nwrite-behind: {write_behind['transactions']} transactions, final flush {write_behind['shutdown_flush_ms']:.0f} ms")
+
+if __name__ == "__main__":
+    main()
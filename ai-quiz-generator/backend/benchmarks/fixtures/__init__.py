@@ -0,0 +1,14 @@
+"""
+Benchmark fixtures
+Synthetic pages in the markup layout of Wikipedia articles (infobox, hatnotes, TOC, references,
+tables, navboxes) in three sizes: small (47 KB), medium (150 KB) and large (560 KB)
+"""
+import os
+
+FIXTURES_DIR = os.path.dirname(__file__)
+FIXTURES = ("small", "medium", "large")
+
+def load_fixture(name: str) -> bytes:
+    """Raw HTML of article_<name>.html"""
+    with open(os.path.join(FIXTURES_DIR, f"article_{name}.html"), "rb") as f:
+        return f.read()
@@ -0,0 +1,303 @@
+"""
+End-to-end load generator
+Drives the FastAPI app in-process with a mix of generate, read, search and submit requests, fully
+offline: the real scraper fetches pages from a local fake Wikipedia (reached through HTTP_PROXY) and
+Gemini is replaced by a stub model with configurable latency
+
+Usage:
+    python -m benchmarks.load_test --concurrency 4 --duration 20
+    python -m benchmarks.load_test --check          # fail on regressions against baseline.json
+    python -m benchmarks.load_test --save-baseline  # record this machine's numbers
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import re
+import sys
+import tempfile
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+import httpx
+from aiohttp import web
+
+from benchmarks.fixtures import FIXTURES, load_fixture
+from benchmarks.reporting import DEFAULT_TOLERANCE, Results, calibrate, check_regressions, latency_summary, save_baseline
+
+# Request mix (weights) - reads dominate, as in real use
+OPERATIONS = {"generate": 1, "get_quiz": 4, "history": 1, "search": 2, "submit": 3}
+FIXTURE_WEIGHTS = (3, 6, 1)  # small / medium / large articles served by the fake Wikipedia
+# Compared against the baseline; per-operation tails are too noisy for a pass/fail check
+CHECKED_OPERATIONS = ("total", "generate")
+CHECKED_METRICS = ("requests_per_sec", "p95_ms")
+LAG_PROBE_INTERVAL = 0.05  # Seconds between event loop lag probes
+SEARCH_TERMS = ("engine", "Babbage", "design", "history", "computing", "Lovelace", "London")
+SEED_BATCH = 4  # Seed quizzes generated at once
+
+def _client_headers(user: int) -> Dict[str, str]:
+    """Give each virtual user its own client address"""
+    return {"X-Forwarded-For": f"10.0.{user // 256}.{user % 256}"}
+
+class FakeWikipedia:
+    """Serves the HTML fixtures for any /wiki/<title> on its own thread and event loop"""
+
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.pages = [(load_fixture(name).decode("utf-8"), weight) for name, weight in zip(FIXTURES, FIXTURE_WEIGHTS)]
+        self.requests = 0
+        self.port: Optional[int] = None
+
+    async def _page(self, request: web.Request) -> web.Response:
+        self.requests += 1
+        title = request.match_info["title"]
+        page, _ = random.Random(title).choices(self.pages, weights=[weight for _, weight in self.pages])[0]
+        fixture_title = re.search(r'<span class="mw-page-title-main">(.*?)</span>', page).group(1)
+        await asyncio.sleep(self.latency)
+        return web.Response(text=page.replace(fixture_title, title.replace("_", " ")), content_type="text/html")
+
+    def start(self) -> None:
+        ready = threading.Event()
+
+        def serve() -> None:
+            loop = asyncio.new_event_loop()
+            app = web.Application()
+            app.router.add_get("/wiki/{title}", self._page)
+            runner = web.AppRunner(app, access_log=None)
+            loop.run_until_complete(runner.setup())
+            site = web.TCPSite(runner, "127.0.0.1", 0)
+            loop.run_until_complete(site.start())
+            self.port = site._server.sockets[0].getsockname()[1]
+            ready.set()
+            loop.run_forever()
+
+        threading.Thread(target=serve, name="fake-wikipedia", daemon=True).start()
+        ready.wait()
+
+class StubModel:
+    """Stands in for ChatGoogleGenerativeAI: sleeps like a network call and returns quiz JSON"""
+
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.calls = 0
+
+    def invoke(self, prompt, **kwargs):
+        self.calls += 1
+        time.sleep(self.latency)
+        if not isinstance(prompt, str):
+            prompt = "\n".join(message.content for message in prompt)
+        match = re.search(r"ARTICLE TITLE: (.*)", prompt)
+        title = match.group(1) if match else "Connection test"
+        quiz = {
+            "summary": f"{title} is a topic covered in a long encyclopedia article.",
+            "key_entities": {"people": ["Charles Babbage", "Ada Lovelace"], "organizations": ["Royal Society"], "locations": ["London"]},
+            "sections": ["Design", "History", "Legacy"],
+            "quiz": [
+                {
+                    "question": f"Question {i} about {title}?",
+                    "options": [f"Option {letter}" for letter in "ABCD"],
+                    "answer": "Option B",
+                    "difficulty": ("easy", "medium", "hard")[i % 3],
+                    "explanation": f"The article on {title} says so.",
+                }
+                for i in range(8)
+            ],
+            "related_topics": ["History of computing", "Difference engine"],
+        }
+        return _StubResponse(json.dumps(quiz), len(prompt) // 4)
+
+class _StubResponse:
+    def __init__(self, content: str, prompt_tokens: int):
+        self.content = content
+        self.usage_metadata = {"input_tokens": prompt_tokens, "output_tokens": len(content) // 4, "total_tokens": prompt_tokens + len(content) // 4}
+
+def _configure_environment(tmp: str, wikipedia: FakeWikipedia, shared_cache: bool) -> None:
+    """Point the app at a scratch database and the fake services (before main is imported)"""
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tmp, 'load_test.db')}"
+    os.environ["GEMINI_API_KEY"] = "offline-load-test"
+    os.environ["HTTP_PROXY"] = f"http://127.0.0.1:{wikipedia.port}"
+    os.environ["SHARED_CACHE_ENABLED"] = "true" if shared_cache else "false"
+    os.environ["SHARED_CACHE_PATH"] = os.path.join(tmp, "shared_cache.db")
+    os.environ["PROFILE_SAMPLE_RATE"] = "0"
+    os.environ.pop("ADMIN_TOKEN", None)
+    # Each virtual user is its own client for admission control's per-client limits
+    os.environ["TRUST_FORWARDED_FOR"] = "true"
+
+class LoadRun:
+    """Closed-loop virtual users issuing the request mix against the app"""
+
+    def __init__(self, client: httpx.AsyncClient, duration: float):
+        self.client = client
+        self.duration = duration
+        self.samples: Dict[str, List[float]] = {name: [] for name in OPERATIONS}
+        self.errors: Dict[str, int] = {name: 0 for name in OPERATIONS}
+        self.rejected: Dict[str, int] = {name: 0 for name in OPERATIONS}  # Shed by admission control (429/503)
+        self.quiz_ids: List[int] = []
+        self.loop_lag: List[float] = []
+        self._articles = 0
+
+    async def generate(self, user: int = 0) -> httpx.Response:
+        self._articles += 1
+        # http:// so requests routes the fetch through HTTP_PROXY to the fake Wikipedia
+        url = f"http://en.wikipedia.org/wiki/Load_test_article_{self._articles}"
+        response = await self.client.post("/api/generate-quiz", json={"url": url}, headers=_client_headers(user))
+        if response.status_code == 200:
+            self.quiz_ids.append(response.json()["id"])
+        return response
+
+    async def get_quiz(self, user: int = 0) -> httpx.Response:
+        return await self.client.get(f"/api/quiz/{random.choice(self.quiz_ids)}", headers=_client_headers(user))
+
+    async def history(self, user: int = 0) -> httpx.Response:
+        return await self.client.get("/api/history", headers=_client_headers(user))
+
+    async def search(self, user: int = 0) -> httpx.Response:
+        return await self.client.get("/api/search", params={"q": random.choice(SEARCH_TERMS)}, headers=_client_headers(user))
+
+    async def submit(self, user: int = 0) -> httpx.Response:
+        answers = {str(i): random.choice(("Option A", "Option B")) for i in range(8)}
+        return await self.client.post(
+            "/api/submit-answers", json={"quiz_id": random.choice(self.quiz_ids), "answers": answers}, headers=_client_headers(user)
+        )
+
+    async def _user(self, user: int, deadline: float) -> None:
+        names = list(OPERATIONS)
+        weights = list(OPERATIONS.values())
+        while time.perf_counter() < deadline:
+            name = random.choices(names, weights)[0]
+            started = time.perf_counter()
+            try:
+                response = await getattr(self, name)(user)
+                status = response.status_code
+            except Exception:
+                status = 0
+            if status in (429, 503):
+                # Shed load: counted apart, and the user backs off as a client honoring Retry-After would
+                self.rejected[name] += 1
+                await asyncio.sleep(min(float(response.headers.get("retry-after", 1)), max(0.0, deadline - time.perf_counter())))
+                continue
+            self.samples[name].append(time.perf_counter() - started)
+            if not 200 <= status < 400:
+                self.errors[name] += 1
+
+    async def _probe_loop_lag(self, deadline: float) -> None:
+        """How late a sleeping task wakes up: time the app's coroutines wait for the event loop"""
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            await asyncio.sleep(LAG_PROBE_INTERVAL)
+            self.loop_lag.append(time.perf_counter() - started - LAG_PROBE_INTERVAL)
+
+    async def run(self, concurrency: int) -> float:
+        started = time.perf_counter()
+        deadline = started + self.duration
+        await asyncio.gather(self._probe_loop_lag(deadline), *(self._user(user, deadline) for user in range(concurrency)))
+        return time.perf_counter() - started
+
+def summarize(run: LoadRun, elapsed: float) -> Results:
+    results: Results = {}
+    everything: List[float] = []
+    for name, samples in run.samples.items():
+        everything.extend(samples)
+        results[name] = {
+            "requests": len(samples),
+            "errors": run.errors[name],
+            "rejected": run.rejected[name],
+            "requests_per_sec": len(samples) / elapsed,
+            **latency_summary(samples),
+        }
+    results["total"] = {
+        "requests": len(everything),
+        "errors": sum(run.errors.values()),
+        "rejected": sum(run.rejected.values()),
+        "requests_per_sec": len(everything) / elapsed,
+        **latency_summary(everything),
+    }
+    results["loop_lag"] = latency_summary(run.loop_lag)
+    return results
+
+async def run_load(concurrency: int, duration: float, seed_quizzes: int, llm_latency: float, fetch_latency: float, shared_cache: bool = False) -> Tuple[Results, Dict[str, int]]:
+    """
+    Start the fake services and the app, seed some quizzes, then run the request mix.
+
+    Returns:
+        Tuple[Results, Dict[str, int]]: Per-operation results and counters (LLM calls, page fetches)
+    """
+    if "database" in sys.modules:
+        # The engine is created at import time, so it would already point at the real DATABASE_URL
+        raise RuntimeError("run_load must run in a fresh process, before the app modules are imported")
+    wikipedia = FakeWikipedia(fetch_latency)
+    wikipedia.start()
+    with tempfile.TemporaryDirectory() as tmp:
+        _configure_environment(tmp, wikipedia, shared_cache)
+        import llm_quiz_generator
+        import main
+
+        # A QuizGenerator with the stub in place of the Gemini client, so prompt building,
+        # response parsing and metrics run as in production
+        model = StubModel(llm_latency)
+        generator = llm_quiz_generator.QuizGenerator.__new__(llm_quiz_generator.QuizGenerator)
+        generator.api_key = os.environ["GEMINI_API_KEY"]
+        generator.model = model
+        llm_quiz_generator.quiz_generator = generator
+
+        transport = httpx.ASGITransport(app=main.app)
+        async with main.app.router.lifespan_context(main.app):
+            async with httpx.AsyncClient(transport=transport, base_url="http://load-test", trust_env=False, timeout=120) as client:
+                load = LoadRun(client, duration)
+                # In rounds of distinct clients, within admission control's limits
+                for first in range(0, seed_quizzes, SEED_BATCH):
+                    await asyncio.gather(*(load.generate(user) for user in range(first, min(first + SEED_BATCH, seed_quizzes))))
+                if not load.quiz_ids:
+                    raise RuntimeError("Seeding failed: no quiz could be generated")
+                load.samples["generate"].clear()
+                elapsed = await load.run(concurrency)
+        return summarize(load, elapsed), {"llm_calls": model.calls, "page_fetches": wikipedia.requests}
+
+def print_results(results: Results, counters: Dict[str, int], concurrency: int, duration: float) -> None:
+    print(f"\n{concurrency} users, {duration:.0f}s, LLM calls {counters['llm_calls']}, page fetches {counters['page_fetches']}")
+    print(f"{'operation':<10} {'requests':>9} {'errors':>7} {'shed':>7} {'req/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for name, summary in results.items():
+        if name in ("loop_lag", "calibration"):
+            continue
+        print(
+            f"{name:<10} {summary['requests']:>9.0f} {summary['errors']:>7.0f} {summary['rejected']:>7.0f} {summary['requests_per_sec']:>9.1f} "
+            f"{summary['p50_ms']:>9.1f} {summary['p95_ms']:>9.1f} {summary['p99_ms']:>9.1f}"
+        )
+    lag = results["loop_lag"]
+    print(f"event loop lag: p50 {lag['p50_ms']:.1f} ms, p95 {lag['p95_ms']:.1f} ms, p99 {lag['p99_ms']:.1f} ms")
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Offline end-to-end load test")
+    parser.add_argument("--concurrency", type=int, default=4, help="Virtual users")
+    parser.add_argument("--duration", type=float, default=20.0, help="Seconds of load after seeding")
+    parser.add_argument("--seed-quizzes", type=int, default=20, help="Quizzes generated before the timed run")
+    parser.add_argument("--llm-latency", type=float, default=0.5, help="Seconds per stubbed LLM call")
+    parser.add_argument("--fetch-latency", type=float, default=0.05, help="Seconds per fake Wikipedia response")
+    parser.add_argument("--shared-cache", action="store_true", help="Run with the shared cache enabled")
+    parser.add_argument("--check", action="store_true", help="Exit non-zero on regressions against baseline.json")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE)
+    parser.add_argument("--save-baseline", action="store_true", help="Store these results as the new baseline")
+    args = parser.parse_args()
+
+    calibration = calibrate()
+    results, counters = asyncio.run(run_load(args.concurrency, args.duration, args.seed_quizzes, args.llm_latency, args.fetch_latency, args.shared_cache))
+    results["calibration"] = calibration
+    print_results(results, counters, args.concurrency, args.duration)
+    failed = results["total"]["errors"] > 0
+    if failed:
+        print("\nERRORS: some requests failed (see the errors column)")
+    if args.save_baseline and not failed:
+        save_baseline("load", results)
+        print("\nBaseline saved")
+    if args.check:
+        checked = {name: results[name] for name in ("calibration",) + CHECKED_OPERATIONS}
+        regressions = check_regressions("load", checked, CHECKED_METRICS, args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        failed = failed or bool(regressions)
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
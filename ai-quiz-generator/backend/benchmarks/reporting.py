@@ -0,0 +1,97 @@
+"""
+Benchmark reporting
+Percentile summaries and comparison against the stored baseline (benchmarks/baseline.json)
+"""
+import json
+import os
+import re
+import time
+from typing import Dict, List, Sequence
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), "baseline.json")
+DEFAULT_TOLERANCE = 0.5  # Allowed slowdown before a result counts as a regression (run-to-run noise is ~25%)
+
+# Metric naming convention: "*_ms" are latencies (lower is better), "*_per_sec" are rates (higher is better)
+Results = Dict[str, Dict[str, float]]
+
+def percentile(samples: Sequence[float], fraction: float) -> float:
+    """Nearest-rank percentile of unsorted samples (0.0 if empty)"""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, max(0, round(fraction * len(ordered)) - 1))]
+
+def latency_summary(seconds: Sequence[float]) -> Dict[str, float]:
+    """min, mean and p50/p95/p99 in milliseconds"""
+    return {
+        "min_ms": 1000 * min(seconds, default=0.0),
+        "mean_ms": 1000 * sum(seconds) / len(seconds) if seconds else 0.0,
+        "p50_ms": 1000 * percentile(seconds, 0.50),
+        "p95_ms": 1000 * percentile(seconds, 0.95),
+        "p99_ms": 1000 * percentile(seconds, 0.99),
+    }
+
+def calibrate(rounds: int = 5) -> Dict[str, float]:
+    """
+    Time a fixed workload (regex and string handling, like the scraper's) on this machine right now.
+
+    Stored with every result set as "calibration"; check_regressions scales the baseline by the
+    ratio, so a slower machine, or a busier moment on a shared one, is not reported as a regression.
+    """
+    text = "Lorem [1] ipsum  dolor [citation needed] sit amet, consectetur adipiscing elit. " * 2000
+    samples = []
+    for _ in range(rounds):
+        started = time.perf_counter()
+        for _ in range(5):
+            cleaned = re.sub(r"\s{2,}", " ", re.sub(r"\[\d+\]", "", text))
+            sorted(cleaned.split())
+        samples.append(time.perf_counter() - started)
+    return {"min_ms": 1000 * min(samples)}
+
+def load_baseline(path: str = BASELINE_PATH) -> Dict[str, Results]:
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+def save_baseline(section: str, results: Results, path: str = BASELINE_PATH) -> None:
+    """Replace one section (e.g. "micro" or "load") of the baseline file"""
+    baseline = load_baseline(path)
+    baseline[section] = results
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(baseline, f, indent=2, sort_keys=True)
+        f.write("\n")
+
+def check_regressions(section: str, results: Results, metrics: Sequence[str], tolerance: float = DEFAULT_TOLERANCE, path: str = BASELINE_PATH) -> List[str]:
+    """
+    Compare results with the stored baseline, scaled by the calibration ratio when both have one.
+
+    Args:
+        section (str): Baseline section ("micro" or "load")
+        results (Results): {benchmark: {metric: value}}
+        metrics (Sequence[str]): Metrics to compare (others are informational)
+        tolerance (float): Allowed relative slowdown, e.g. 0.25 for 25%
+
+    Returns:
+        List[str]: One message per regression (empty if none, or if there is no baseline)
+    """
+    baseline = load_baseline(path).get(section, {})
+    speed = 1.0  # >1: this run's machine is slower than the baseline's
+    if results.get("calibration") and baseline.get("calibration"):
+        speed = results["calibration"]["min_ms"] / baseline["calibration"]["min_ms"]
+    regressions = []
+    for name, values in results.items():
+        if name == "calibration":
+            continue
+        for metric in metrics:
+            expected = baseline.get(name, {}).get(metric)
+            actual = values.get(metric)
+            if not expected or actual is None:
+                continue
+            expected = expected / speed if metric.endswith("_per_sec") else expected * speed
+            if metric.endswith("_per_sec"):
+                if actual < expected * (1 - tolerance):
+                    regressions.append(f"{section}/{name} {metric}: {actual:.1f} < baseline {expected:.1f}")
+            elif actual > expected * (1 + tolerance):
+                regressions.append(f"{section}/{name} {metric}: {actual:.2f} > baseline {expected:.2f}")
+    return regressions
@@ -0,0 +1,140 @@
+"""
+Shared cache multi-process stress test
+Hammers one SharedCache file from several processes and checks that:
+  - every read returns a complete value written for that key (no torn or mixed-up writes)
+  - size accounting matches the stored entries and stays within max_bytes under eviction
+  - get_or_compute runs the computation once per key across all processes (single-flight)
+
+Usage:
+    python -m benchmarks.stress_shared_cache --processes 8 --duration 10
+"""
+import argparse
+import hashlib
+import multiprocessing
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from typing import Dict
+
+from shared_cache import SharedCache
+
+KEYS = 500
+
+def _value(key: str, version: int, size: int) -> Dict[str, object]:
+    """A value that can be verified on its own: it names its key and carries a checksum"""
+    payload = os.urandom(size // 2).hex()  # Incompressible, so eviction is exercised
+    return {"key": key, "version": version, "payload": payload, "sha256": hashlib.sha256(payload.encode()).hexdigest()}
+
+def _check(key: str, value: Dict[str, object]) -> bool:
+    return value["key"] == key and hashlib.sha256(value["payload"].encode()).hexdigest() == value["sha256"]
+
+def _hammer(path: str, max_bytes: int, duration: float, seed: int, results) -> None:
+    """Random mix of reads, writes (small and large, so some are compressed) and deletes"""
+    random.seed(seed)
+    cache = SharedCache(path, max_bytes)
+    counts = {"reads": 0, "hits": 0, "writes": 0, "deletes": 0, "corrupt": 0, "errors": 0}
+    deadline = time.time() + duration
+    while time.time() < deadline:
+        key = f"key-{random.randrange(KEYS)}"
+        action = random.random()
+        try:
+            if action < 0.6:
+                value = cache.get(key)
+                counts["reads"] += 1
+                if value is not None:
+                    counts["hits"] += 1
+                    if not _check(key, value):
+                        counts["corrupt"] += 1
+            elif action < 0.95:
+                cache.set(key, _value(key, random.randrange(1 << 30), random.choice((200, 5000, 40000))), ttl=random.choice((None, 0.5, 30)))
+                counts["writes"] += 1
+            else:
+                cache.delete(key)
+                counts["deletes"] += 1
+        except sqlite3.Error as e:
+            counts["errors"] += 1
+            print(f"[{os.getpid()}] {e}", file=sys.stderr)
+    results.put(counts)
+
+def _single_flight(path: str, keys: int, start, computations) -> None:
+    """Every process asks for the same keys at the same moment; each must be computed once"""
+    cache = SharedCache(path)
+    start.wait()
+    for i in range(keys):
+        def compute(i=i):
+            with computations.get_lock():
+                computations.value += 1
+            time.sleep(0.05)  # A slow scrape/LLM call
+            return {"key": i}
+        value, _ = cache.get_or_compute(f"flight-{i}", compute, ttl=60)
+        assert value == {"key": i}
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Shared cache multi-process stress test")
+    parser.add_argument("--processes", type=int, default=8)
+    parser.add_argument("--duration", type=float, default=5.0)
+    parser.add_argument("--max-mb", type=float, default=2.0, help="Cache size (small, to force eviction)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "shared_cache.db")
+        max_bytes = int(args.max_mb * 1024 * 1024)
+        context = multiprocessing.get_context("spawn")  # Like separate uvicorn workers
+
+        results = context.Queue()
+        workers = [
+            context.Process(target=_hammer, args=(path, max_bytes, args.duration, seed, results))
+            for seed in range(args.processes)
+        ]
+        started = time.perf_counter()
+        for worker in workers:
+            worker.start()
+        totals: Dict[str, int] = {}
+        for _ in workers:
+            for name, count in results.get().items():
+                totals[name] = totals.get(name, 0) + count
+        for worker in workers:
+            worker.join()
+        elapsed = time.perf_counter() - started
+
+        connection = sqlite3.connect(path)
+        stored = connection.execute("SELECT COALESCE(SUM(size), 0), COUNT(*) FROM entries").fetchone()
+        accounted = connection.execute("SELECT total_bytes FROM usage").fetchone()[0]
+        connection.close()
+
+        computations = context.Value("i", 0)
+        start = context.Event()
+        flight_keys = 10
+        flights = [context.Process(target=_single_flight, args=(path, flight_keys, start, computations)) for _ in range(args.processes)]
+        for flight in flights:
+            flight.start()
+        time.sleep(1.0)  # Let every process import and block on the start event
+        start.set()
+        for flight in flights:
+            flight.join()
+
+    operations = totals["reads"] + totals["writes"] + totals["deletes"]
+    print(f"\n{args.processes} processes, {args.duration:.0f}s, cache limit {args.max_mb:.1f} MB")
+    print(f"operations:        {operations} ({operations / elapsed:.0f}/s), hit rate {totals['hits'] / max(totals['reads'], 1):.0%}")
+    print(f"corrupt reads:     {totals['corrupt']}")
+    print(f"sqlite errors:     {totals['errors']}")
+    print(f"size accounting:   {accounted} bytes recorded, {stored[0]} bytes in {stored[1]} entries (limit {max_bytes})")
+    print(f"single-flight:     {computations.value} computations for {flight_keys} keys across {args.processes} processes")
+
+    failures = []
+    if totals["corrupt"]:
+        failures.append("corrupt reads")
+    if totals["errors"]:
+        failures.append("sqlite errors")
+    if accounted != stored[0] or accounted > max_bytes:
+        failures.append("size accounting")
+    if computations.value != flight_keys or any(flight.exitcode for flight in flights):
+        failures.append("single-flight")
+    print("FAILED: " + ", ".join(failures) if failures else "OK")
+    sys.exit(1 if failures else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,390 @@
+"""
+Offline bulk quiz generation
+Generates quizzes for a list of Wikipedia URLs as a pipeline: concurrent fetches, parsing in a
+process pool, a capped number of LLM calls and batched database writes, with a resumable checkpoint
+"""
+import argparse
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import re
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, Iterable, List, Optional, Set, TextIO
+
+import aiohttp
+from pydantic import ValidationError
+from sqlalchemy import select
+
+from content_store import load_dictionaries
+from database import Quiz, SessionLocal, create_tables
+from llm_quiz_generator import get_quiz_generator
+from models import QuizOutput
+from persistence import NewQuiz, save_quizzes
+from scraper import REQUEST_HEADERS, REQUEST_TIMEOUT, _is_valid_wikipedia_url, parse_article
+from search_index import ensure_search_index
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+BULK_FETCH_CONCURRENCY = int(os.getenv("BULK_FETCH_CONCURRENCY", "8"))        # Simultaneous page downloads
+BULK_PARSE_WORKERS = int(os.getenv("BULK_PARSE_WORKERS", str(os.cpu_count() or 2)))  # Parser processes
+BULK_LLM_CONCURRENCY = int(os.getenv("BULK_LLM_CONCURRENCY", "4"))            # Simultaneous Gemini calls
+BULK_BATCH_SIZE = int(os.getenv("BULK_BATCH_SIZE", "25"))                     # Quizzes per insert transaction
+BULK_FLUSH_INTERVAL = 5.0        # Seconds a partial batch may wait before it is written anyway
+FETCH_RETRIES = 2                # Extra attempts for timeouts, 429 and 5xx responses
+FETCH_RETRY_BACKOFF = 2.0        # Seconds, doubled per attempt
+
+STAGES = ("fetch", "parse", "llm", "validate", "write")
+URL_PATTERN = re.compile(r"https?://\S+")
+
+class StageStats:
+    """Latency samples and counts for one pipeline stage"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.latencies: List[float] = []
+        self.items = 0
+        self.errors = 0
+        self.first_start: Optional[float] = None
+        self.last_end: Optional[float] = None
+
+    def record(self, started: float, items: int = 1) -> None:
+        """Record one completed call that began at started (time.perf_counter())"""
+        now = time.perf_counter()
+        self.latencies.append(now - started)
+        self.items += items
+        self.first_start = started if self.first_start is None else min(self.first_start, started)
+        self.last_end = now
+
+    def percentile(self, fraction: float) -> float:
+        ordered = sorted(self.latencies)
+        return ordered[round(fraction * (len(ordered) - 1))] if ordered else 0.0
+
+    @property
+    def throughput(self) -> float:
+        """Items per second while the stage was active"""
+        if self.first_start is None or self.last_end <= self.first_start:
+            return 0.0
+        return self.items / (self.last_end - self.first_start)
+
+    def row(self) -> str:
+        return (
+            f"{self.name:<10} {self.items:>7} {self.errors:>7} {self.throughput:>9.2f} "
+            f"{1000 * self.percentile(0.5):>9.0f} {1000 * self.percentile(0.95):>9.0f} {1000 * max(self.latencies, default=0):>9.0f}"
+        )
+
+class StageError(Exception):
+    """A URL failed in a pipeline stage"""
+
+    def __init__(self, stage: str, message: str):
+        super().__init__(message)
+        self.stage = stage
+
+class Checkpoint:
+    """
+    Append-only NDJSON record of finished URLs.
+
+    A URL is recorded as done only after its quiz is committed, so an interrupted run
+    loses at most the uncommitted batch, which the next run regenerates. Failures are
+    recorded from the event loop and completions from the writer thread, so writes are
+    serialized with a lock to keep lines whole.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.done: Set[str] = set()
+        self.failed: Dict[str, str] = {}
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue  # Torn last line from a crash
+                    if entry.get("status") == "done":
+                        self.done.add(entry["url"])
+                        self.failed.pop(entry["url"], None)
+                    else:
+                        self.failed[entry["url"]] = entry.get("error", "")
+        self._file: TextIO = open(path, "a", encoding="utf-8")
+        self._lock = threading.Lock()
+
+    def record(self, entries: Iterable[Dict]) -> None:
+        lines = "".join(json.dumps(entry) + "\n" for entry in entries)
+        with self._lock:
+            self._file.write(lines)
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    def close(self) -> None:
+        with self._lock:
+            self._file.close()
+
+def read_urls(lines: Iterable[str]) -> List[str]:
+    """
+    Collect Wikipedia URLs from text, one or more per line.
+
+    Anything that is not a URL (comments, numbering, notes) is ignored, so annotated lists
+    like sample_data/test_urls.txt work as-is. Duplicates keep their first position.
+    """
+    urls: Dict[str, None] = {}
+    for line in lines:
+        if line.lstrip().startswith("#"):
+            continue
+        for url in URL_PATTERN.findall(line):
+            url = url.rstrip(".,;\"'>")
+            # Drop a closing parenthesis that belongs to the surrounding text, not the title
+            if url.endswith(")") and url.count(")") > url.count("("):
+                url = url[:-1]
+            urls.setdefault(url, None)
+    return list(urls)
+
+class BulkGenerator:
+    """Runs the fetch -> parse -> llm -> validate -> write pipeline over a list of URLs"""
+
+    def __init__(
+        self,
+        checkpoint: Checkpoint,
+        fetch_concurrency: int = BULK_FETCH_CONCURRENCY,
+        parse_workers: int = BULK_PARSE_WORKERS,
+        llm_concurrency: int = BULK_LLM_CONCURRENCY,
+        batch_size: int = BULK_BATCH_SIZE
+    ):
+        self.checkpoint = checkpoint
+        self.fetch_concurrency = fetch_concurrency
+        self.parse_workers = parse_workers
+        self.llm_concurrency = llm_concurrency
+        self.batch_size = batch_size
+        self.stats = {name: StageStats(name) for name in STAGES}
+        self.saved = 0
+        self.failed = 0
+
+    async def run(self, urls: List[str]) -> None:
+        """Process all URLs; returns once every quiz is written or recorded as failed"""
+        self._fetch_slots = asyncio.Semaphore(self.fetch_concurrency)
+        self._parse_slots = asyncio.Semaphore(self.parse_workers)
+        self._llm_slots = asyncio.Semaphore(self.llm_concurrency)
+        # Bounds the articles held in memory: fetching stays just far enough ahead of the LLM
+        in_flight = asyncio.Semaphore(self.fetch_concurrency + self.parse_workers + 2 * self.llm_concurrency)
+        self._results: asyncio.Queue = asyncio.Queue()
+
+        # spawn: the event loop and executor threads are running, which fork does not handle safely
+        self._parser_pool = ProcessPoolExecutor(self.parse_workers, mp_context=multiprocessing.get_context("spawn"))
+        self._llm_pool = ThreadPoolExecutor(self.llm_concurrency, thread_name_prefix="llm")
+        writer = asyncio.create_task(self._write_results())
+        try:
+            timeout = aiohttp.ClientTimeout(total=REQUEST_TIMEOUT * 3, sock_read=REQUEST_TIMEOUT)
+            connector = aiohttp.TCPConnector(limit=self.fetch_concurrency)
+            async with aiohttp.ClientSession(headers=REQUEST_HEADERS, timeout=timeout, connector=connector) as http:
+                tasks = []
+                for url in urls:
+                    await in_flight.acquire()
+                    task = asyncio.create_task(self._process(http, url))
+                    task.add_done_callback(lambda _: in_flight.release())
+                    tasks.append(task)
+                await asyncio.gather(*tasks)
+            await self._results.put(None)
+            await writer
+        finally:
+            writer.cancel()
+            self._parser_pool.shutdown(cancel_futures=True)
+            self._llm_pool.shutdown(wait=False, cancel_futures=True)
+
+    async def _process(self, http: aiohttp.ClientSession, url: str) -> None:
+        """Take one URL through every stage up to the write queue"""
+        loop = asyncio.get_running_loop()
+        try:
+            if not _is_valid_wikipedia_url(url):
+                raise StageError("fetch", "Invalid Wikipedia URL provided")
+            html = await self._fetch(http, url)
+
+            async with self._parse_slots:
+                started = time.perf_counter()
+                try:
+                    clean_text, title = await loop.run_in_executor(self._parser_pool, parse_article, html)
+                except BrokenProcessPool:
+                    raise  # Not the article's fault: stop instead of marking every URL failed
+                except Exception as e:
+                    raise StageError("parse", str(e))
+                self.stats["parse"].record(started)
+            del html
+
+            async with self._llm_slots:
+                started = time.perf_counter()
+                try:
+                    quiz_data = await loop.run_in_executor(self._llm_pool, get_quiz_generator().generate_quiz, clean_text, title)
+                except Exception as e:
+                    raise StageError("llm", str(e))
+                self.stats["llm"].record(started)
+
+            started = time.perf_counter()
+            try:
+                quiz = QuizOutput(**quiz_data)
+            except (ValidationError, TypeError) as e:
+                raise StageError("validate", str(e).splitlines()[0])
+            self.stats["validate"].record(started)
+
+            await self._results.put(NewQuiz(url, title, clean_text, quiz))
+        except StageError as e:
+            self.stats[e.stage].errors += 1
+            self.failed += 1
+            logger.warning(f"{e.stage} failed for {url}: {e}")
+            self.checkpoint.record([{"url": url, "status": "failed", "stage": e.stage, "error": str(e)}])
+
+    async def _fetch(self, http: aiohttp.ClientSession, url: str) -> bytes:
+        """Download a page, retrying timeouts, 429 and 5xx responses with backoff"""
+        for attempt in range(FETCH_RETRIES + 1):
+            async with self._fetch_slots:
+                started = time.perf_counter()
+                try:
+                    async with http.get(url) as response:
+                        if response.status == 429 or response.status >= 500:
+                            error = f"HTTP {response.status}"
+                        elif response.status >= 400:
+                            raise StageError("fetch", f"Failed to fetch Wikipedia page: HTTP {response.status}")
+                        else:
+                            html = await response.read()
+                            self.stats["fetch"].record(started)
+                            return html
+                except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    error = f"{type(e).__name__}: {e}"
+            if attempt < FETCH_RETRIES:
+                await asyncio.sleep(FETCH_RETRY_BACKOFF * 2 ** attempt)
+        raise StageError("fetch", f"Failed to fetch Wikipedia page: {error}")
+
+    async def _write_results(self) -> None:
+        """Collect validated quizzes and insert them in batches, then mark them done"""
+        batch: List[NewQuiz] = []
+        deadline = 0.0
+        finished = False
+        try:
+            while not finished:
+                # A partial batch is written after BULK_FLUSH_INTERVAL so slow LLM calls do not hold back the checkpoint
+                timeout = max(deadline - time.monotonic(), 0) if batch else None
+                try:
+                    item = await asyncio.wait_for(self._results.get(), timeout=timeout)
+                    if item is None:
+                        finished = True
+                    else:
+                        if not batch:
+                            deadline = time.monotonic() + BULK_FLUSH_INTERVAL
+                        batch.append(item)
+                except asyncio.TimeoutError:
+                    pass
+                if batch and (finished or len(batch) >= self.batch_size or time.monotonic() >= deadline):
+                    pending, batch = batch, []
+                    await self._write_batch(pending)
+        except asyncio.CancelledError:
+            # Interrupted: keep the quizzes already paid for instead of regenerating them next run
+            while not self._results.empty():
+                item = self._results.get_nowait()
+                if item is not None:
+                    batch.append(item)
+            if batch:
+                await self._write_batch(batch)
+            raise
+
+    async def _write_batch(self, batch: List[NewQuiz]) -> None:
+        # The commit and its checkpoint entries happen together in the worker thread, which
+        # finishes even if this run is interrupted while waiting for it
+        await asyncio.to_thread(self._commit_batch, batch)
+
+    def _commit_batch(self, batch: List[NewQuiz]) -> None:
+        """Insert one batch in its own transaction, then mark its URLs done"""
+        started = time.perf_counter()
+        try:
+            with SessionLocal() as session:
+                records = save_quizzes(session, batch)
+                session.commit()
+                ids = [record.id for record in records]
+        except Exception as e:
+            # Not checkpointed, so the next run retries these URLs
+            self.stats["write"].errors += len(batch)
+            self.failed += len(batch)
+            logger.error(f"Failed to save {len(batch)} quizzes: {e}")
+            return
+        self.checkpoint.record({"url": new_quiz.url, "status": "done", "quiz_id": quiz_id} for new_quiz, quiz_id in zip(batch, ids))
+        self.stats["write"].record(started, items=len(batch))
+        self.saved += len(batch)
+        logger.info(f"Saved {self.saved} quizzes ({self.failed} failed)")
+
+    def summary(self, elapsed: float) -> str:
+        lines = [
+            f"{'stage':<10} {'items':>7} {'errors':>7} {'items/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'max ms':>9}",
+            *(self.stats[name].row() for name in STAGES),
+            f"\n{self.saved} quizzes saved, {self.failed} failed in {elapsed:.1f}s ({self.saved / elapsed if elapsed else 0:.2f} quizzes/s)",
+        ]
+        return "\n".join(lines)
+
+def _existing_urls(urls: List[str]) -> Set[str]:
+    """URLs that already have a quiz in the database"""
+    existing: Set[str] = set()
+    with SessionLocal() as session:
+        for start in range(0, len(urls), 500):
+            chunk = urls[start:start + 500]
+            existing.update(session.execute(select(Quiz.url).where(Quiz.url.in_(chunk))).scalars())
+    return existing
+
+def main() -> None:
+    """Command line entry point"""
+    parser = argparse.ArgumentParser(description="Generate quizzes for a list of Wikipedia URLs")
+    parser.add_argument("input", help="File with Wikipedia URLs ('-' for stdin)")
+    parser.add_argument("--checkpoint", help="Progress file (default: <input>.checkpoint, or bulk_generate.checkpoint for stdin)")
+    parser.add_argument("--retry-failed", action="store_true", help="Retry URLs that failed in an earlier run")
+    parser.add_argument("--skip-existing", action="store_true", help="Skip URLs that already have a quiz in the database")
+    parser.add_argument("--fetch-concurrency", type=int, default=BULK_FETCH_CONCURRENCY)
+    parser.add_argument("--parse-workers", type=int, default=BULK_PARSE_WORKERS)
+    parser.add_argument("--llm-concurrency", type=int, default=BULK_LLM_CONCURRENCY)
+    parser.add_argument("--batch-size", type=int, default=BULK_BATCH_SIZE)
+    args = parser.parse_args()
+
+    if args.input == "-":
+        urls = read_urls(sys.stdin)
+    else:
+        with open(args.input, encoding="utf-8") as f:
+            urls = read_urls(f)
+    checkpoint = Checkpoint(args.checkpoint or ("bulk_generate.checkpoint" if args.input == "-" else f"{args.input}.checkpoint"))
+
+    create_tables()
+    ensure_search_index()
+    with SessionLocal() as session:
+        load_dictionaries(session)
+
+    skip = set(checkpoint.done)
+    if not args.retry_failed:
+        skip.update(checkpoint.failed)
+    if args.skip_existing:
+        skip.update(_existing_urls(urls))
+    pending = [url for url in urls if url not in skip]
+    print(f"{len(urls)} URLs, {len(urls) - len(pending)} already processed, {len(pending)} to go", file=sys.stderr)
+    if not pending:
+        checkpoint.close()
+        return
+
+    get_quiz_generator()  # Fail fast on a missing API key
+    generator = BulkGenerator(
+        checkpoint,
+        fetch_concurrency=args.fetch_concurrency,
+        parse_workers=args.parse_workers,
+        llm_concurrency=args.llm_concurrency,
+        batch_size=args.batch_size
+    )
+    started = time.perf_counter()
+    try:
+        asyncio.run(generator.run(pending))
+    except KeyboardInterrupt:
+        print("Interrupted; run the same command again to resume", file=sys.stderr)
+    finally:
+        checkpoint.close()
+        print("\n" + generator.summary(time.perf_counter() - started), file=sys.stderr)
+    sys.exit(1 if generator.failed else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,442 @@
+"""
+Compressed content storage
+Stores scraped articles and quiz JSON as zstd-compressed, hash-deduplicated blobs
+"""
+import argparse
+import hashlib
+import logging
+import os
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+import zstandard as zstd
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session, object_session, undefer
+
+from database import ContentBlob, CompressionDictionary, Quiz, SessionLocal, begin_write, create_tables, engine
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Blob kinds - each kind gets its own dictionary since prose and JSON compress differently
+ARTICLE = "article"
+QUIZ = "quiz"
+KINDS = (ARTICLE, QUIZ)
+
+COMPRESSION_LEVEL = int(os.getenv("CONTENT_COMPRESSION_LEVEL", "10"))
+DICTIONARY_SIZE = 112640  # zstd's default dictionary size (110 KB)
+MIN_TRAINING_SAMPLES = 10  # zstd needs a reasonable number of samples to train a dictionary
+# Seconds before a process checks for a newer dictionary (trained by `python content_store.py train`)
+DICTIONARY_CACHE_TTL = float(os.getenv("DICTIONARY_CACHE_TTL", "300"))
+
+# Process-wide caches. Dictionaries are immutable once stored, so caching by id is safe;
+# which one is newest changes when another process trains one, so that is re-checked.
+# Compressor/decompressor objects are not thread-safe, so those are cached per thread.
+_dictionaries: Dict[int, zstd.ZstdCompressionDict] = {}
+_active_dictionary_ids: Dict[str, Tuple[Optional[int], float]] = {}  # kind -> (id, re-check time)
+_local = threading.local()
+
+def content_hash(content: str) -> str:
+    """
+    Compute the deduplication key for a piece of content.
+
+    Args:
+        content (str): Uncompressed text
+
+    Returns:
+        str: Hex SHA-256 digest of the UTF-8 text
+    """
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+def _get_dictionary(session: Optional[Session], dictionary_id: int) -> zstd.ZstdCompressionDict:
+    """Load a compression dictionary by id, caching it for the lifetime of the process"""
+    dictionary = _dictionaries.get(dictionary_id)
+    if dictionary is None:
+        if session is None:
+            raise ValueError(f"Compression dictionary {dictionary_id} is not loaded and no session is available")
+        record = session.get(CompressionDictionary, dictionary_id)
+        if record is None:
+            raise ValueError(f"Compression dictionary {dictionary_id} not found")
+        dictionary = zstd.ZstdCompressionDict(record.dict_data)
+        _dictionaries[dictionary_id] = dictionary
+    return dictionary
+
+def load_dictionaries(session: Session) -> int:
+    """
+    Preload all compression dictionaries into the process cache.
+
+    Args:
+        session (Session): Database session
+
+    Returns:
+        int: Number of dictionaries loaded
+    """
+    records = session.query(CompressionDictionary).order_by(CompressionDictionary.id).all()
+    for record in records:
+        _dictionaries.setdefault(record.id, zstd.ZstdCompressionDict(record.dict_data))
+        _set_active_dictionary_id(record.kind, record.id)
+    return len(records)
+
+def _set_active_dictionary_id(kind: str, dictionary_id: Optional[int]) -> None:
+    _active_dictionary_ids[kind] = (dictionary_id, time.monotonic() + DICTIONARY_CACHE_TTL)
+
+def _active_dictionary_id(session: Session, kind: str) -> Optional[int]:
+    """Return the newest dictionary id for a blob kind (None if none has been trained), cached for DICTIONARY_CACHE_TTL"""
+    cached = _active_dictionary_ids.get(kind)
+    if cached is not None and time.monotonic() < cached[1]:
+        return cached[0]
+    dictionary_id = (
+        session.query(func.max(CompressionDictionary.id))
+        .filter(CompressionDictionary.kind == kind)
+        .scalar()
+    )
+    _set_active_dictionary_id(kind, dictionary_id)
+    return dictionary_id
+
+def _compressor(session: Session, dictionary_id: Optional[int]) -> zstd.ZstdCompressor:
+    compressors = _local.__dict__.setdefault("compressors", {})
+    compressor = compressors.get(dictionary_id)
+    if compressor is None:
+        if dictionary_id is None:
+            compressor = zstd.ZstdCompressor(level=COMPRESSION_LEVEL)
+        else:
+            compressor = zstd.ZstdCompressor(level=COMPRESSION_LEVEL, dict_data=_get_dictionary(session, dictionary_id))
+        compressors[dictionary_id] = compressor
+    return compressor
+
+def _decompressor(session: Optional[Session], dictionary_id: Optional[int]) -> zstd.ZstdDecompressor:
+    decompressors = _local.__dict__.setdefault("decompressors", {})
+    decompressor = decompressors.get(dictionary_id)
+    if decompressor is None:
+        if dictionary_id is None:
+            decompressor = zstd.ZstdDecompressor()
+        else:
+            decompressor = zstd.ZstdDecompressor(dict_data=_get_dictionary(session, dictionary_id))
+        decompressors[dictionary_id] = decompressor
+    return decompressor
+
+def compress(session: Session, kind: str, content: str) -> Tuple[bytes, Optional[int]]:
+    """
+    Compress text with the active dictionary for its kind.
+
+    Args:
+        session (Session): Database session (used to load the dictionary on first use)
+        kind (str): Blob kind (ARTICLE or QUIZ)
+        content (str): Text to compress
+
+    Returns:
+        Tuple[bytes, Optional[int]]: (compressed_data, dictionary_id)
+    """
+    dictionary_id = _active_dictionary_id(session, kind)
+    data = _compressor(session, dictionary_id).compress(content.encode("utf-8"))
+    return data, dictionary_id
+
+def decompress(session: Optional[Session], data: bytes, dictionary_id: Optional[int], raw_size: int) -> str:
+    """
+    Decompress blob columns back into text (for queries that select the columns directly).
+
+    Args:
+        session (Optional[Session]): Database session (used to load the dictionary on first use)
+        data (bytes): Compressed data
+        dictionary_id (Optional[int]): Dictionary the data was compressed with
+        raw_size (int): Uncompressed size in bytes
+
+    Returns:
+        str: Original text
+    """
+    return _decompressor(session, dictionary_id).decompress(data, max_output_size=raw_size).decode("utf-8")
+
+def decompress_blob(blob: ContentBlob) -> str:
+    """
+    Decompress a stored blob back into text.
+
+    Args:
+        blob (ContentBlob): Blob loaded from the database
+
+    Returns:
+        str: Original text
+    """
+    return decompress(object_session(blob), blob.data, blob.dictionary_id, blob.raw_size)
+
+def store_content(session: Session, kind: str, content: str) -> ContentBlob:
+    """
+    Store text as a compressed blob, reusing an existing blob with the same content.
+
+    Args:
+        session (Session): Database session
+        kind (str): Blob kind (ARTICLE or QUIZ)
+        content (str): Text to store
+
+    Returns:
+        ContentBlob: New or existing blob (flushed, so its id is set)
+    """
+    digest = content_hash(content)
+    blob = session.query(ContentBlob).filter(ContentBlob.content_hash == digest).first()
+    if blob is not None:
+        return blob
+
+    data, dictionary_id = compress(session, kind, content)
+    blob = ContentBlob(
+        content_hash=digest,
+        kind=kind,
+        dictionary_id=dictionary_id,
+        data=data,
+        raw_size=len(content.encode("utf-8")),
+        stored_size=len(data)
+    )
+
+    # Another request may store the same article concurrently - fall back to its row
+    try:
+        with session.begin_nested():
+            session.add(blob)
+            session.flush()
+    except IntegrityError:
+        blob = session.query(ContentBlob).filter(ContentBlob.content_hash == digest).one()
+    return blob
+
+def store_contents(session: Session, kind: str, contents: List[str]) -> List[ContentBlob]:
+    """
+    Batch version of store_content: one lookup and one flush for any number of texts.
+
+    Args:
+        session (Session): Database session
+        kind (str): Blob kind (ARTICLE or QUIZ)
+        contents (List[str]): Texts to store (duplicates are stored once)
+
+    Returns:
+        List[ContentBlob]: Blob for each text, in the same order (flushed, so ids are set)
+    """
+    digests = [content_hash(content) for content in contents]
+    blobs: Dict[str, ContentBlob] = {
+        blob.content_hash: blob
+        for blob in session.query(ContentBlob).filter(ContentBlob.content_hash.in_(set(digests)))
+    }
+
+    new_blobs = []
+    for digest, content in zip(digests, contents):
+        if digest in blobs:
+            continue
+        data, dictionary_id = compress(session, kind, content)
+        blobs[digest] = ContentBlob(
+            content_hash=digest,
+            kind=kind,
+            dictionary_id=dictionary_id,
+            data=data,
+            raw_size=len(content.encode("utf-8")),
+            stored_size=len(data)
+        )
+        new_blobs.append(blobs[digest])
+
+    if new_blobs:
+        try:
+            with session.begin_nested():
+                session.add_all(new_blobs)
+                session.flush()
+        except IntegrityError:
+            # Lost a race with a concurrent writer - resolve each text individually
+            return [store_content(session, kind, content) for content in contents]
+    return [blobs[digest] for digest in digests]
+
+def attach_content(session: Session, quiz: Quiz, scraped_content: Optional[str], full_quiz_data: str) -> None:
+    """
+    Store a quiz's payloads as compressed blobs and link them to the quiz record.
+
+    Args:
+        session (Session): Database session
+        quiz (Quiz): Quiz record (new or existing)
+        scraped_content (Optional[str]): Scraped article text
+        full_quiz_data (str): Serialized quiz JSON
+    """
+    if scraped_content is not None:
+        quiz.article_content = store_content(session, ARTICLE, scraped_content)
+    quiz.quiz_content = store_content(session, QUIZ, full_quiz_data)
+    # Content now lives in content_blobs; keep the legacy columns empty
+    quiz.scraped_content_legacy = None
+    quiz.full_quiz_data_legacy = ""
+
+def _collect_samples(session: Session, kind: str, limit: int) -> List[bytes]:
+    """Collect training samples from legacy columns and existing blobs"""
+    samples: List[bytes] = []
+    legacy_column = Quiz.scraped_content_legacy if kind == ARTICLE else Quiz.full_quiz_data_legacy
+    rows = (
+        session.query(legacy_column)
+        .filter(legacy_column.isnot(None), legacy_column != "")
+        .order_by(Quiz.id.desc())
+        .limit(limit)
+    )
+    samples.extend(value.encode("utf-8") for (value,) in rows)
+
+    if len(samples) < limit:
+        blobs = (
+            session.query(ContentBlob)
+            .filter(ContentBlob.kind == kind)
+            .order_by(ContentBlob.id.desc())
+            .limit(limit - len(samples))
+        )
+        samples.extend(blob.text.encode("utf-8") for blob in blobs)
+    return samples
+
+def train_dictionary(session: Session, kind: str, sample_limit: int = 1000) -> Optional[CompressionDictionary]:
+    """
+    Train a zstd dictionary for a blob kind from stored content.
+
+    New blobs use the newest dictionary; existing blobs keep the one they were written with.
+
+    Args:
+        session (Session): Database session
+        kind (str): Blob kind (ARTICLE or QUIZ)
+        sample_limit (int): Maximum number of samples to train on
+
+    Returns:
+        Optional[CompressionDictionary]: Stored dictionary, or None if there is not enough data
+    """
+    samples = _collect_samples(session, kind, sample_limit)
+    if len(samples) < MIN_TRAINING_SAMPLES:
+        logger.info(f"Not enough {kind} samples to train a dictionary ({len(samples)} < {MIN_TRAINING_SAMPLES})")
+        return None
+
+    # zstd recommends roughly 100x more sample data than the dictionary size
+    total_size = sum(len(sample) for sample in samples)
+    dict_size = max(4096, min(DICTIONARY_SIZE, total_size // 100))
+    try:
+        trained = zstd.train_dictionary(dict_size, samples, level=COMPRESSION_LEVEL)
+    except zstd.ZstdError as e:
+        logger.warning(f"Dictionary training failed for {kind} content: {e}")
+        return None
+
+    record = CompressionDictionary(kind=kind, dict_data=trained.as_bytes(), sample_count=len(samples))
+    session.add(record)
+    session.flush()
+    _set_active_dictionary_id(kind, record.id)
+    logger.info(f"Trained {kind} dictionary {record.id} ({len(record.dict_data)} bytes from {len(samples)} samples)")
+    return record
+
+def migrate_existing_rows(session: Session, batch_size: int = 100) -> int:
+    """
+    Move legacy uncompressed payloads into compressed blobs.
+
+    Trains a dictionary for each kind first (if none exists yet) so the migrated rows
+    benefit from it. Commits after every batch, so the migration can be interrupted and resumed.
+
+    Args:
+        session (Session): Database session
+        batch_size (int): Rows per transaction
+
+    Returns:
+        int: Number of quizzes migrated
+    """
+    for kind in KINDS:
+        if _active_dictionary_id(session, kind) is None:
+            train_dictionary(session, kind)
+    session.commit()
+
+    migrated = 0
+    last_id = 0
+    while True:
+        # The batch reads before store_content writes; on SQLite, hold the write lock throughout
+        # so the blobs and the quiz updates commit together
+        begin_write(session)
+        batch = (
+            session.query(Quiz)
+            .options(undefer(Quiz.scraped_content_legacy), undefer(Quiz.full_quiz_data_legacy))
+            .filter(Quiz.quiz_content_id.is_(None), Quiz.id > last_id)
+            .order_by(Quiz.id)
+            .limit(batch_size)
+            .all()
+        )
+        if not batch:
+            break
+
+        for quiz in batch:
+            attach_content(session, quiz, quiz.scraped_content_legacy, quiz.full_quiz_data_legacy)
+        # Read before committing: the refresh of an expired attribute would open the next transaction
+        last_id = batch[-1].id
+        session.commit()
+
+        migrated += len(batch)
+        logger.info(f"Migrated {migrated} quizzes to compressed storage")
+
+    return migrated
+
+def storage_report(session: Session) -> Dict[str, Dict[str, float]]:
+    """
+    Summarize the space used by compressed content.
+
+    "logical_bytes" counts every quiz's payload as if it were stored uncompressed in its own
+    row (the old layout), so the ratio includes both compression and deduplication savings.
+
+    Args:
+        session (Session): Database session
+
+    Returns:
+        Dict[str, Dict[str, float]]: Per-kind statistics
+    """
+    report = {}
+    for kind, link_column in ((ARTICLE, Quiz.article_content_id), (QUIZ, Quiz.quiz_content_id)):
+        blobs, raw_bytes, stored_bytes = (
+            session.query(
+                func.count(ContentBlob.id),
+                func.coalesce(func.sum(ContentBlob.raw_size), 0),
+                func.coalesce(func.sum(ContentBlob.stored_size), 0)
+            )
+            .filter(ContentBlob.kind == kind)
+            .one()
+        )
+        references, logical_bytes = (
+            session.query(func.count(Quiz.id), func.coalesce(func.sum(ContentBlob.raw_size), 0))
+            .join(ContentBlob, ContentBlob.id == link_column)
+            .one()
+        )
+        report[kind] = {
+            "blobs": blobs,
+            "references": references,
+            "logical_bytes": logical_bytes,
+            "unique_bytes": raw_bytes,
+            "stored_bytes": stored_bytes,
+            "ratio": round(logical_bytes / stored_bytes, 2) if stored_bytes else 0.0,
+            "saved_percent": round(100 * (1 - stored_bytes / logical_bytes), 1) if logical_bytes else 0.0
+        }
+    return report
+
+def print_storage_report(report: Dict[str, Dict[str, float]]) -> None:
+    """Print a storage report produced by storage_report()"""
+    print(f"{'kind':<8} {'quizzes':>8} {'blobs':>6} {'original':>12} {'deduped':>12} {'stored':>12} {'ratio':>7} {'saved':>7}")
+    for kind, stats in report.items():
+        print(
+            f"{kind:<8} {stats['references']:>8} {stats['blobs']:>6} {stats['logical_bytes']:>12,} "
+            f"{stats['unique_bytes']:>12,} {stats['stored_bytes']:>12,} {stats['ratio']:>6}x {stats['saved_percent']:>6}%"
+        )
+
+def main() -> None:
+    """Command line entry point: migrate, train or report"""
+    parser = argparse.ArgumentParser(description="Manage compressed quiz content storage")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    migrate_parser = subparsers.add_parser("migrate", help="Move legacy rows into compressed blobs")
+    migrate_parser.add_argument("--batch-size", type=int, default=100)
+    migrate_parser.add_argument("--vacuum", action="store_true", help="Reclaim freed space afterwards (SQLite only)")
+    train_parser = subparsers.add_parser("train", help="Train new dictionaries from stored content")
+    train_parser.add_argument("--samples", type=int, default=1000)
+    subparsers.add_parser("report", help="Print the storage size report")
+    args = parser.parse_args()
+
+    create_tables()
+    with SessionLocal() as session:
+        if args.command == "migrate":
+            migrated = migrate_existing_rows(session, batch_size=args.batch_size)
+            print(f"Migrated {migrated} quizzes")
+        elif args.command == "train":
+            for kind in KINDS:
+                train_dictionary(session, kind, sample_limit=args.samples)
+            session.commit()
+        print_storage_report(storage_report(session))
+
+    if args.command == "migrate" and args.vacuum and engine.dialect.name == "sqlite":
+        with engine.connect() as conn:
+            conn.exec_driver_sql("VACUUM")
+        print("SQLite database vacuumed")
+
+if __name__ == "__main__":
+    main()
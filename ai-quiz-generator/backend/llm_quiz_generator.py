@@ -3,13 +3,17 @@ LangChain setup, prompt templates, and chain logic
 LLM Integration using Gemini model for quiz generation
 """
 import os
-from typing import Dict, Any
+import re
+from typing import Dict, Any, List
 import json
 from models import QuizOutput
 from dotenv import load_dotenv
 import logging
+from langchain_core.messages import BaseMessage, HumanMessage, SystemMessage
 from langchain_google_genai import ChatGoogleGenerativeAI
 
+import metrics
+
 # Load environment variables
 load_dotenv()
 
@@ -17,59 +21,34 @@ load_dotenv()
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-class QuizGenerator:
-    """
-    LLM-powered quiz generator using Gemini via LangChain
-    """
-    
-    def __init__(self):
-        """Initialize the Gemini model via LangChain"""
-        self.api_key = os.getenv("GEMINI_API_KEY")
-        if not self.api_key or self.api_key == "YOUR_API_KEY_HERE":
-            raise ValueError("GEMINI_API_KEY not found in environment variables. Please set it in .env file.")
-        
-        # Initialize Gemini model via LangChain
-        self.model = ChatGoogleGenerativeAI(
-            model="gemini-2.0-flash-exp",
-            google_api_key=self.api_key,
-            temperature=0.7,
-            convert_system_message_to_human=True
-        )
-        
-        logger.info("QuizGenerator initialized successfully with Gemini model via LangChain")
-    
-    def _create_prompt(self, article_text: str, article_title: str) -> str:
-        """
-        Create detailed prompt for quiz generation
-        """
-        return f"""
-You are an expert educational content creator. Analyze this Wikipedia article and create a comprehensive quiz.
+GEMINI_MODEL = "gemini-2.0-flash-exp"
+MAX_ARTICLE_CHARS = 15000  # Approximate token limit consideration
 
-ARTICLE TITLE: {article_title}
-
-ARTICLE TEXT:
-{article_text}
+# Identical on every call: sent first as the system instruction, so the provider can reuse
+# it as a cached prompt prefix (implicit caching). The article follows in the user message.
+SYSTEM_INSTRUCTIONS = """
+You are an expert educational content creator. Analyze the Wikipedia article in the user's message and create a comprehensive quiz.
 
 Create a JSON response with this EXACT structure:
-{{
+{
   "summary": "Brief 2-3 sentence summary of the article",
-  "key_entities": {{
+  "key_entities": {
     "people": ["list of important people mentioned"],
     "organizations": ["list of organizations, institutions, companies"],
     "locations": ["list of countries, cities, geographic locations"]
-  }},
+  },
   "sections": ["list of 3-7 main topics/sections covered"],
   "quiz": [
-    {{
+    {
       "question": "Question text here?",
       "options": ["Option A", "Option B", "Option C", "Option D"],
       "answer": "Correct option from the list above",
       "difficulty": "easy|medium|hard",
       "explanation": "Brief explanation of why this is correct"
-    }}
+    }
   ],
   "related_topics": ["list of 3-6 related Wikipedia topics"]
-}}
+}
 
 REQUIREMENTS:
 - Generate 5-10 quiz questions
@@ -80,7 +59,107 @@ REQUIREMENTS:
 - Provide accurate explanations
 
 Return ONLY the JSON, no other text.
-"""
+""".strip()
+
+# Used when refreshing a quiz: questions only, from the changed parts of an article
+QUESTION_INSTRUCTIONS = """
+You are an expert educational content creator. Some passages of a Wikipedia article were added or edited.
+The user's message gives the article title, how many questions are needed, the quiz questions that are
+being kept, and the changed passages. Write new quiz questions based only on the changed passages.
+
+Create a JSON response with this EXACT structure:
+{
+  "quiz": [
+    {
+      "question": "Question text here?",
+      "options": ["Option A", "Option B", "Option C", "Option D"],
+      "answer": "Correct option from the list above",
+      "difficulty": "easy|medium|hard",
+      "explanation": "Brief explanation of why this is correct"
+    }
+  ]
+}
+
+REQUIREMENTS:
+- Generate exactly the number of questions needed
+- Each question must have exactly 4 options
+- Mix of difficulty levels (easy, medium, hard)
+- All information must be from the changed passages
+- Do not repeat or overlap with the existing questions
+- Provide accurate explanations
+
+Return ONLY the JSON, no other text.
+""".strip()
+
+class QuizGenerator:
+    """
+    LLM-powered quiz generator using Gemini via LangChain
+    """
+    
+    def __init__(self):
+        """Initialize the Gemini model via LangChain"""
+        self.api_key = os.getenv("GEMINI_API_KEY")
+        if not self.api_key or self.api_key == "YOUR_API_KEY_HERE":
+            raise ValueError("GEMINI_API_KEY not found in environment variables. Please set it in .env file.")
+        
+        # Initialize Gemini model via LangChain
+        self.model = ChatGoogleGenerativeAI(
+            model=GEMINI_MODEL,
+            google_api_key=self.api_key,
+            temperature=0.7
+        )
+        
+        logger.info("QuizGenerator initialized successfully with Gemini model via LangChain")
+    
+    def _create_messages(self, article_text: str, article_title: str) -> List[BaseMessage]:
+        """Create the prompt: the static instructions first, then the article"""
+        return [
+            SystemMessage(content=SYSTEM_INSTRUCTIONS),
+            HumanMessage(content=f"ARTICLE TITLE: {article_title}\n\nARTICLE TEXT:\n{article_text}"),
+        ]
+    
+    def _call(self, invoke) -> Dict[str, Any]:
+        """
+        Run one model call with metrics and parse its JSON answer
+        
+        Args:
+            invoke: Callable making the model call and returning the AIMessage
+            
+        Returns:
+            Dict[str, Any]: Parsed JSON object
+        """
+        try:
+            with metrics.stage("llm"):
+                response = invoke()
+        except Exception:
+            metrics.llm_requests.inc(1, "error")
+            raise
+        metrics.llm_requests.inc(1, "success")
+        usage = getattr(response, "usage_metadata", None)
+        metrics.record_llm_usage(usage)
+        if usage:
+            cached_tokens = (usage.get("input_token_details") or {}).get("cache_read", 0)
+            logger.info(f"LLM input: {usage.get('input_tokens', 0)} tokens, {cached_tokens} served from cache")
+        
+        # Extract text from response
+        response_text = response.content.strip()
+        
+        # Parse JSON response
+        with metrics.stage("llm_parse"):
+            try:
+                result = json.loads(response_text)
+            except json.JSONDecodeError as e:
+                # Try to extract JSON from response if it has extra text
+                json_match = re.search(r'\{.*\}', response_text, re.DOTALL)
+                if json_match:
+                    result = json.loads(json_match.group())
+                else:
+                    raise ValueError(f"Could not parse JSON from response: {e}")
+        
+        # Validate the result
+        if not isinstance(result, dict):
+            raise ValueError("LLM did not return a valid dictionary")
+        return result
     
     def generate_quiz(self, article_text: str, article_title: str) -> Dict[str, Any]:
         """
@@ -100,35 +179,13 @@ Return ONLY the JSON, no other text.
             logger.info(f"Generating quiz for article: '{article_title}' ({len(article_text)} characters)")
             
             # Truncate article if too long (to fit within token limits)
-            max_chars = 15000  # Approximate token limit consideration
-            if len(article_text) > max_chars:
-                article_text = article_text[:max_chars] + "..."
-                logger.warning(f"Article truncated to {max_chars} characters due to length")
-            
-            # Create prompt
-            prompt = self._create_prompt(article_text, article_title)
+            if len(article_text) > MAX_ARTICLE_CHARS:
+                article_text = article_text[:MAX_ARTICLE_CHARS] + "..."
+                logger.warning(f"Article truncated to {MAX_ARTICLE_CHARS} characters due to length")
             
             # Generate content using Gemini via LangChain
-            response = self.model.invoke(prompt)
-            
-            # Extract text from response
-            response_text = response.content.strip()
-            
-            # Parse JSON response
-            try:
-                result = json.loads(response_text)
-            except json.JSONDecodeError as e:
-                # Try to extract JSON from response if it has extra text
-                import re
-                json_match = re.search(r'\{.*\}', response_text, re.DOTALL)
-                if json_match:
-                    result = json.loads(json_match.group())
-                else:
-                    raise ValueError(f"Could not parse JSON from response: {e}")
-            
-            # Validate the result
-            if not isinstance(result, dict):
-                raise ValueError("LLM did not return a valid dictionary")
+            messages = self._create_messages(article_text, article_title)
+            result = self._call(lambda: self.model.invoke(messages))
             
             # Ensure we have the required fields
             required_fields = ["summary", "key_entities", "sections", "quiz", "related_topics"]
@@ -148,6 +205,46 @@ Return ONLY the JSON, no other text.
             logger.error(f"Quiz generation failed: {e}")
             raise Exception(f"Failed to generate quiz: {str(e)}")
     
+    def generate_questions(self, passages: str, article_title: str, count: int, existing_questions: List[str]) -> List[Dict[str, Any]]:
+        """
+        Generate replacement questions from changed passages of an article (see refresh.py)
+        
+        Args:
+            passages (str): Added or edited article text
+            article_title (str): Article title for context
+            count (int): Number of questions wanted
+            existing_questions (List[str]): Questions being kept, not to be repeated
+            
+        Returns:
+            List[Dict[str, Any]]: At most `count` questions in the QuizQuestion format
+            
+        Raises:
+            Exception: If generation fails
+        """
+        try:
+            logger.info(f"Generating {count} questions for changed passages of '{article_title}' ({len(passages)} characters)")
+            if len(passages) > MAX_ARTICLE_CHARS:
+                passages = passages[:MAX_ARTICLE_CHARS] + "..."
+            existing = "\n".join(f"- {question}" for question in existing_questions) or "(none)"
+            messages = [
+                SystemMessage(content=QUESTION_INSTRUCTIONS),
+                HumanMessage(content=(
+                    f"ARTICLE TITLE: {article_title}\n\nQUESTIONS NEEDED: {count}\n\n"
+                    f"EXISTING QUESTIONS:\n{existing}\n\nCHANGED PASSAGES:\n{passages}"
+                )),
+            ]
+            result = self._call(lambda: self.model.invoke(messages))
+            questions = result.get("quiz")
+            if not isinstance(questions, list):
+                raise ValueError("Missing required field in LLM output: ['quiz']")
+            if len(questions) != count:
+                logger.warning(f"Got {len(questions)} questions, asked for {count}")
+            return questions[:count]
+            
+        except Exception as e:
+            logger.error(f"Question generation failed: {e}")
+            raise Exception(f"Failed to generate questions: {str(e)}")
+    
     def test_connection(self) -> bool:
         """
         Test the connection to Gemini API
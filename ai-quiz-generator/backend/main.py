@@ -2,18 +2,38 @@
 FastAPI application and API endpoints
 Main backend server for AI Wiki Quiz Generator
 """
-from fastapi import FastAPI, HTTPException, Depends
+from fastapi import FastAPI, HTTPException, Depends, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import FileResponse, ORJSONResponse, PlainTextResponse, StreamingResponse
 from pydantic import BaseModel, HttpUrl
+from sqlalchemy import select, text
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple
 import json
 import logging
+import math
+import os
 from datetime import datetime
 
 # Import our modules
-from database import get_db, Quiz, create_tables
+from database import get_async_db, Quiz, create_tables, locked_transaction, SessionLocal, AsyncSessionLocal, async_engine
+from content_store import content_hash, load_dictionaries
+from admission import client_id, generate_admission
+import analytics
+import metrics
+import profiling
+from profiling import run_in_threadpool
+import search_index
+import topic_index
+from shared_cache import HEALTH_CACHE_TTL, QUIZ_CACHE_TTL, SCRAPE_CACHE_TTL, cached, shared_cache
+from persistence import save_quiz
+import transfer
+from responses import quiz_response
+from scoring import AnswerKey, answer_keys, load_answer_key
+from write_behind import Submission, answer_buffer, write_submissions
 from scraper import scrape_wikipedia
+import refresh
 from llm_quiz_generator import get_quiz_generator
 from models import QuizOutput
 
@@ -25,7 +45,8 @@ logger = logging.getLogger(__name__)
 app = FastAPI(
     title="AI Wiki Quiz Generator",
     description="Generate AI-powered quizzes from Wikipedia articles",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=ORJSONResponse
 )
 
 # Set up CORS middleware to allow React frontend to communicate
@@ -44,8 +65,18 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],  # Allow all HTTP methods
     allow_headers=["*"],  # Allow all headers
+    expose_headers=["Server-Timing", "X-Profile-Id"],  # Per-stage timings for the frontend
 )
 
+# On-demand profiling (admin X-Profile header or PROFILE_SAMPLE_RATE); inside the
+# Server-Timing middleware so captures can include the stage timings
+if profiling.ADMIN_TOKEN or profiling.PROFILE_SAMPLE_RATE > 0:
+    app.add_middleware(profiling.ProfilingMiddleware)
+
+# Per-request stage timings (Server-Timing header) and request metrics for /metrics
+if metrics.METRICS_ENABLED:
+    app.add_middleware(metrics.ServerTimingMiddleware)
+
 # Pydantic models for request/response
 class GenerateQuizRequest(BaseModel):
     """Request model for generate_quiz endpoint"""
@@ -65,6 +96,57 @@ class QuizHistoryResponse(BaseModel):
     title: str
     date_generated: datetime
 
+class SearchResult(BaseModel):
+    """A quiz matching a search query"""
+    id: int
+    url: str
+    title: str
+    date_generated: datetime
+    score: float
+
+class SearchResponse(BaseModel):
+    """Response model for quiz search"""
+    query: str
+    total: int
+    page: int
+    page_size: int
+    results: List[SearchResult]
+
+class EntityResult(BaseModel):
+    """A key entity or section heading, with the number of quizzes that mention it"""
+    id: int
+    kind: str
+    name: str
+    quiz_count: int
+
+class EntityQuiz(BaseModel):
+    """A quiz that mentions an entity"""
+    id: int
+    url: str
+    title: str
+    date_generated: datetime
+
+class EntityDetailResponse(EntityResult):
+    """Response model for the quizzes mentioning an entity"""
+    page: int
+    page_size: int
+    quizzes: List[EntityQuiz]
+
+class TopicResult(BaseModel):
+    """A topic in the related-topic graph"""
+    id: int
+    name: str
+    degree: int
+
+class LinkedTopic(TopicResult):
+    """A topic linked to another one, with the number of quizzes suggesting the link"""
+    quiz_count: int
+
+class TopicNeighborsResponse(TopicResult):
+    """Response model for the topics linked to a topic"""
+    related: List[LinkedTopic]
+    referenced_by: List[LinkedTopic]
+
 class QuizDetailResponse(BaseModel):
     """Response model for detailed quiz data"""
     id: int
@@ -78,6 +160,21 @@ class QuizDetailResponse(BaseModel):
     related_topics: List[str]
     user_answers: Optional[Dict[str, str]] = None
 
+class RefreshStats(BaseModel):
+    """How a refreshed quiz was produced"""
+    mode: str  # "unchanged", "incremental" or "full"
+    refreshed_from: int
+    reused_questions: int
+    new_questions: int
+    changed_passages: Optional[int] = None
+    total_passages: Optional[int] = None
+    changed_fraction: float
+    llm_input_chars: int
+
+class RefreshQuizResponse(QuizDetailResponse):
+    """Response model for a refreshed quiz"""
+    refresh: RefreshStats
+
 class SubmitAnswersRequest(BaseModel):
     """Request model for submitting quiz answers"""
     quiz_id: int
@@ -94,6 +191,32 @@ class SubmitAnswersRequest(BaseModel):
             }
         }
 
+# Scrape results, generated quizzes and LLM health go through the host-wide shared cache,
+# so several uvicorn workers scrape and generate each article once between them
+def scrape_article(url: str) -> Tuple[str, str]:
+    """scrape_wikipedia through the shared cache: (clean_text, article_title)"""
+    (clean_text, article_title), hit = cached(f"scrape:{url}", lambda: list(scrape_wikipedia(url)), SCRAPE_CACHE_TTL)
+    metrics.record_cache("scrape", hit)
+    return clean_text, article_title
+
+def generate_quiz_data(clean_text: str, article_title: str) -> Dict[str, Any]:
+    """QuizGenerator.generate_quiz through the shared cache, keyed by the article text"""
+    key = f"quiz:{content_hash(article_title + chr(10) + clean_text)}"
+    quiz_data, hit = cached(key, lambda: get_quiz_generator().generate_quiz(clean_text, article_title), QUIZ_CACHE_TTL)
+    metrics.record_cache("quiz", hit)
+    return quiz_data
+
+def llm_status() -> str:
+    """Gemini connectivity ("ready" or "api_key_needed"), checked at most once per HEALTH_CACHE_TTL per host"""
+    def check() -> str:
+        try:
+            return "ready" if get_quiz_generator().test_connection() else "api_key_needed"
+        except Exception:
+            return "api_key_needed"
+    status, hit = cached("health:llm", check, HEALTH_CACHE_TTL)
+    metrics.record_cache("health", hit)
+    return status
+
 # Create database tables on startup
 @app.on_event("startup")
 async def startup_event():
@@ -101,8 +224,27 @@ async def startup_event():
     try:
         # Initialize database tables
         create_tables()
+        with SessionLocal() as db:
+            load_dictionaries(db)
+        # One-time backfill for databases created before analytics existed. Every worker
+        # gets here, so it runs under a lock and re-checks once the lock is held.
+        with SessionLocal() as db, locked_transaction(db, "analytics_backfill"):
+            if not analytics.is_initialized(db):
+                analytics.rebuild(db)
+        # Likewise for the entity and topic index
+        with SessionLocal() as db, locked_transaction(db, "topic_index_backfill"):
+            if not topic_index.is_initialized(db):
+                topic_index.rebuild(db)
+        # Build the full-text index for quizzes saved before search existed (same locking)
+        search_index.ensure_search_index()
+        with SessionLocal() as db, locked_transaction(db, "search_index_backfill"):
+            if not search_index.is_initialized(db):
+                search_index.rebuild(db)
         logger.info("Database tables initialized")
         
+        if answer_buffer is not None:
+            await answer_buffer.start()
+        
         # Verify Gemini API key is configured
         import os
         api_key = os.getenv("GEMINI_API_KEY")
@@ -114,8 +256,7 @@ async def startup_event():
             
         # Test LLM connection (optional, don't fail startup if it fails)
         try:
-            quiz_generator = get_quiz_generator()
-            if quiz_generator.test_connection():
+            if await run_in_threadpool(llm_status) == "ready":
                 logger.info("Gemini API connection verified")
             else:
                 logger.warning("Gemini API connection test failed - check your API key")
@@ -126,6 +267,13 @@ async def startup_event():
         logger.error(f"Startup initialization failed: {e}")
         # Don't fail startup, but log the error
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Flush buffered answers and close pooled database connections"""
+    if answer_buffer is not None:
+        await answer_buffer.stop()
+    await async_engine.dispose()
+
 # Health check endpoint
 @app.get("/")
 async def root():
@@ -134,31 +282,37 @@ async def root():
 
 # Endpoint 1: /api/generate-quiz (POST)
 @app.post("/api/generate-quiz", response_model=QuizDetailResponse)
-async def generate_quiz(request: GenerateQuizRequest, db: Session = Depends(get_db)):
+async def generate_quiz(request: GenerateQuizRequest, http_request: Request):
     """
     Generate a quiz from a Wikipedia article URL
     
     - Accepts a JSON body with the url
+    - Waits for a generation slot (503 or 429 with Retry-After when the server or this client is over its limit)
     - Calls scrape_wikipedia
     - Calls the LLM generation chain
     - Saves the data (serializing the quiz JSON to a string) into the database
     - Returns the full JSON data of the generated quiz
     """
+    async with generate_admission.admit(client_id(http_request)):
+        return await _generate_quiz(request)
+
+async def _generate_quiz(request: GenerateQuizRequest):
+    """generate_quiz once admitted; the database session is opened only to save the result"""
     try:
         logger.info(f"Generating quiz for URL: {request.url}")
         
         # Step 1: Scrape Wikipedia article
         try:
-            clean_text, article_title = scrape_wikipedia(request.url)
+            clean_text, article_title = await run_in_threadpool(scrape_article, request.url)
             logger.info(f"Successfully scraped article: '{article_title}' ({len(clean_text)} characters)")
+            profiling.annotate(article_url=request.url, article_title=article_title, article_chars=len(clean_text))
         except Exception as e:
             logger.error(f"Scraping failed for {request.url}: {e}")
             raise HTTPException(status_code=400, detail=f"Failed to scrape Wikipedia article: {str(e)}")
         
         # Step 2: Generate quiz using LLM
         try:
-            quiz_generator = get_quiz_generator()
-            quiz_data = quiz_generator.generate_quiz(clean_text, article_title)
+            quiz_data = await run_in_threadpool(generate_quiz_data, clean_text, article_title)
             logger.info(f"Successfully generated quiz with {len(quiz_data['quiz'])} questions")
         except Exception as e:
             logger.error(f"Quiz generation failed: {e}")
@@ -166,41 +320,32 @@ async def generate_quiz(request: GenerateQuizRequest, db: Session = Depends(get_
         
         # Step 3: Validate quiz data with Pydantic
         try:
-            validated_quiz = QuizOutput(**quiz_data)
+            with metrics.stage("validate"):
+                validated_quiz = QuizOutput(**quiz_data)
         except Exception as e:
             logger.error(f"Quiz validation failed: {e}")
             raise HTTPException(status_code=500, detail=f"Generated quiz data is invalid: {str(e)}")
         
         # Step 4: Save to database (serializing the quiz JSON to a string)
+        # The same JSON is stored and returned, so the quiz is validated and serialized only once
+        quiz_json = validated_quiz.model_dump_json()
         try:
-            quiz_record = Quiz(
-                url=request.url,
-                title=article_title,
-                scraped_content=clean_text,  # Store scraped content for bonus
-                full_quiz_data=validated_quiz.model_dump_json()  # Serialize to JSON string
-            )
-            
-            db.add(quiz_record)
-            db.commit()
-            db.refresh(quiz_record)
+            with metrics.stage("db"):
+                async with AsyncSessionLocal() as db:  # Rolls back on error
+                    quiz_record = await db.run_sync(save_quiz, request.url, article_title, clean_text, validated_quiz, quiz_json)
+                    await db.commit()
             
             logger.info(f"Quiz saved to database with ID: {quiz_record.id}")
             
+            # Warm the answer key cache so the first submission does not have to load the quiz
+            answer_keys.put(AnswerKey.from_questions(quiz_record.id, quiz_data["quiz"]))
+            
         except Exception as e:
-            db.rollback()
             logger.error(f"Database save failed: {e}")
             raise HTTPException(status_code=500, detail=f"Failed to save quiz to database: {str(e)}")
         
-        # Step 5: Return the full JSON data of the generated quiz
-        response_data = {
-            "id": quiz_record.id,
-            "url": quiz_record.url,
-            "title": quiz_record.title,
-            "date_generated": quiz_record.date_generated,
-            **quiz_data  # Include all quiz data (summary, key_entities, sections, quiz, related_topics)
-        }
-        
-        return response_data
+        # Step 5: Return the full JSON data of the generated quiz (already validated and serialized)
+        return quiz_response(quiz_record.id, quiz_record.url, quiz_record.title, quiz_record.date_generated, quiz_json)
         
     except HTTPException:
         # Re-raise HTTP exceptions
@@ -211,7 +356,7 @@ async def generate_quiz(request: GenerateQuizRequest, db: Session = Depends(get_
 
 # Endpoint 2: /api/history (GET)
 @app.get("/api/history", response_model=List[QuizHistoryResponse])
-async def get_quiz_history(db: Session = Depends(get_db)):
+async def get_quiz_history(db: AsyncSession = Depends(get_async_db)):
     """
     Get history of all generated quizzes
     
@@ -221,8 +366,11 @@ async def get_quiz_history(db: Session = Depends(get_db)):
     try:
         logger.info("Fetching quiz history")
         
-        # Query database for all quizzes, ordered by most recent first
-        quizzes = db.query(Quiz).order_by(Quiz.date_generated.desc()).all()
+        # Query database for all quizzes, ordered by most recent first (only the listed columns)
+        result = await db.execute(
+            select(Quiz.id, Quiz.url, Quiz.title, Quiz.date_generated).order_by(Quiz.date_generated.desc())
+        )
+        quizzes = result.all()
         
         # Return simple list with id, url, title, and date_generated
         history = [
@@ -242,9 +390,109 @@ async def get_quiz_history(db: Session = Depends(get_db)):
         logger.error(f"Error fetching quiz history: {e}")
         raise HTTPException(status_code=500, detail=f"Failed to fetch quiz history: {str(e)}")
 
+@app.get("/api/search", response_model=SearchResponse)
+async def search_quizzes(
+    q: str = Query(..., min_length=1, max_length=200),
+    page: int = Query(1, ge=1),
+    page_size: int = Query(20, ge=1, le=100),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Search saved quizzes
+    
+    - Full-text search over title, summary, question text and key entities
+    - Results are ranked by relevance (title and entity matches weigh most) and paginated
+    """
+    try:
+        total, results = await db.run_sync(search_index.search, q, page_size, (page - 1) * page_size)
+        
+        return {
+            "query": q,
+            "total": total,
+            "page": page,
+            "page_size": page_size,
+            "results": results
+        }
+    except Exception as e:
+        logger.error(f"Error searching quizzes for '{q}': {e}")
+        raise HTTPException(status_code=500, detail=f"Failed to search quizzes: {str(e)}")
+
+@app.get("/api/entities", response_model=List[EntityResult])
+async def search_entities(
+    q: str = Query(..., min_length=1, max_length=200),
+    kind: Optional[str] = Query(None, pattern="^(" + "|".join(topic_index.ENTITY_KINDS) + ")$"),
+    limit: int = Query(20, ge=1, le=100),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Find key entities and section headings by name prefix
+    
+    - Case-insensitive prefix match, optionally restricted to one kind
+    - Most-quizzed entities first
+    """
+    try:
+        return await db.run_sync(topic_index.search_entities, q, kind, limit)
+    except Exception as e:
+        logger.error(f"Error searching entities for '{q}': {e}")
+        raise HTTPException(status_code=500, detail=f"Failed to search entities: {str(e)}")
+
+@app.get("/api/entities/{entity_id}", response_model=EntityDetailResponse)
+async def get_entity_quizzes(
+    entity_id: int,
+    page: int = Query(1, ge=1),
+    page_size: int = Query(20, ge=1, le=100),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    List the quizzes that mention an entity, newest first
+    """
+    try:
+        result = await db.run_sync(topic_index.entity_quizzes, entity_id, page_size, (page - 1) * page_size)
+    except Exception as e:
+        logger.error(f"Error retrieving quizzes for entity {entity_id}: {e}")
+        raise HTTPException(status_code=500, detail=f"Failed to retrieve entity: {str(e)}")
+    if result is None:
+        raise HTTPException(status_code=404, detail=f"Entity with ID {entity_id} not found")
+    return {**result, "page": page, "page_size": page_size}
+
+@app.get("/api/topics/neighbors", response_model=TopicNeighborsResponse)
+async def get_topic_neighbors(
+    name: str = Query(..., min_length=1, max_length=200),
+    limit: int = Query(20, ge=1, le=100),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Topics linked to a topic in the related-topic graph
+    
+    - related: topics suggested by quizzes on this article
+    - referenced_by: articles whose quizzes suggest this topic
+    """
+    try:
+        result = await db.run_sync(topic_index.neighbors, name, limit)
+    except Exception as e:
+        logger.error(f"Error retrieving neighbors of topic '{name}': {e}")
+        raise HTTPException(status_code=500, detail=f"Failed to retrieve topic: {str(e)}")
+    if result is None:
+        raise HTTPException(status_code=404, detail=f"Topic '{name}' not found")
+    return result
+
+@app.get("/api/topics/top", response_model=List[TopicResult])
+async def get_top_topics(
+    limit: int = Query(20, ge=1, le=100),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Most connected topics (by number of distinct linked topics)
+    """
+    try:
+        return await db.run_sync(topic_index.most_connected, limit)
+    except Exception as e:
+        logger.error(f"Error retrieving top topics: {e}")
+        raise HTTPException(status_code=500, detail=f"Failed to retrieve topics: {str(e)}")
+
 # Endpoint 3: /api/quiz/{quiz_id} (GET)
 @app.get("/api/quiz/{quiz_id}", response_model=QuizDetailResponse)
-async def get_quiz_by_id(quiz_id: int, db: Session = Depends(get_db)):
+async def get_quiz_by_id(quiz_id: int, db: AsyncSession = Depends(get_async_db)):
     """
     Get a specific quiz by ID
     
@@ -255,47 +503,36 @@ async def get_quiz_by_id(quiz_id: int, db: Session = Depends(get_db)):
         logger.info(f"Fetching quiz with ID: {quiz_id}")
         
         # Fetch quiz record by ID
-        quiz_record = db.query(Quiz).filter(Quiz.id == quiz_id).first()
+        quiz_record = await db.get(Quiz, quiz_id)
         
         if not quiz_record:
             logger.warning(f"Quiz with ID {quiz_id} not found")
             raise HTTPException(status_code=404, detail=f"Quiz with ID {quiz_id} not found")
         
-        # CRUCIAL: Deserialize the full_quiz_data text field back into a Python dictionary/JSON object
-        try:
-            quiz_data = json.loads(quiz_record.full_quiz_data)
-            logger.info(f"Successfully deserialized quiz data for ID {quiz_id}")
-        except json.JSONDecodeError as e:
-            logger.error(f"Failed to deserialize quiz data for ID {quiz_id}: {e}")
-            raise HTTPException(status_code=500, detail=f"Quiz data is corrupted for ID {quiz_id}")
+        # Loading and decompressing the content blob is sync ORM work, so run it via run_sync
+        full_quiz_data = await db.run_sync(lambda session: quiz_record.full_quiz_data)
         
-        # Validate deserialized data
+        # Validate the stored quiz JSON in a single parse; the response then reuses the stored bytes
         try:
-            validated_quiz = QuizOutput(**quiz_data)
+            validated_quiz = QuizOutput.model_validate_json(full_quiz_data)
         except Exception as e:
             logger.error(f"Quiz data validation failed for ID {quiz_id}: {e}")
             raise HTTPException(status_code=500, detail=f"Quiz data is invalid for ID {quiz_id}")
         
-        # Deserialize user answers if they exist
+        # Deserialize user answers if they exist (answers still in the write-behind buffer win)
         user_answers = None
-        if quiz_record.user_answers:
+        stored_answers = (answer_buffer and answer_buffer.pending_answers(quiz_id)) or quiz_record.user_answers
+        if stored_answers:
             try:
-                user_answers = json.loads(quiz_record.user_answers)
+                user_answers = json.loads(stored_answers)
             except json.JSONDecodeError:
                 logger.warning(f"Failed to deserialize user answers for quiz {quiz_id}")
         
+        logger.info(f"Successfully retrieved quiz {quiz_id} with {len(validated_quiz.quiz)} questions")
         # Return complete quiz data
-        response_data = {
-            "id": quiz_record.id,
-            "url": quiz_record.url,
-            "title": quiz_record.title,
-            "date_generated": quiz_record.date_generated,
-            "user_answers": user_answers,
-            **quiz_data  # Include deserialized quiz data
-        }
-        
-        logger.info(f"Successfully retrieved quiz {quiz_id} with {len(quiz_data['quiz'])} questions")
-        return response_data
+        return quiz_response(
+            quiz_record.id, quiz_record.url, quiz_record.title, quiz_record.date_generated, full_quiz_data, user_answers
+        )
         
     except HTTPException:
         # Re-raise HTTP exceptions
@@ -304,6 +541,75 @@ async def get_quiz_by_id(quiz_id: int, db: Session = Depends(get_db)):
         logger.error(f"Unexpected error fetching quiz {quiz_id}: {e}")
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
+@app.post("/api/quiz/{quiz_id}/refresh", response_model=RefreshQuizResponse)
+async def refresh_quiz(quiz_id: int, http_request: Request):
+    """
+    Refresh a quiz after its Wikipedia article was edited
+    
+    - Shares generation slots with /api/generate-quiz (same 503/429 rejections)
+    - Re-scrapes the article (bypassing the scrape cache) and diffs it with the stored text passage by passage
+    - Keeps questions whose supporting passages are unchanged; the LLM only writes replacements from the changed passages
+    - Falls back to full regeneration when most of the article changed
+    - Saves the result as a new quiz (the original keeps its answers and stats); an unchanged article returns the original
+    - `refresh` in the response reports the mode and how many questions were reused
+    """
+    async with generate_admission.admit(client_id(http_request)):
+        return await _refresh_quiz(quiz_id)
+
+async def _refresh_quiz(quiz_id: int):
+    """refresh_quiz once admitted; database sessions are held only to read the quiz and to save the result"""
+    try:
+        async with AsyncSessionLocal() as db:
+            quiz_record = await db.get(Quiz, quiz_id)
+            if not quiz_record:
+                raise HTTPException(status_code=404, detail=f"Quiz with ID {quiz_id} not found")
+            old_text, full_quiz_data = await db.run_sync(lambda session: (quiz_record.scraped_content, quiz_record.full_quiz_data))
+        
+        try:
+            clean_text, article_title = await run_in_threadpool(scrape_wikipedia, quiz_record.url)
+        except Exception as e:
+            logger.error(f"Scraping failed for {quiz_record.url}: {e}")
+            raise HTTPException(status_code=400, detail=f"Failed to scrape Wikipedia article: {str(e)}")
+        
+        try:
+            # The first call builds the Gemini client, so keep it off the event loop too
+            quiz_data, stats = await run_in_threadpool(
+                lambda: refresh.refresh_quiz(get_quiz_generator(), old_text, clean_text, article_title, json.loads(full_quiz_data))
+            )
+            with metrics.stage("validate"):
+                validated_quiz = QuizOutput(**quiz_data)
+        except Exception as e:
+            logger.error(f"Quiz refresh failed for {quiz_id}: {e}")
+            raise HTTPException(status_code=500, detail=f"Failed to refresh quiz: {str(e)}")
+        stats["refreshed_from"] = quiz_id
+        
+        if stats["mode"] == "unchanged":
+            return quiz_response(
+                quiz_record.id, quiz_record.url, quiz_record.title, quiz_record.date_generated, full_quiz_data, extra={"refresh": stats}
+            )
+        
+        quiz_json = validated_quiz.model_dump_json()
+        try:
+            with metrics.stage("db"):
+                async with AsyncSessionLocal() as db:
+                    new_record = await db.run_sync(save_quiz, quiz_record.url, article_title, clean_text, validated_quiz, quiz_json)
+                    await db.commit()
+            answer_keys.put(AnswerKey.from_questions(new_record.id, quiz_data["quiz"]))
+        except Exception as e:
+            logger.error(f"Database save failed: {e}")
+            raise HTTPException(status_code=500, detail=f"Failed to save quiz to database: {str(e)}")
+        
+        logger.info(f"Refreshed quiz {quiz_id} as {new_record.id}: {stats['mode']}, {stats['reused_questions']} questions reused")
+        return quiz_response(
+            new_record.id, new_record.url, new_record.title, new_record.date_generated, quiz_json, extra={"refresh": stats}
+        )
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Unexpected error refreshing quiz {quiz_id}: {e}")
+        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+
 # Additional utility endpoints
 
 @app.get("/health")
@@ -311,21 +617,18 @@ async def health_check():
     """Detailed health check endpoint"""
     try:
         # Test database connection
-        db = next(get_db())
-        db.execute("SELECT 1")
-        db.close()
+        async with AsyncSessionLocal() as db:
+            await db.execute(text("SELECT 1"))
         
-        # Test LLM connection (if API key is set)
-        try:
-            quiz_generator = get_quiz_generator()
-            llm_status = "ready" if quiz_generator.test_connection() else "api_key_needed"
-        except Exception:
-            llm_status = "api_key_needed"
+        # Test LLM connection (if API key is set; cached across workers)
+        llm = await run_in_threadpool(llm_status)
         
         return {
             "status": "healthy",
             "database": "connected",
-            "llm": llm_status,
+            "llm": llm,
+            "shared_cache": await run_in_threadpool(shared_cache.stats) if shared_cache is not None else "disabled",
+            "generation": generate_admission.stats(),
             "timestamp": datetime.utcnow().isoformat()
         }
     except Exception as e:
@@ -336,54 +639,145 @@ async def health_check():
         }
 
 @app.get("/stats")
-async def get_stats(db: Session = Depends(get_db)):
-    """Get basic statistics about generated quizzes"""
+async def get_stats(days: int = Query(30, ge=1, le=366), db: AsyncSession = Depends(get_async_db)):
+    """
+    Get statistics about generated quizzes and submitted answers
+    
+    - Reads incrementally maintained aggregates (no table scans)
+    - Includes totals, accuracy by difficulty, a score histogram and per-day counts for the last `days` days
+    """
     try:
-        total_quizzes = db.query(Quiz).count()
+        stats = await db.run_sync(analytics.get_stats, days)
         
         return {
-            "total_quizzes": total_quizzes,
+            **stats,
             "timestamp": datetime.utcnow().isoformat()
         }
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to get stats: {str(e)}")
 
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """
+    Prometheus metrics for this process
+    
+    - Request counts and latency by route, per-stage latency histograms (fetch, parse, extract,
+      clean, llm, llm_parse, validate, db), LLM calls and tokens, cache hit/miss counts, and
+      admission queue depth, waits and rejections
+    """
+    if not metrics.METRICS_ENABLED:
+        raise HTTPException(status_code=404, detail="Metrics are disabled (set METRICS_ENABLED=true)")
+    return PlainTextResponse(metrics.registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@app.get("/api/admin/profiles", dependencies=[Depends(profiling.require_admin)])
+async def list_profiles():
+    """
+    List captured request profiles (admin only, X-Admin-Token header)
+    
+    - Newest first, with URL, article size, stage timings and file size
+    - Capture a profile by sending `X-Profile: sampling|cprofile` with the admin token, or set PROFILE_SAMPLE_RATE
+    """
+    profiles = await run_in_threadpool(profiling.list_profiles)
+    return {"profiles": profiles}
+
+@app.get("/api/admin/profiles/{profile_id}", dependencies=[Depends(profiling.require_admin)])
+async def download_profile(profile_id: str):
+    """Download a captured profile (speedscope JSON or pstats file; admin only)"""
+    path = await run_in_threadpool(profiling.profile_path, profile_id)
+    if path is None:
+        raise HTTPException(status_code=404, detail=f"Profile {profile_id} not found")
+    return FileResponse(path, filename=os.path.basename(path))
+
+@app.get("/api/quiz/{quiz_id}/stats")
+async def get_quiz_stats(quiz_id: int, db: AsyncSession = Depends(get_async_db)):
+    """Get per-question attempts and correctness rates for a quiz"""
+    try:
+        questions = await db.run_sync(analytics.get_question_stats, quiz_id)
+        
+        return {
+            "quiz_id": quiz_id,
+            "questions": questions
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to get quiz stats: {str(e)}")
+
+@app.get("/api/export", dependencies=[Depends(profiling.require_admin)])
+async def export_quizzes(
+    compress: bool = Query(False, description="zstd-compress the stream"),
+    include_content: bool = Query(True, description="Include the scraped article text")
+):
+    """
+    Export all quizzes as NDJSON (one quiz per line; admin only, X-Admin-Token header)
+    
+    - Streams rows through a server-side cursor, so memory use is constant for any table size
+    - Import the file with `python transfer.py import <file>`
+    """
+    def stream():
+        stats = transfer.TransferStats()
+        with SessionLocal() as session:
+            yield from transfer.export_quizzes(session, include_content=include_content, stats=stats)
+        logger.info(f"Exported {stats.summary()}")
+    
+    chunks = transfer.zstd_stream(stream()) if compress else stream()
+    filename = f"quizzes-{datetime.utcnow():%Y%m%d-%H%M%S}.ndjson" + (".zst" if compress else "")
+    return StreamingResponse(
+        chunks,
+        media_type="application/zstd" if compress else "application/x-ndjson",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
 # Endpoint 4: /api/submit-answers (POST)
 @app.post("/api/submit-answers")
-async def submit_answers(request: SubmitAnswersRequest, db: Session = Depends(get_db)):
+async def submit_answers(request: SubmitAnswersRequest, db: AsyncSession = Depends(get_async_db)):
     """
-    Save user's answers for a quiz
+    Score and save user's answers for a quiz
     
     - Accepts quiz_id and answers dictionary
-    - Updates the quiz record with user's answers
-    - Returns success status
+    - Scores the answers against the stored correct answers (cached answer key)
+    - Queues the answers for the write-behind buffer (or commits them when ANSWER_WRITE_MODE=sync)
+    - Returns success status with the score and per-question results
     """
     try:
         logger.info(f"Saving answers for quiz ID: {request.quiz_id}")
         
-        # Fetch quiz record by ID
-        quiz_record = db.query(Quiz).filter(Quiz.id == request.quiz_id).first()
+        # Answer keys are cached, so the database is only touched on the first submission
+        answer_key = answer_keys.get(request.quiz_id)
+        metrics.record_cache("answer_keys", answer_key is not None)
+        if answer_key is None:
+            answer_key = await db.run_sync(load_answer_key, request.quiz_id)
         
-        if not quiz_record:
+        if answer_key is None:
             logger.warning(f"Quiz with ID {request.quiz_id} not found")
             raise HTTPException(status_code=404, detail=f"Quiz with ID {request.quiz_id} not found")
         
-        # Save user answers as JSON string
-        quiz_record.user_answers = json.dumps(request.answers)
-        db.commit()
+        graded = answer_key.grade(request.answers)
+        submission = Submission(answer_key, request.answers, graded)
+        
+        if answer_buffer is not None:
+            if not await answer_buffer.submit(submission):
+                logger.warning(f"Rejected answers for quiz {request.quiz_id}: {answer_buffer.pending_count} submissions pending and the database is not accepting writes")
+                raise HTTPException(
+                    status_code=503,
+                    detail="Server busy: answers cannot be saved right now, please retry",
+                    headers={"Retry-After": str(max(1, math.ceil(answer_buffer.flush_interval)))}
+                )
+        else:
+            await db.run_sync(write_submissions, [submission])
+            await db.commit()
         
         logger.info(f"Successfully saved answers for quiz {request.quiz_id}")
         
         return {
             "success": True,
             "message": "Answers saved successfully",
-            "quiz_id": request.quiz_id
+            "quiz_id": request.quiz_id,
+            **answer_key.score(graded)
         }
         
     except HTTPException:
         raise
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         logger.error(f"Error saving answers for quiz {request.quiz_id}: {e}")
         raise HTTPException(status_code=500, detail=f"Failed to save answers: {str(e)}")
 
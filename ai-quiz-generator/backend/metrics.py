@@ -0,0 +1,280 @@
+"""
+Request metrics and per-stage timing
+Prometheus-format counters and histograms, stage spans and a Server-Timing header middleware
+"""
+import bisect
+import contextvars
+import os
+import threading
+import time
+from contextlib import nullcontext
+from typing import Dict, List, Optional, Sequence, Tuple
+
+# Disabled metrics cost one flag check per call site: stage() returns a shared no-op
+# context manager and the Server-Timing middleware is not installed
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() in ("1", "true", "yes")
+
+# Seconds; covers everything from a cached lookup to a slow LLM call
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+# Tokens per LLM call
+TOKEN_BUCKETS = (0, 256, 512, 1024, 2048, 4096, 8192, 16384)
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+class Counter:
+    """Monotonic counter with optional labels"""
+
+    type_name = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, *labels: str) -> None:
+        if not METRICS_ENABLED:
+            return
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, *labels: str) -> float:
+        return self._values.get(labels, 0)
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, labels)} {value:g}" for labels, value in items]
+
+class Gauge(Counter):
+    """Current value with optional labels (e.g. a queue depth)"""
+
+    type_name = "gauge"
+
+    def set(self, value: float, *labels: str) -> None:
+        if not METRICS_ENABLED:
+            return
+        with self._lock:
+            self._values[labels] = value
+
+class Histogram:
+    """Cumulative histogram with optional labels"""
+
+    type_name = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        # labels -> [per-bucket counts (last one is +Inf), sum, count]
+        self._values: Dict[Tuple[str, ...], list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, amount: float, *labels: str) -> None:
+        if not METRICS_ENABLED:
+            return
+        index = bisect.bisect_left(self.buckets, amount)
+        with self._lock:
+            value = self._values.get(labels)
+            if value is None:
+                value = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            value[0][index] += 1
+            value[1] += amount
+            value[2] += 1
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            items = sorted((labels, [list(value[0]), value[1], value[2]]) for labels, value in self._values.items())
+        lines = []
+        for labels, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                bucket_labels = _format_labels(self.labelnames, labels, 'le="' + le + '"')
+                lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, labels)} {total:g}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, labels)} {count}")
+        return lines
+
+class Registry:
+    """Collection of metrics rendered together in the Prometheus text format"""
+
+    def __init__(self):
+        self._metrics: List = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        """Render all metrics in the Prometheus text exposition format (version 0.0.4)"""
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.type_name}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+# Global registry and metrics (per process - each worker exposes its own)
+registry = Registry()
+
+http_requests = registry.counter("http_requests_total", "HTTP requests by route and status", ("method", "route", "status"))
+http_request_duration = registry.histogram("http_request_duration_seconds", "HTTP request latency by route", ("method", "route"))
+stage_duration = registry.histogram("quiz_stage_duration_seconds", "Time spent in each processing stage", ("stage",))
+stage_errors = registry.counter("quiz_stage_errors_total", "Processing stages that raised an exception", ("stage",))
+llm_requests = registry.counter("llm_requests_total", "LLM calls by outcome", ("outcome",))
+llm_tokens = registry.counter("llm_tokens_total", "LLM tokens by type (prompt, response, cached)", ("type",))
+llm_cached_tokens = registry.histogram("llm_cached_input_tokens", "Input tokens per LLM call served from the prompt cache instead of billed in full", buckets=TOKEN_BUCKETS)
+refresh_questions = registry.counter("quiz_refresh_questions_total", "Questions in refreshed quizzes by source (reused or generated)", ("source",))
+admission_active = registry.gauge("admission_active_requests", "Admitted requests running now by pool", ("pool",))
+admission_queued = registry.gauge("admission_queued_requests", "Requests waiting for admission by pool", ("pool",))
+admission_rejections = registry.counter("admission_rejections_total", "Requests shed by admission control by pool and reason", ("pool", "reason"))
+admission_wait = registry.histogram("admission_wait_seconds", "Time admitted requests spent queued", ("pool",))
+cache_requests = registry.counter("cache_requests_total", "Cache lookups by cache and result (hit or miss)", ("cache", "result"))
+
+# Stage timings of the current request, read by the Server-Timing middleware. The list is
+# created per request and mutated in place, so stages recorded in worker threads
+# (run_in_threadpool copies the context, not the list) are still visible.
+_request_spans: contextvars.ContextVar[Optional[List[Tuple[str, float]]]] = contextvars.ContextVar("request_spans", default=None)
+
+class _Stage:
+    """Times a block, recording it in the stage histogram and the current request's spans"""
+
+    __slots__ = ("name", "started")
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __enter__(self) -> "_Stage":
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        elapsed = time.perf_counter() - self.started
+        stage_duration.observe(elapsed, self.name)
+        if exc_type is not None:
+            stage_errors.inc(1, self.name)
+        spans = _request_spans.get()
+        if spans is not None:
+            spans.append((self.name, elapsed))
+
+_NOOP_STAGE = nullcontext()
+
+def stage(name: str):
+    """
+    Time a processing stage.
+
+    Usage:
+        with metrics.stage("fetch"):
+            response = requests.get(url)
+
+    Args:
+        name (str): Stage name (used as the histogram label and the Server-Timing metric name)
+
+    Returns:
+        Context manager (a shared no-op when metrics are disabled)
+    """
+    if not METRICS_ENABLED:
+        return _NOOP_STAGE
+    return _Stage(name)
+
+def record_cache(cache: str, hit: bool) -> None:
+    """Count a cache lookup"""
+    cache_requests.inc(1, cache, "hit" if hit else "miss")
+
+def record_llm_usage(usage: Optional[Dict]) -> None:
+    """
+    Count LLM tokens from a LangChain usage_metadata dict.
+
+    Args:
+        usage (Optional[Dict]): AIMessage.usage_metadata (input_tokens, output_tokens,
+            input_token_details.cache_read); cache reads are also recorded per call
+    """
+    if not usage:
+        return
+    llm_tokens.inc(usage.get("input_tokens", 0), "prompt")
+    llm_tokens.inc(usage.get("output_tokens", 0), "response")
+    cached = (usage.get("input_token_details") or {}).get("cache_read", 0)
+    if cached:
+        llm_tokens.inc(cached, "cached")
+    llm_cached_tokens.observe(cached)
+
+def current_spans() -> List[Tuple[str, float]]:
+    """Stage timings recorded so far in the current request"""
+    return list(_request_spans.get() or [])
+
+def server_timing_header(spans: List[Tuple[str, float]], total: float) -> str:
+    """
+    Format stage timings as a Server-Timing header value.
+
+    Repeated stages (e.g. one per retry) are summed.
+
+    Args:
+        spans (List[Tuple[str, float]]): (stage, seconds) in recording order
+        total (float): Total request time in seconds
+
+    Returns:
+        str: e.g. 'fetch;dur=412.3, llm;dur=5120.9, total;dur=5601.0'
+    """
+    durations: Dict[str, float] = {}
+    for name, elapsed in spans:
+        durations[name] = durations.get(name, 0.0) + elapsed
+    entries = [f"{name};dur={1000 * elapsed:.1f}" for name, elapsed in durations.items()]
+    entries.append(f"total;dur={1000 * total:.1f}")
+    return ", ".join(entries)
+
+class ServerTimingMiddleware:
+    """
+    Pure ASGI middleware: collects stage spans per request, adds a Server-Timing header
+    and records request counts and latency by route template.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        spans: List[Tuple[str, float]] = []
+        token = _request_spans.set(spans)
+        started = time.perf_counter()
+        status = "500"
+
+        async def send_with_timing(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = str(message["status"])
+                header = server_timing_header(spans, time.perf_counter() - started)
+                message["headers"] = list(message.get("headers", [])) + [(b"server-timing", header.encode("latin-1"))]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _request_spans.reset(token)
+            route = scope.get("route")
+            # Route templates keep the label set bounded; unmatched paths share one label
+            path = getattr(route, "path", None) or "unmatched"
+            http_requests.inc(1, scope["method"], path, status)
+            http_request_duration.observe(time.perf_counter() - started, scope["method"], path)
@@ -0,0 +1,123 @@
+"""
+Quiz persistence
+Saves new quizzes together with their compressed content, analytics and search index entries
+"""
+import json
+from datetime import datetime
+from typing import List, Optional
+
+from sqlalchemy.orm import Session
+
+import analytics
+import search_index
+import topic_index
+from content_store import ARTICLE, QUIZ, store_contents
+from database import Quiz, begin_write
+from models import QuizOutput
+from scoring import AnswerKey
+
+class NewQuiz:
+    """A validated quiz waiting to be saved"""
+
+    __slots__ = ("url", "title", "scraped_content", "quiz", "quiz_json", "date_generated", "user_answers")
+
+    def __init__(
+        self,
+        url: str,
+        title: str,
+        scraped_content: Optional[str],
+        quiz: QuizOutput,
+        date_generated: Optional[datetime] = None,
+        user_answers: Optional[str] = None,
+        quiz_json: Optional[str] = None
+    ):
+        self.url = url
+        self.title = title
+        self.scraped_content = scraped_content
+        self.quiz = quiz
+        # Stored as-is and reused for API responses, so it must be quiz.model_dump_json()
+        self.quiz_json = quiz_json if quiz_json is not None else quiz.model_dump_json()
+        self.date_generated = date_generated
+        self.user_answers = user_answers
+
+def save_quizzes(session: Session, new_quizzes: List[NewQuiz]) -> List[Quiz]:
+    """
+    Insert quizzes in the current transaction.
+
+    Content blobs, quiz rows, analytics and search index entries are each written with a
+    few batched statements, so saving a thousand quizzes costs about as many round trips
+    as saving one.
+
+    Args:
+        session (Session): Database session
+        new_quizzes (List[NewQuiz]): Quizzes to save
+
+    Returns:
+        List[Quiz]: Saved records in the same order (flushed, so ids are set)
+    """
+    if not new_quizzes:
+        return []
+
+    # Content lookups read before the inserts write; on SQLite, hold the write lock throughout
+    begin_write(session)
+    quiz_blobs = store_contents(session, QUIZ, [new_quiz.quiz_json for new_quiz in new_quizzes])
+    articles = [new_quiz.scraped_content for new_quiz in new_quizzes if new_quiz.scraped_content is not None]
+    article_blobs = iter(store_contents(session, ARTICLE, articles) if articles else [])
+
+    records = []
+    for new_quiz, quiz_blob in zip(new_quizzes, quiz_blobs):
+        record = Quiz(
+            url=new_quiz.url,
+            title=new_quiz.title,
+            user_answers=new_quiz.user_answers,
+            quiz_content=quiz_blob,
+            # Content lives in content_blobs; keep the legacy columns empty
+            scraped_content_legacy=None,
+            full_quiz_data_legacy=""
+        )
+        if new_quiz.scraped_content is not None:
+            record.article_content = next(article_blobs)
+        if new_quiz.date_generated is not None:
+            record.date_generated = new_quiz.date_generated
+        records.append(record)
+    session.add_all(records)
+    session.flush()
+
+    aggregates = analytics.AnalyticsBatch()
+    documents = []
+    for record, new_quiz in zip(records, new_quizzes):
+        quiz_data = new_quiz.quiz.model_dump(mode="json")
+        aggregates.quiz_created(len(new_quiz.quiz.quiz), record.date_generated)
+        if record.user_answers:
+            # Imported answers count as one submission, as in analytics.rebuild()
+            answer_key = AnswerKey.from_questions(record.id, quiz_data["quiz"])
+            aggregates.submission(answer_key, answer_key.grade(json.loads(record.user_answers)), record.date_generated)
+        documents.append((record.id, record.title, quiz_data))
+    aggregates.apply(session)
+    search_index.index_quizzes(session, documents)
+    topic_index.index_quizzes(session, documents)
+    return records
+
+def save_quiz(
+    session: Session,
+    url: str,
+    title: str,
+    scraped_content: Optional[str],
+    quiz: QuizOutput,
+    quiz_json: Optional[str] = None
+) -> Quiz:
+    """
+    Insert a newly generated quiz in the current transaction.
+
+    Args:
+        session (Session): Database session
+        url (str): Wikipedia article URL
+        title (str): Article title
+        scraped_content (Optional[str]): Scraped article text
+        quiz (QuizOutput): Validated quiz
+        quiz_json (Optional[str]): quiz.model_dump_json(), if the caller already has it
+
+    Returns:
+        Quiz: Saved record (flushed, so its id is set)
+    """
+    return save_quizzes(session, [NewQuiz(url, title, scraped_content, quiz, quiz_json=quiz_json)])[0]
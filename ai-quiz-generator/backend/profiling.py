@@ -0,0 +1,358 @@
+"""
+On-demand request profiling
+Captures sampling (speedscope JSON) or deterministic (cProfile pstats) profiles of individual
+requests, triggered by an admin header or a sampling rate, and stores them with bounded retention
+"""
+import contextvars
+import cProfile
+import json
+import logging
+import os
+import pstats
+import random
+import secrets
+import sys
+import threading
+import time
+from datetime import datetime
+from functools import partial
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+from fastapi import Header, HTTPException
+from starlette.concurrency import run_in_threadpool as _starlette_run_in_threadpool
+
+import metrics
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Admin endpoints and header-triggered profiles are disabled unless ADMIN_TOKEN is set
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+# Fraction of PROFILE_PATHS requests profiled without a header (0 disables sampling)
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_PATHS = tuple(path.strip() for path in os.getenv("PROFILE_PATHS", "/api/generate-quiz").split(",") if path.strip())
+PROFILE_MODE = os.getenv("PROFILE_MODE", "sampling")  # "sampling" (speedscope) or "cprofile" (pstats)
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "5"))
+PROFILE_DIR = os.getenv("PROFILE_DIR", "./profiles")
+PROFILE_MAX_FILES = int(os.getenv("PROFILE_MAX_FILES", "50"))
+PROFILE_MAX_BYTES = int(os.getenv("PROFILE_MAX_BYTES", str(200 * 1024 * 1024)))
+
+MODES = ("sampling", "cprofile")
+PROFILE_HEADER = "x-profile"          # Value: "1" (default mode), "sampling" or "cprofile"
+ADMIN_TOKEN_HEADER = "x-admin-token"
+MAX_BODY_CAPTURE = 64 * 1024          # Request body bytes kept to extract the article URL
+
+Frame = Tuple[str, str, int]  # (qualified name, file, first line)
+
+class Capture:
+    """Profile of one request: collects samples or cProfile data plus metadata"""
+
+    def __init__(self, mode: str, path: str, trigger: str):
+        self.id = f"{datetime.utcnow():%Y%m%d-%H%M%S}-{secrets.token_hex(4)}"
+        self.mode = mode
+        self.metadata: Dict[str, Any] = {
+            "id": self.id,
+            "mode": mode,
+            "path": path,
+            "trigger": trigger,
+            "created_at": datetime.utcnow().isoformat(),
+        }
+        self.started = time.perf_counter()
+        self.request_frame = None             # Middleware frame on the event loop thread
+        self.loop_thread = threading.get_ident()
+        self.worker_threads: Set[int] = set()
+        self.samples: Dict[int, List[Tuple[List[int], float]]] = {}  # thread -> [(stack, weight_ms)]
+        self.frames: List[Frame] = []
+        self._frame_index: Dict[Frame, int] = {}
+        self.profilers: List[cProfile.Profile] = []
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._sampler: Optional[threading.Thread] = None
+
+    # Sampling mode: a background thread walks the stacks of the request's threads.
+    # On the event loop thread only stacks that pass through this request's middleware
+    # frame are kept, so concurrent requests do not pollute the profile. Sync ORM work run
+    # through AsyncSession.run_sync executes in a greenlet whose stack is not linked to the
+    # request frame, so it only shows up in cprofile captures (and in the db stage timing).
+
+    def start(self) -> None:
+        if self.mode == "sampling":
+            self._sampler = threading.Thread(target=self._sample_loop, name=f"profiler-{self.id}", daemon=True)
+            self._sampler.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._sampler is not None:
+            self._sampler.join()
+        self.metadata["duration_ms"] = round(1000 * (time.perf_counter() - self.started), 1)
+
+    def _frame_id(self, frame) -> int:
+        code = frame.f_code
+        key = (getattr(code, "co_qualname", code.co_name), code.co_filename, code.co_firstlineno)
+        index = self._frame_index.get(key)
+        if index is None:
+            index = self._frame_index[key] = len(self.frames)
+            self.frames.append(key)
+        return index
+
+    def _stack(self, frame, stop_at=None) -> Optional[List[int]]:
+        """Frame ids root-first; with stop_at, None unless stop_at is on the stack"""
+        stack = []
+        while frame is not None:
+            stack.append(self._frame_id(frame))
+            if frame is stop_at:
+                return stack[::-1]
+            frame = frame.f_back
+        return None if stop_at is not None else stack[::-1]
+
+    def _sample_loop(self) -> None:
+        interval = PROFILE_INTERVAL_MS / 1000
+        last = time.perf_counter()
+        while not self._stop.wait(interval):
+            now = time.perf_counter()
+            weight = 1000 * (now - last)
+            last = now
+            frames = sys._current_frames()
+            with self._lock:
+                threads = [(self.loop_thread, self.request_frame)] + [(ident, None) for ident in self.worker_threads]
+            for ident, stop_at in threads:
+                frame = frames.get(ident)
+                if frame is None:
+                    continue
+                stack = self._stack(frame, stop_at)
+                if stack:
+                    self.samples.setdefault(ident, []).append((stack, weight))
+
+    # Worker threads (run_in_threadpool) register themselves for the duration of the call
+
+    def enter_thread(self) -> Optional[cProfile.Profile]:
+        with self._lock:
+            self.worker_threads.add(threading.get_ident())
+        if self.mode == "cprofile":
+            profiler = cProfile.Profile()
+            profiler.enable()
+            return profiler
+        return None
+
+    def exit_thread(self, profiler: Optional[cProfile.Profile]) -> None:
+        if profiler is not None:
+            profiler.disable()
+            with self._lock:
+                self.profilers.append(profiler)
+        with self._lock:
+            self.worker_threads.discard(threading.get_ident())
+
+    def annotate(self, **fields: Any) -> None:
+        self.metadata.update(fields)
+
+    def _speedscope(self) -> Dict[str, Any]:
+        profiles = []
+        for ident, samples in self.samples.items():
+            role = "event loop" if ident == self.loop_thread else "worker"
+            profiles.append({
+                "type": "sampled",
+                "name": f"{role} thread {ident}",
+                "unit": "milliseconds",
+                "startValue": 0,
+                "endValue": sum(weight for _, weight in samples),
+                "samples": [stack for stack, _ in samples],
+                "weights": [weight for _, weight in samples],
+            })
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "name": f"{self.metadata['path']} {self.metadata.get('article_url', '')}".strip(),
+            "exporter": "ai-quiz-generator profiling.py",
+            "shared": {"frames": [{"name": name, "file": file, "line": line} for name, file, line in self.frames]},
+            "profiles": profiles,
+        }
+
+    def save(self, directory: str = PROFILE_DIR) -> str:
+        """
+        Write the profile and its metadata to disk, then enforce retention.
+
+        Returns:
+            str: Path of the profile file
+        """
+        os.makedirs(directory, exist_ok=True)
+        if self.mode == "sampling":
+            filename = f"{self.id}.speedscope.json"
+            with open(os.path.join(directory, filename), "w") as f:
+                json.dump(self._speedscope(), f)
+            self.metadata["samples"] = sum(len(samples) for samples in self.samples.values())
+        else:
+            filename = f"{self.id}.pstats"
+            if self.profilers:
+                stats = pstats.Stats(self.profilers[0])
+                for profiler in self.profilers[1:]:
+                    stats.add(profiler)
+                stats.dump_stats(os.path.join(directory, filename))
+            else:
+                open(os.path.join(directory, filename), "wb").close()
+
+        self.metadata["file"] = filename
+        self.metadata["size_bytes"] = os.path.getsize(os.path.join(directory, filename))
+        with open(os.path.join(directory, f"{self.id}.meta.json"), "w") as f:
+            json.dump(self.metadata, f, indent=2, default=str)
+        enforce_retention(directory)
+        return os.path.join(directory, filename)
+
+# Profile of the current request (propagated into run_in_threadpool workers)
+_active_capture: contextvars.ContextVar[Optional[Capture]] = contextvars.ContextVar("active_capture", default=None)
+# At most one capture at a time keeps the overhead bounded and cProfile usable
+_capture_lock = threading.Lock()
+
+def annotate(**fields: Any) -> None:
+    """Add metadata (e.g. article_url, article_chars) to the current request's profile, if any"""
+    capture = _active_capture.get()
+    if capture is not None:
+        capture.annotate(**fields)
+
+def _run_registered(capture: Capture, func: Callable, *args, **kwargs):
+    profiler = capture.enter_thread()
+    try:
+        return func(*args, **kwargs)
+    finally:
+        capture.exit_thread(profiler)
+
+async def run_in_threadpool(func: Callable, *args, **kwargs):
+    """starlette.concurrency.run_in_threadpool that includes the worker thread in an active profile"""
+    capture = _active_capture.get()
+    if capture is None:
+        return await _starlette_run_in_threadpool(func, *args, **kwargs)
+    return await _starlette_run_in_threadpool(partial(_run_registered, capture, func), *args, **kwargs)
+
+def _requested_mode(headers: Dict[bytes, bytes]) -> Optional[str]:
+    """Profile mode requested by an authorized admin header, if any"""
+    value = headers.get(PROFILE_HEADER.encode())
+    if value is None or not ADMIN_TOKEN:
+        return None
+    token = headers.get(ADMIN_TOKEN_HEADER.encode(), b"")
+    if not secrets.compare_digest(token, ADMIN_TOKEN.encode()):
+        return None
+    mode = value.decode("latin-1").strip().lower()
+    return mode if mode in MODES else PROFILE_MODE
+
+class ProfilingMiddleware:
+    """Pure ASGI middleware that profiles requests selected by header or sampling rate"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope.get("headers") or [])
+        mode = _requested_mode(headers)
+        trigger = "header"
+        if mode is None and PROFILE_SAMPLE_RATE > 0 and scope["path"] in PROFILE_PATHS and random.random() < PROFILE_SAMPLE_RATE:
+            mode, trigger = PROFILE_MODE, "sampled"
+        if mode is None or not _capture_lock.acquire(blocking=False):
+            await self.app(scope, receive, send)
+            return
+
+        capture = Capture(mode, scope["path"], trigger)
+        capture.request_frame = sys._getframe()
+        token = _active_capture.set(capture)
+        body = bytearray()
+
+        async def receive_with_capture():
+            message = await receive()
+            if message["type"] == "http.request" and len(body) < MAX_BODY_CAPTURE:
+                body.extend(message.get("body", b"")[:MAX_BODY_CAPTURE - len(body)])
+            return message
+
+        async def send_with_id(message):
+            if message["type"] == "http.response.start":
+                capture.annotate(status=message["status"])
+                message["headers"] = list(message.get("headers", [])) + [(b"x-profile-id", capture.id.encode())]
+            await send(message)
+
+        profiler = None
+        try:
+            if mode == "cprofile":
+                profiler = cProfile.Profile()
+                profiler.enable()
+            capture.start()
+            await self.app(scope, receive_with_capture, send_with_id)
+        finally:
+            if profiler is not None:
+                profiler.disable()
+                capture.profilers.append(profiler)
+            capture.stop()
+            _active_capture.reset(token)
+            # Stage timings recorded by metrics.ServerTimingMiddleware (outer middleware)
+            capture.annotate(stages_ms={name: round(1000 * elapsed, 1) for name, elapsed in metrics.current_spans()})
+            if "article_url" not in capture.metadata:
+                try:
+                    capture.annotate(article_url=json.loads(bytes(body)).get("url"))
+                except (ValueError, AttributeError):
+                    pass
+            try:
+                path = await _starlette_run_in_threadpool(capture.save)
+                logger.info(f"Saved {mode} profile of {scope['path']} to {path}")
+            except Exception as e:
+                logger.error(f"Failed to save profile {capture.id}: {e}")
+            finally:
+                _capture_lock.release()
+
+def list_profiles(directory: str = PROFILE_DIR) -> List[Dict[str, Any]]:
+    """
+    Metadata of stored profiles, newest first.
+
+    Args:
+        directory (str): Profile directory
+
+    Returns:
+        List[Dict[str, Any]]: Metadata dicts (id, mode, path, article_url, stages_ms, file, ...)
+    """
+    if not os.path.isdir(directory):
+        return []
+    profiles = []
+    for name in os.listdir(directory):
+        if name.endswith(".meta.json"):
+            try:
+                with open(os.path.join(directory, name)) as f:
+                    profiles.append(json.load(f))
+            except (OSError, ValueError):
+                continue
+    return sorted(profiles, key=lambda metadata: metadata.get("created_at", ""), reverse=True)
+
+def profile_path(profile_id: str, directory: str = PROFILE_DIR) -> Optional[str]:
+    """Path of a stored profile file, or None if the id is unknown"""
+    for metadata in list_profiles(directory):
+        if metadata.get("id") == profile_id and metadata.get("file"):
+            path = os.path.join(directory, metadata["file"])
+            return path if os.path.exists(path) else None
+    return None
+
+def enforce_retention(directory: str = PROFILE_DIR, max_files: int = PROFILE_MAX_FILES, max_bytes: int = PROFILE_MAX_BYTES) -> int:
+    """
+    Delete the oldest profiles beyond the file count and total size limits.
+
+    Returns:
+        int: Number of profiles deleted
+    """
+    profiles = list_profiles(directory)
+    total = sum(metadata.get("size_bytes", 0) for metadata in profiles)
+    deleted = 0
+    while profiles and (len(profiles) > max_files or total > max_bytes):
+        oldest = profiles.pop()
+        total -= oldest.get("size_bytes", 0)
+        for name in (oldest.get("file"), f"{oldest['id']}.meta.json"):
+            if name:
+                try:
+                    os.remove(os.path.join(directory, name))
+                except OSError:
+                    pass
+        deleted += 1
+    return deleted
+
+def require_admin(x_admin_token: str = Header("")) -> None:
+    """FastAPI dependency: reject requests without the admin token"""
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Admin endpoints are disabled (set ADMIN_TOKEN)")
+    if not secrets.compare_digest(x_admin_token.encode(), ADMIN_TOKEN.encode()):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
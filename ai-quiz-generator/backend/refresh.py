@@ -0,0 +1,255 @@
+"""
+Incremental quiz regeneration
+Compares a fresh scrape with the stored article text passage by passage, keeps the questions whose
+supporting passages are unchanged and asks the LLM only for replacements drawn from the changed passages
+"""
+import difflib
+import logging
+import math
+import os
+import re
+import zlib
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+import metrics
+from llm_quiz_generator import MAX_ARTICLE_CHARS, QuizGenerator
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Share of the article (by characters, old and new text together) that may change before a
+# refresh falls back to full regeneration; past this, incremental answers cost about as much
+REFRESH_FULL_THRESHOLD = float(os.getenv("REFRESH_FULL_THRESHOLD", "0.5"))
+
+PASSAGE_MIN_CHARS = 400
+PASSAGE_MAX_CHARS = 1500
+BOUNDARY_ODDS = 4  # About one sentence in four may end a passage (once it is long enough)
+# Share of a question's terms that must occur in a passage for it to count as supporting the question
+SUPPORT_MIN_OVERLAP = 0.3
+SUPPORT_CLOSE = 0.8  # Passages scoring this share of the best one also support the question
+MIN_QUESTIONS = 5
+MAX_QUESTIONS = 10
+
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+(?=[A-Z0-9\"'(])")
+_WORD = re.compile(r"[a-z0-9]+")
+_STOPWORDS = frozenset(
+    "the and for are was were with that this from which who what when where why how its his her their "
+    "they them than then there these those has have had not but also into over under about after "
+    "before between during most more other such only some any all each been being did does one two "
+    "first following according article true false".split()
+)
+
+def split_passages(text: str) -> List[str]:
+    """
+    Split article text into passages of whole sentences.
+
+    The stored text has no headings or paragraph breaks (_clean_text collapses all whitespace),
+    so passage boundaries are content-defined instead: a passage ends after a sentence whose
+    hash selects it, once the passage has PASSAGE_MIN_CHARS, or at PASSAGE_MAX_CHARS. An edit
+    only moves the boundaries next to it, and the rest of the article splits exactly as before.
+
+    Args:
+        text (str): Clean article text
+
+    Returns:
+        List[str]: Passages in article order (joined, they give back the text up to whitespace)
+    """
+    passages = []
+    current: List[str] = []
+    size = 0
+    for sentence in _SENTENCE_END.split(text.strip()):
+        current.append(sentence)
+        size += len(sentence) + 1
+        at_boundary = zlib.crc32(sentence.encode("utf-8")) % BOUNDARY_ODDS == 0
+        if size >= PASSAGE_MAX_CHARS or (size >= PASSAGE_MIN_CHARS and at_boundary):
+            passages.append(" ".join(current))
+            current, size = [], 0
+    if current:
+        passages.append(" ".join(current))
+    return passages
+
+def _terms(text: str) -> Set[str]:
+    return {word for word in _WORD.findall(text.lower()) if len(word) > 2 and word not in _STOPWORDS}
+
+def term_weights(passage_terms: List[Set[str]]) -> Dict[str, float]:
+    """Inverse document frequency of each term over the passages (rare terms identify a passage)"""
+    counts: Dict[str, int] = {}
+    for terms in passage_terms:
+        for term in terms:
+            counts[term] = counts.get(term, 0) + 1
+    return {term: math.log((1 + len(passage_terms)) / count) for term, count in counts.items()}
+
+def supporting_passages(question: Dict[str, Any], passage_terms: List[Set[str]], weights: Dict[str, float]) -> List[int]:
+    """
+    Passages a question was most likely written from.
+
+    Scores each passage by the weighted share of the question's terms (question, answer and
+    explanation) it contains; the best passage and any close to it support the question.
+
+    Args:
+        question (Dict[str, Any]): Question in the QuizQuestion format
+        passage_terms (List[Set[str]]): _terms() of each passage
+        weights (Dict[str, float]): term_weights() of the passages
+
+    Returns:
+        List[int]: Passage indexes (empty if no passage reaches SUPPORT_MIN_OVERLAP)
+    """
+    terms = _terms(" ".join(str(question.get(field, "")) for field in ("question", "answer", "explanation")))
+    # Terms that are not in the article say nothing about where the question came from
+    term_weight = {term: weights[term] for term in terms if term in weights}
+    total = sum(term_weight.values())
+    if not total or not passage_terms:
+        return []
+    scores = [sum(term_weight[term] for term in terms & passage) / total for passage in passage_terms]
+    best = max(scores)
+    if best < SUPPORT_MIN_OVERLAP:
+        return []
+    return [index for index, score in enumerate(scores) if score >= SUPPORT_CLOSE * best]
+
+class RefreshPlan:
+    """What changed between two versions of an article, and which questions survive it"""
+
+    def __init__(self, old_text: str, new_text: str, questions: List[Dict[str, Any]]):
+        old_passages = split_passages(old_text)
+        self.passages = split_passages(new_text)
+
+        # Compare passages by content; "equal" runs are unchanged, everything else was edited
+        matcher = difflib.SequenceMatcher(None, old_passages, self.passages, autojunk=False)
+        unchanged_old: Set[int] = set()
+        self.changed: List[int] = []  # Indexes into self.passages
+        removed_chars = 0
+        for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+            if tag == "equal":
+                unchanged_old.update(range(i1, i2))
+            else:
+                self.changed.extend(range(j1, j2))
+                removed_chars += sum(len(passage) for passage in old_passages[i1:i2])
+        changed_chars = removed_chars + sum(len(self.passages[index]) for index in self.changed)
+        self.changed_fraction = changed_chars / max(1, len(old_text) + len(new_text))
+
+        # A question is dropped only when a passage it was drawn from was edited or removed.
+        # Questions that cannot be attributed to any passage are kept: nothing shows they are stale.
+        old_terms = [_terms(passage) for passage in old_passages]
+        weights = term_weights(old_terms)
+        self.kept: List[Optional[Dict[str, Any]]] = []  # None marks a question to replace
+        for question in questions:
+            support = supporting_passages(question, old_terms, weights)
+            self.kept.append(question if unchanged_old.issuperset(support) else None)
+
+    @property
+    def reused(self) -> int:
+        return sum(question is not None for question in self.kept)
+
+    @property
+    def unchanged(self) -> bool:
+        return not self.changed and self.changed_fraction == 0
+
+    def replacements_needed(self) -> int:
+        """Questions to generate: one per dropped question, enough for MIN_QUESTIONS, at most MAX_QUESTIONS"""
+        dropped = len(self.kept) - self.reused
+        return min(MAX_QUESTIONS - self.reused, max(dropped, MIN_QUESTIONS - self.reused))
+
+    def context(self) -> str:
+        """
+        Article text for the replacement questions: the changed passages, or when questions
+        were dropped without new text to replace them, passages no kept question is drawn from
+        """
+        if self.changed:
+            return " ".join(self.passages[index] for index in self.changed)
+        kept_terms = [_terms(" ".join((question["question"], question["answer"]))) for question in self.kept if question]
+        unused = [
+            passage for passage in self.passages
+            if not any(len(terms & _terms(passage)) >= SUPPORT_MIN_OVERLAP * len(terms) for terms in kept_terms if terms)
+        ]
+        return " ".join(unused or self.passages)
+
+    def merge(self, new_questions: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Kept questions in their original positions, new ones in the dropped slots and then appended"""
+        new_questions = iter(new_questions)
+        merged = []
+        for question in self.kept:
+            replacement = question if question is not None else next(new_questions, None)
+            if replacement is not None:
+                merged.append(replacement)
+        merged.extend(new_questions)
+        return merged
+
+def refresh_quiz(
+    generator: QuizGenerator,
+    old_text: Optional[str],
+    new_text: str,
+    article_title: str,
+    quiz_data: Dict[str, Any]
+) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """
+    Bring a quiz up to date with a new revision of its article.
+
+    Args:
+        generator (QuizGenerator): LLM client
+        old_text (Optional[str]): Article text the quiz was generated from (None for very old rows)
+        new_text (str): Freshly scraped article text
+        article_title (str): Article title
+        quiz_data (Dict[str, Any]): Stored quiz (QuizOutput format)
+
+    Returns:
+        Tuple[Dict[str, Any], Dict[str, Any]]: (quiz data, refresh stats) where the stats have
+            mode ("unchanged", "incremental" or "full"), reused_questions, new_questions,
+            changed_passages, total_passages, changed_fraction and llm_input_chars
+    """
+    stats = {
+        "mode": "full",
+        "reused_questions": 0,
+        "new_questions": 0,
+        "changed_passages": None,
+        "total_passages": None,
+        "changed_fraction": 1.0,
+        "llm_input_chars": min(len(new_text), MAX_ARTICLE_CHARS),  # generate_quiz sends at most this much
+    }
+    plan = None
+    if old_text:
+        with metrics.stage("diff"):
+            plan = RefreshPlan(old_text, new_text, quiz_data["quiz"])
+        stats.update(
+            changed_passages=len(plan.changed),
+            total_passages=len(plan.passages),
+            changed_fraction=round(plan.changed_fraction, 3),
+        )
+
+    if plan is not None and plan.unchanged:
+        # Same text, same passages: every question still holds and there is nothing to ask the LLM
+        stats.update(mode="unchanged", reused_questions=len(quiz_data["quiz"]), llm_input_chars=0)
+        metrics.refresh_questions.inc(stats["reused_questions"], "reused")
+        return quiz_data, stats
+
+    if plan is None or plan.changed_fraction > REFRESH_FULL_THRESHOLD or plan.reused == 0:
+        quiz_data = generator.generate_quiz(new_text, article_title)
+        stats["new_questions"] = len(quiz_data["quiz"])
+        metrics.refresh_questions.inc(stats["new_questions"], "generated")
+        return quiz_data, stats
+
+    needed = plan.replacements_needed()
+    new_questions = []
+    context = ""
+    if needed > 0:
+        context = plan.context()
+        kept_questions = [question["question"] for question in plan.kept if question is not None]
+        new_questions = generator.generate_questions(context, article_title, needed, kept_questions)
+    questions = plan.merge(new_questions)
+    if len(questions) < MIN_QUESTIONS:
+        raise ValueError(f"Refresh produced {len(questions)} questions, expected at least {MIN_QUESTIONS}")
+
+    stats.update(
+        mode="incremental",
+        reused_questions=plan.reused,
+        new_questions=len(new_questions),
+        llm_input_chars=len(context),
+    )
+    metrics.refresh_questions.inc(plan.reused, "reused")
+    metrics.refresh_questions.inc(len(new_questions), "generated")
+    logger.info(
+        f"Refreshed '{article_title}': {len(plan.changed)}/{len(plan.passages)} passages changed, "
+        f"{plan.reused} questions reused, {len(new_questions)} generated"
+    )
+    # Summary, entities, sections and related topics describe the article as a whole and are
+    # kept; a revision big enough to change them goes through full regeneration
+    return {**quiz_data, "quiz": questions}, stats
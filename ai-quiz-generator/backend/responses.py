@@ -0,0 +1,62 @@
+"""
+Pre-serialized quiz responses
+Builds quiz response bodies by splicing the stored quiz JSON instead of re-validating and re-encoding it
+"""
+from datetime import datetime
+from typing import Any, Dict, Optional, Union
+
+import orjson
+from fastapi.responses import Response
+
+class QuizJSONResponse(Response):
+    """JSON response whose body is already serialized (passed through untouched)"""
+    media_type = "application/json"
+
+def render_quiz(
+    quiz_id: int,
+    url: str,
+    title: str,
+    date_generated: datetime,
+    quiz_json: Union[str, bytes],
+    user_answers: Optional[Dict[str, str]] = None,
+    extra: Optional[Dict[str, Any]] = None
+) -> bytes:
+    """
+    Render a QuizDetailResponse body around already-serialized quiz JSON.
+
+    Args:
+        quiz_id (int): Quiz ID
+        url (str): Wikipedia article URL
+        title (str): Article title
+        date_generated (datetime): Generation time
+        quiz_json (Union[str, bytes]): QuizOutput.model_dump_json() output (as stored)
+        user_answers (Optional[Dict[str, str]]): Saved answers, if any
+        extra (Optional[Dict[str, Any]]): Additional top-level fields (e.g. refresh stats)
+
+    Returns:
+        bytes: JSON object with the record fields followed by the quiz fields
+    """
+    if isinstance(quiz_json, str):
+        quiz_json = quiz_json.encode("utf-8")
+    header = orjson.dumps({
+        "id": quiz_id,
+        "url": url,
+        "title": title,
+        "date_generated": date_generated,
+        "user_answers": user_answers,
+        **(extra or {}),
+    })
+    # Both are JSON objects: drop the header's closing brace and the quiz's opening brace
+    return header[:-1] + b"," + quiz_json.lstrip()[1:]
+
+def quiz_response(
+    quiz_id: int,
+    url: str,
+    title: str,
+    date_generated: datetime,
+    quiz_json: Union[str, bytes],
+    user_answers: Optional[Dict[str, str]] = None,
+    extra: Optional[Dict[str, Any]] = None
+) -> QuizJSONResponse:
+    """Wrap render_quiz() in a response (see render_quiz for the arguments)"""
+    return QuizJSONResponse(render_quiz(quiz_id, url, title, date_generated, quiz_json, user_answers, extra))
@@ -0,0 +1,141 @@
+"""
+Server-side quiz scoring
+Compact in-memory answer keys, so scoring never re-reads the quiz row or its large payloads
+"""
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from database import Quiz
+
+ANSWER_KEY_CACHE_SIZE = int(os.getenv("ANSWER_KEY_CACHE_SIZE", "4096"))
+
+class AnswerKey:
+    """Correct answers and difficulty levels of one quiz, in question order"""
+
+    __slots__ = ("quiz_id", "answers", "difficulties")
+
+    def __init__(self, quiz_id: int, answers: Tuple[str, ...], difficulties: Tuple[str, ...]):
+        self.quiz_id = quiz_id
+        self.answers = answers
+        self.difficulties = difficulties
+
+    @classmethod
+    def from_questions(cls, quiz_id: int, questions: List[Dict[str, Any]]) -> "AnswerKey":
+        """
+        Build an answer key from quiz questions.
+
+        Args:
+            quiz_id (int): Quiz ID
+            questions (List[Dict[str, Any]]): The "quiz" list of full_quiz_data
+
+        Returns:
+            AnswerKey: Answer key for the quiz
+        """
+        return cls(
+            quiz_id,
+            tuple(question["answer"] for question in questions),
+            tuple(question.get("difficulty", "") for question in questions)
+        )
+
+    def __len__(self) -> int:
+        return len(self.answers)
+
+    def grade(self, answers: Dict[str, str]) -> Dict[int, bool]:
+        """
+        Compare submitted answers with the correct answers.
+
+        Args:
+            answers (Dict[str, str]): Submitted answers keyed by question index ("0", "1", ...)
+
+        Returns:
+            Dict[int, bool]: Correctness per answered question index (unknown indices are ignored)
+        """
+        graded = {}
+        for key, answer in answers.items():
+            try:
+                index = int(key)
+            except ValueError:
+                continue
+            if 0 <= index < len(self.answers):
+                graded[index] = answer == self.answers[index]
+        return graded
+
+    def score(self, graded: Dict[int, bool]) -> Dict[str, Any]:
+        """
+        Summarize graded answers for the API response.
+
+        Args:
+            graded (Dict[int, bool]): Output of grade()
+
+        Returns:
+            Dict[str, Any]: Score, total, percentage and per-question results
+        """
+        correct = sum(graded.values())
+        return {
+            "score": correct,
+            "total": len(self.answers),
+            "answered": len(graded),
+            "percentage": round(100 * correct / len(self.answers), 1) if self.answers else 0.0,
+            "results": [
+                {"index": index, "correct": is_correct, "correct_answer": self.answers[index]}
+                for index, is_correct in sorted(graded.items())
+            ]
+        }
+
+class AnswerKeyCache:
+    """Thread-safe LRU cache of answer keys by quiz ID"""
+
+    def __init__(self, max_size: int = ANSWER_KEY_CACHE_SIZE):
+        self.max_size = max_size
+        self._keys: "OrderedDict[int, AnswerKey]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, quiz_id: int) -> Optional[AnswerKey]:
+        with self._lock:
+            key = self._keys.get(quiz_id)
+            if key is not None:
+                self._keys.move_to_end(quiz_id)
+            return key
+
+    def put(self, key: AnswerKey) -> None:
+        with self._lock:
+            self._keys[key.quiz_id] = key
+            self._keys.move_to_end(key.quiz_id)
+            while len(self._keys) > self.max_size:
+                self._keys.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._keys.clear()
+
+# Global cache for use in FastAPI endpoints
+answer_keys = AnswerKeyCache()
+
+def load_answer_key(session: Session, quiz_id: int) -> Optional[AnswerKey]:
+    """
+    Get a quiz's answer key, loading it from the quiz JSON blob on a cache miss.
+
+    Only the quiz JSON is loaded - the scraped article blob is never touched.
+
+    Args:
+        session (Session): Database session
+        quiz_id (int): Quiz ID
+
+    Returns:
+        Optional[AnswerKey]: Answer key, or None if the quiz does not exist
+    """
+    key = answer_keys.get(quiz_id)
+    if key is not None:
+        return key
+
+    quiz = session.get(Quiz, quiz_id)
+    if quiz is None:
+        return None
+    key = AnswerKey.from_questions(quiz_id, json.loads(quiz.full_quiz_data)["quiz"])
+    answer_keys.put(key)
+    return key
@@ -8,10 +8,18 @@ import re
 from typing import Tuple, Optional
 import logging
 
+import metrics
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Set headers to mimic a real browser request
+REQUEST_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+}
+REQUEST_TIMEOUT = 10  # Seconds
+
 def scrape_wikipedia(url: str) -> Tuple[str, str]:
     """
     Scrape Wikipedia article content and return clean text with title.
@@ -30,27 +38,13 @@ def scrape_wikipedia(url: str) -> Tuple[str, str]:
         if not _is_valid_wikipedia_url(url):
             raise ValueError("Invalid Wikipedia URL provided")
         
-        # Set headers to mimic a real browser request
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-        }
-        
         # Fetch the webpage content
         logger.info(f"Fetching content from: {url}")
-        response = requests.get(url, headers=headers, timeout=10)
-        response.raise_for_status()  # Raise exception for bad status codes
-        
-        # Parse HTML content
-        soup = BeautifulSoup(response.content, 'html.parser')
-        
-        # Extract article title
-        title = _extract_title(soup)
-        
-        # Extract and clean main content
-        clean_text = _extract_and_clean_content(soup)
+        with metrics.stage("fetch"):
+            response = requests.get(url, headers=REQUEST_HEADERS, timeout=REQUEST_TIMEOUT)
+            response.raise_for_status()  # Raise exception for bad status codes
         
-        if not clean_text.strip():
-            raise ValueError("No content could be extracted from the article")
+        clean_text, title = parse_article(response.content)
         
         logger.info(f"Successfully scraped article: '{title}' ({len(clean_text)} characters)")
         return clean_text, title
@@ -62,6 +56,36 @@ def scrape_wikipedia(url: str) -> Tuple[str, str]:
         logger.error(f"Error scraping Wikipedia: {e}")
         raise Exception(f"Scraping failed: {e}")
 
+def parse_article(html: bytes) -> Tuple[str, str]:
+    """
+    Extract the title and clean text from a fetched Wikipedia page.
+    
+    CPU-bound and free of I/O, so bulk runs can call it in a process pool.
+    
+    Args:
+        html (bytes): Raw page HTML
+        
+    Returns:
+        Tuple[str, str]: (clean_text, article_title)
+        
+    Raises:
+        ValueError: If no usable content could be extracted
+    """
+    # Parse HTML content
+    with metrics.stage("parse"):
+        soup = BeautifulSoup(html, 'html.parser')
+    
+    # Extract article title
+    title = _extract_title(soup)
+    
+    # Extract and clean main content
+    clean_text = _extract_and_clean_content(soup)
+    
+    if not clean_text.strip():
+        raise ValueError("No content could be extracted from the article")
+    
+    return clean_text, title
+
 def _is_valid_wikipedia_url(url: str) -> bool:
     """
     Validate if the URL is a valid Wikipedia article URL.
@@ -148,11 +172,13 @@ def _extract_and_clean_content(soup: BeautifulSoup) -> str:
         raise ValueError("Could not find main content area")
     
     # Remove unwanted elements
-    _remove_unwanted_elements(main_content)
-    
-    # Extract text and clean it
-    text = main_content.get_text()
-    clean_text = _clean_text(text)
+    with metrics.stage("extract"):
+        _remove_unwanted_elements(main_content)
+        
+        # Extract text and clean it
+        text = main_content.get_text()
+    with metrics.stage("clean"):
+        clean_text = _clean_text(text)
     
     return clean_text
 
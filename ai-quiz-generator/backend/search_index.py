@@ -0,0 +1,286 @@
+"""
+Full-text search over generated quizzes
+SQLite FTS5, PostgreSQL tsvector/GIN or MySQL FULLTEXT, chosen by the DATABASE_URL dialect
+"""
+import argparse
+import json
+import logging
+import re
+from typing import Any, Dict, List, Tuple
+
+from sqlalchemy import exists, inspect, select, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session, selectinload, undefer
+
+from database import Quiz, SessionLocal, create_tables, engine
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+SEARCH_TABLE = "quiz_search"
+
+# Index schema per dialect. Every variant is keyed by quiz id and holds the same four fields.
+SCHEMA = {
+    "sqlite": [
+        # Porter stemming so "computers" matches "computer"
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} USING fts5("
+        "title, summary, questions, entities, tokenize = 'porter unicode61')",
+    ],
+    "postgresql": [
+        f"CREATE TABLE IF NOT EXISTS {SEARCH_TABLE} ("
+        "quiz_id INTEGER PRIMARY KEY REFERENCES quizzes(id) ON DELETE CASCADE, "
+        "document TSVECTOR NOT NULL)",
+        f"CREATE INDEX IF NOT EXISTS ix_{SEARCH_TABLE}_document ON {SEARCH_TABLE} USING GIN (document)",
+    ],
+    "mysql": [
+        f"CREATE TABLE IF NOT EXISTS {SEARCH_TABLE} ("
+        "quiz_id INTEGER PRIMARY KEY, title VARCHAR(200), summary TEXT, questions MEDIUMTEXT, entities TEXT, "
+        "FULLTEXT INDEX ft_quiz_search (title, summary, questions, entities)) ENGINE=InnoDB",
+    ],
+}
+
+# Relative field weights: title > entities > summary > questions
+SQLITE_BM25_WEIGHTS = "10.0, 4.0, 1.0, 5.0"  # In column order: title, summary, questions, entities
+POSTGRES_DOCUMENT = (
+    "setweight(to_tsvector('english', :title), 'A') || "
+    "setweight(to_tsvector('english', :entities), 'B') || "
+    "setweight(to_tsvector('english', :summary), 'C') || "
+    "setweight(to_tsvector('english', :questions), 'D')"
+)
+
+def ensure_search_index(bind: Engine = engine) -> bool:
+    """
+    Create the search index for the current dialect if it does not exist yet.
+
+    Args:
+        bind (Engine): Database engine
+
+    Returns:
+        bool: True if the index was just created (existing quizzes need a rebuild)
+    """
+    dialect = bind.dialect.name
+    if dialect not in SCHEMA:
+        logger.warning(f"Full-text search is not supported for {dialect} databases")
+        return False
+
+    created = not inspect(bind).has_table(SEARCH_TABLE)
+    with bind.begin() as conn:
+        for statement in SCHEMA[dialect]:
+            conn.execute(text(statement))
+    return created
+
+def build_document(title: str, quiz_data: Dict[str, Any]) -> Dict[str, str]:
+    """
+    Extract the searchable fields from quiz data.
+
+    Args:
+        title (str): Article title
+        quiz_data (Dict[str, Any]): Quiz data matching the QuizOutput schema
+
+    Returns:
+        Dict[str, str]: title, summary, questions and entities text
+    """
+    entities = quiz_data.get("key_entities") or {}
+    return {
+        "title": title,
+        "summary": quiz_data.get("summary", ""),
+        "questions": "\n".join(question.get("question", "") for question in quiz_data.get("quiz", [])),
+        "entities": "\n".join(
+            name for group in ("people", "organizations", "locations") for name in entities.get(group, [])
+        ),
+    }
+
+def index_quizzes(session: Session, quizzes: List[Tuple[int, str, Dict[str, Any]]]) -> None:
+    """
+    Add or replace quizzes in the search index (call inside the transaction that saves them).
+
+    Args:
+        session (Session): Database session
+        quizzes (List[Tuple[int, str, Dict[str, Any]]]): (quiz_id, title, quiz_data) per quiz
+    """
+    if not quizzes:
+        return
+    dialect = session.get_bind().dialect.name
+    rows = [{"quiz_id": quiz_id, **build_document(title, quiz_data)} for quiz_id, title, quiz_data in quizzes]
+
+    if dialect == "sqlite":
+        session.execute(
+            text(f"DELETE FROM {SEARCH_TABLE} WHERE rowid = :quiz_id"),
+            [{"quiz_id": row["quiz_id"]} for row in rows]
+        )
+        session.execute(
+            text(f"INSERT INTO {SEARCH_TABLE} (rowid, title, summary, questions, entities) "
+                 "VALUES (:quiz_id, :title, :summary, :questions, :entities)"),
+            rows
+        )
+    elif dialect == "postgresql":
+        session.execute(
+            text(f"INSERT INTO {SEARCH_TABLE} (quiz_id, document) VALUES (:quiz_id, {POSTGRES_DOCUMENT}) "
+                 "ON CONFLICT (quiz_id) DO UPDATE SET document = EXCLUDED.document"),
+            rows
+        )
+    elif dialect == "mysql":
+        session.execute(
+            text(f"REPLACE INTO {SEARCH_TABLE} (quiz_id, title, summary, questions, entities) "
+                 "VALUES (:quiz_id, :title, :summary, :questions, :entities)"),
+            rows
+        )
+
+def index_quiz(session: Session, quiz_id: int, title: str, quiz_data: Dict[str, Any]) -> None:
+    """
+    Add or replace a quiz in the search index (call inside the transaction that saves the quiz).
+
+    Args:
+        session (Session): Database session
+        quiz_id (int): Quiz ID
+        title (str): Article title
+        quiz_data (Dict[str, Any]): Quiz data matching the QuizOutput schema
+    """
+    index_quizzes(session, [(quiz_id, title, quiz_data)])
+
+def _fts5_query(query: str) -> str:
+    """
+    Turn free text into a safe FTS5 query: every word must match, the last one as a prefix
+    (so results update while typing). Quoting stops user input from being parsed as FTS5 syntax.
+    """
+    words = re.findall(r"\w+", query)
+    if not words:
+        return ""
+    terms = [f'"{word}"' for word in words]
+    terms[-1] += "*"
+    return " ".join(terms)
+
+def search(session: Session, query: str, limit: int = 20, offset: int = 0) -> Tuple[int, List[Dict[str, Any]]]:
+    """
+    Search quizzes by title, summary, question text and key entities.
+
+    Args:
+        session (Session): Database session
+        query (str): Free-text search query
+        limit (int): Page size
+        offset (int): Number of results to skip
+
+    Returns:
+        Tuple[int, List[Dict[str, Any]]]: (total_matches, page of results ordered by relevance)
+    """
+    dialect = session.get_bind().dialect.name
+    params: Dict[str, Any] = {"limit": limit, "offset": offset}
+
+    if dialect == "sqlite":
+        params["query"] = _fts5_query(query)
+        if not params["query"]:
+            return 0, []
+        match = f"{SEARCH_TABLE} MATCH :query"
+        # bm25() is lower-is-better, so negate it for a higher-is-better score
+        score = f"-bm25({SEARCH_TABLE}, {SQLITE_BM25_WEIGHTS})"
+        join = f"quizzes q ON q.id = {SEARCH_TABLE}.rowid"
+    elif dialect == "postgresql":
+        params["query"] = query
+        match = "document @@ websearch_to_tsquery('english', :query)"
+        score = "ts_rank_cd(document, websearch_to_tsquery('english', :query))"
+        join = f"quizzes q ON q.id = {SEARCH_TABLE}.quiz_id"
+    elif dialect == "mysql":
+        params["query"] = query
+        match = "MATCH (s.title, s.summary, s.questions, s.entities) AGAINST (:query IN NATURAL LANGUAGE MODE)"
+        score = match
+        join = "quizzes q ON q.id = s.quiz_id"
+    else:
+        raise ValueError(f"Full-text search is not supported for {dialect} databases")
+
+    source = f"{SEARCH_TABLE} s" if dialect == "mysql" else SEARCH_TABLE
+    total = session.execute(text(f"SELECT COUNT(*) FROM {source} WHERE {match}"), params).scalar()
+    if not total:
+        return 0, []
+
+    rows = session.execute(
+        text(f"SELECT q.id, q.url, q.title, q.date_generated, {score} AS score "
+             f"FROM {source} JOIN {join} WHERE {match} "
+             "ORDER BY score DESC, q.id DESC LIMIT :limit OFFSET :offset"),
+        params
+    ).mappings().all()
+    return total, [
+        {
+            "id": row["id"],
+            "url": row["url"],
+            "title": row["title"],
+            "date_generated": row["date_generated"],
+            "score": round(float(row["score"]), 4)
+        }
+        for row in rows
+    ]
+
+def is_initialized(session: Session) -> bool:
+    """Whether the index has been built (or there is nothing to build it from, or no index for this dialect)"""
+    if session.get_bind().dialect.name not in SCHEMA:
+        return True
+    if session.execute(text(f"SELECT EXISTS (SELECT 1 FROM {SEARCH_TABLE})")).scalar():
+        return True
+    return not session.execute(select(exists().where(Quiz.id.isnot(None)))).scalar()
+
+def rebuild(session: Session, batch_size: int = 200) -> int:
+    """
+    Rebuild the search index from all stored quizzes.
+
+    Args:
+        session (Session): Database session
+        batch_size (int): Quizzes loaded per query
+
+    Returns:
+        int: Number of quizzes indexed
+    """
+    session.execute(text(f"DELETE FROM {SEARCH_TABLE}"))
+
+    indexed = 0
+    last_id = 0
+    while True:
+        # Quiz JSON blobs (or the legacy column) for the whole batch in two queries, not one per quiz
+        batch = session.execute(
+            select(Quiz)
+            .options(selectinload(Quiz.quiz_content), undefer(Quiz.full_quiz_data_legacy))
+            .where(Quiz.id > last_id)
+            .order_by(Quiz.id)
+            .limit(batch_size)
+        ).scalars().all()
+        if not batch:
+            break
+
+        documents = []
+        for quiz in batch:
+            try:
+                documents.append((quiz.id, quiz.title, json.loads(quiz.full_quiz_data)))
+            except ValueError:
+                logger.warning(f"Skipping quiz {quiz.id}: quiz data is not valid JSON")
+        index_quizzes(session, documents)
+        indexed += len(documents)
+
+        last_id = batch[-1].id
+        session.expunge_all()
+
+    session.commit()
+    logger.info(f"Search index rebuilt with {indexed} quizzes")
+    return indexed
+
+def main() -> None:
+    """Command line entry point: rebuild or query the index"""
+    parser = argparse.ArgumentParser(description="Quiz full-text search index")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("rebuild", help="Re-index all existing quizzes")
+    query_parser = subparsers.add_parser("query", help="Run a search query")
+    query_parser.add_argument("query")
+    query_parser.add_argument("--limit", type=int, default=10)
+    args = parser.parse_args()
+
+    create_tables()
+    ensure_search_index()
+    with SessionLocal() as session:
+        if args.command == "rebuild":
+            print(f"Indexed {rebuild(session)} quizzes")
+        else:
+            total, results = search(session, args.query, limit=args.limit)
+            print(f"{total} matches")
+            for result in results:
+                print(f"{result['score']:>8}  #{result['id']}  {result['title']}  {result['url']}")
+
+if __name__ == "__main__":
+    main()
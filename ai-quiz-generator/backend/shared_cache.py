@@ -0,0 +1,308 @@
+"""
+Shared host-local cache
+SQLite-backed key/value store shared by all worker processes on a host, with TTLs,
+size-bounded LRU eviction and lease-based single-flight computation
+"""
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import orjson
+import zstandard as zstd
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+SHARED_CACHE_ENABLED = os.getenv("SHARED_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+SHARED_CACHE_PATH = os.getenv("SHARED_CACHE_PATH", "./shared_cache.db")
+SHARED_CACHE_MAX_MB = float(os.getenv("SHARED_CACHE_MAX_MB", "256"))
+SCRAPE_CACHE_TTL = int(os.getenv("SCRAPE_CACHE_TTL", str(6 * 3600)))     # Seconds; 0 disables
+# Off by default: a cached quiz means everyone generating the same article gets the same questions
+QUIZ_CACHE_TTL = int(os.getenv("QUIZ_CACHE_TTL", "0"))                   # Seconds; 0 disables
+HEALTH_CACHE_TTL = int(os.getenv("HEALTH_CACHE_TTL", "60"))              # Seconds; 0 disables
+
+COMPRESS_MIN_BYTES = 1024        # Smaller values are stored as plain JSON
+TOUCH_INTERVAL = 1.0             # Seconds; reads refresh an entry's LRU position at most this often
+LEASE_TIMEOUT = 120.0            # Seconds before another process may take over a computation
+LEASE_POLL_INTERVAL = 0.05       # Seconds between checks while waiting for another process
+EVICTION_BATCH = 64              # Entries deleted per eviction query
+
+# Value encodings
+_JSON = 0
+_JSON_ZSTD = 1
+
+SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS entries ("
+    " key TEXT PRIMARY KEY, value BLOB NOT NULL, encoding INTEGER NOT NULL, size INTEGER NOT NULL,"
+    " expires_at REAL, accessed_at REAL NOT NULL)",
+    "CREATE INDEX IF NOT EXISTS ix_entries_accessed_at ON entries (accessed_at)",
+    # Running total of entries.size, maintained in the same transaction as every write
+    "CREATE TABLE IF NOT EXISTS usage (id INTEGER PRIMARY KEY CHECK (id = 1), total_bytes INTEGER NOT NULL)",
+    "INSERT OR IGNORE INTO usage (id, total_bytes) VALUES (1, 0)",
+    "CREATE TABLE IF NOT EXISTS leases (key TEXT PRIMARY KEY, owner TEXT NOT NULL, expires_at REAL NOT NULL)",
+)
+
+class SharedCache:
+    """
+    Key/value cache in a local SQLite file, safe for concurrent use by threads and processes.
+
+    Every write (value, size accounting and eviction) is one IMMEDIATE transaction, so
+    readers never see partial values and the size bound holds across processes. Values
+    are JSON-serializable objects; large ones are zstd-compressed.
+    """
+
+    def __init__(self, path: str = SHARED_CACHE_PATH, max_bytes: int = int(SHARED_CACHE_MAX_MB * 1024 * 1024)):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._local = threading.local()
+        self._compressor = threading.local()
+        self._schema_ready = False
+
+    def _connection(self) -> sqlite3.Connection:
+        """Per-thread connection (re-opened after fork, since SQLite connections must not cross processes)"""
+        connection = getattr(self._local, "connection", None)
+        if connection is None or self._local.pid != os.getpid():
+            directory = os.path.dirname(os.path.abspath(self.path))
+            os.makedirs(directory, exist_ok=True)
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            if not self._schema_ready:
+                with self._transaction(connection):
+                    for statement in SCHEMA:
+                        connection.execute(statement)
+                self._schema_ready = True
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    class _transaction:
+        """BEGIN IMMEDIATE ... COMMIT (ROLLBACK on error): takes the write lock up front"""
+
+        def __init__(self, connection: sqlite3.Connection):
+            self.connection = connection
+
+        def __enter__(self) -> sqlite3.Connection:
+            self.connection.execute("BEGIN IMMEDIATE")
+            return self.connection
+
+        def __exit__(self, exc_type, exc, tb) -> None:
+            self.connection.execute("ROLLBACK" if exc_type is not None else "COMMIT")
+
+    def _encode(self, value: Any) -> Tuple[bytes, int]:
+        data = orjson.dumps(value)
+        if len(data) < COMPRESS_MIN_BYTES:
+            return data, _JSON
+        compressor = getattr(self._compressor, "zstd", None)
+        if compressor is None:
+            compressor = self._compressor.zstd = zstd.ZstdCompressor(level=3)
+        return compressor.compress(data), _JSON_ZSTD
+
+    @staticmethod
+    def _decode(data: bytes, encoding: int) -> Any:
+        if encoding == _JSON_ZSTD:
+            data = zstd.ZstdDecompressor().decompress(data)
+        return orjson.loads(data)
+
+    def get(self, key: str) -> Optional[Any]:
+        """
+        Look up a value.
+
+        Args:
+            key (str): Cache key
+
+        Returns:
+            Optional[Any]: Cached value, or None if missing or expired
+        """
+        connection = self._connection()
+        row = connection.execute(
+            "SELECT value, encoding, expires_at, accessed_at FROM entries WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        value, encoding, expires_at, accessed_at = row
+        now = time.time()
+        if expires_at is not None and expires_at <= now:
+            self.delete(key)
+            return None
+        if now - accessed_at > TOUCH_INTERVAL:
+            # Approximate LRU: refresh the access time at most once per TOUCH_INTERVAL
+            connection.execute("UPDATE entries SET accessed_at = ? WHERE key = ?", (now, key))
+        return self._decode(value, encoding)
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        """
+        Store a value, evicting least recently used entries to stay within max_bytes.
+
+        Args:
+            key (str): Cache key
+            value (Any): JSON-serializable value
+            ttl (Optional[float]): Seconds until the entry expires (None: never)
+        """
+        data, encoding = self._encode(value)
+        size = len(key) + len(data)
+        if size > self.max_bytes:
+            logger.warning(f"Not caching {key}: {size} bytes exceeds the cache size")
+            return
+        now = time.time()
+        expires_at = now + ttl if ttl else None
+
+        with self._transaction(self._connection()) as connection:
+            row = connection.execute("SELECT size FROM entries WHERE key = ?", (key,)).fetchone()
+            delta = size - (row[0] if row else 0)
+            connection.execute(
+                "INSERT OR REPLACE INTO entries (key, value, encoding, size, expires_at, accessed_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (key, data, encoding, size, expires_at, now)
+            )
+            total = connection.execute(
+                "UPDATE usage SET total_bytes = total_bytes + ? WHERE id = 1 RETURNING total_bytes", (delta,)
+            ).fetchone()[0]
+            if total > self.max_bytes:
+                self._evict(connection, total, now)
+
+    def _evict(self, connection: sqlite3.Connection, total: int, now: float) -> None:
+        """Delete expired entries, then the least recently used ones, until total fits (in the caller's transaction)"""
+        freed = connection.execute(
+            "DELETE FROM entries WHERE expires_at IS NOT NULL AND expires_at <= ? RETURNING size", (now,)
+        ).fetchall()
+        total -= sum(size for (size,) in freed)
+        evicted = 0
+        while total > self.max_bytes:
+            victims = connection.execute(
+                "SELECT key, size FROM entries ORDER BY accessed_at LIMIT ?", (EVICTION_BATCH,)
+            ).fetchall()
+            if not victims:
+                break
+            for key, size in victims:
+                if total <= self.max_bytes:
+                    break
+                connection.execute("DELETE FROM entries WHERE key = ?", (key,))
+                total -= size
+                evicted += 1
+        connection.execute("UPDATE usage SET total_bytes = ? WHERE id = 1", (total,))
+        logger.debug(f"Shared cache evicted {len(freed)} expired and {evicted} LRU entries")
+
+    def delete(self, key: str) -> None:
+        """Remove a key (no-op if missing)"""
+        with self._transaction(self._connection()) as connection:
+            row = connection.execute("DELETE FROM entries WHERE key = ? RETURNING size", (key,)).fetchone()
+            if row is not None:
+                connection.execute("UPDATE usage SET total_bytes = total_bytes - ? WHERE id = 1", (row[0],))
+
+    def clear(self) -> None:
+        """Remove all entries and leases"""
+        with self._transaction(self._connection()) as connection:
+            connection.execute("DELETE FROM entries")
+            connection.execute("DELETE FROM leases")
+            connection.execute("UPDATE usage SET total_bytes = 0 WHERE id = 1")
+
+    def _acquire_lease(self, key: str, owner: str, timeout: float) -> bool:
+        now = time.time()
+        connection = self._connection()
+        # Waiters poll this: check with a plain read, and take the write lock only to claim a
+        # missing or expired lease (re-checked inside, since another process may claim it first)
+        row = connection.execute("SELECT expires_at FROM leases WHERE key = ?", (key,)).fetchone()
+        if row is not None and row[0] > now:
+            return False
+        with self._transaction(connection):
+            row = connection.execute("SELECT expires_at FROM leases WHERE key = ?", (key,)).fetchone()
+            if row is not None and row[0] > now:
+                return False
+            connection.execute("INSERT OR REPLACE INTO leases (key, owner, expires_at) VALUES (?, ?, ?)", (key, owner, now + timeout))
+            return True
+
+    def _release_lease(self, key: str, owner: str) -> None:
+        with self._transaction(self._connection()) as connection:
+            connection.execute("DELETE FROM leases WHERE key = ? AND owner = ?", (key, owner))
+
+    def get_or_compute(
+        self,
+        key: str,
+        compute: Callable[[], Any],
+        ttl: Optional[float] = None,
+        lease_timeout: float = LEASE_TIMEOUT
+    ) -> Tuple[Any, bool]:
+        """
+        Return the cached value, or compute and cache it - once across all processes.
+
+        The first caller takes a lease on the key and computes; concurrent callers (in any
+        process) wait for its result instead of repeating the work. If the owner fails or
+        its lease expires, a waiting caller takes over. Blocks, so call it from a worker
+        thread in async code.
+
+        Args:
+            key (str): Cache key
+            compute (Callable[[], Any]): Produces the value on a miss (JSON-serializable)
+            ttl (Optional[float]): Seconds until the entry expires (None: never)
+            lease_timeout (float): Seconds another caller waits before taking over
+
+        Returns:
+            Tuple[Any, bool]: (value, cache_hit) - cache_hit is True when another caller computed it
+        """
+        value = self.get(key)
+        if value is not None:
+            return value, True
+
+        owner = f"{os.getpid()}:{threading.get_ident()}:{time.monotonic_ns()}"
+        while not self._acquire_lease(key, owner, lease_timeout):
+            time.sleep(LEASE_POLL_INTERVAL)
+            value = self.get(key)
+            if value is not None:
+                return value, True
+
+        try:
+            # Another process may have finished between our miss and taking the lease
+            value = self.get(key)
+            if value is not None:
+                return value, True
+            value = compute()
+            # The value is paid for now - a cache write failure must not make callers compute it again
+            try:
+                self.set(key, value, ttl)
+            except sqlite3.Error as e:
+                logger.warning(f"Could not cache {key}: {e}")
+            return value, False
+        finally:
+            try:
+                self._release_lease(key, owner)
+            except sqlite3.Error as e:
+                logger.warning(f"Could not release the lease on {key} ({e}); it expires in {lease_timeout:.0f}s")
+
+    def stats(self) -> Dict[str, Any]:
+        """Entry count and size for /health and diagnostics"""
+        connection = self._connection()
+        entries = connection.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+        total = connection.execute("SELECT total_bytes FROM usage WHERE id = 1").fetchone()[0]
+        return {"entries": entries, "bytes": total, "max_bytes": self.max_bytes}
+
+# Global cache for use in FastAPI endpoints (None when SHARED_CACHE_ENABLED=false)
+shared_cache: Optional[SharedCache] = SharedCache() if SHARED_CACHE_ENABLED else None
+
+def cached(key: str, compute: Callable[[], Any], ttl: int) -> Tuple[Any, bool]:
+    """
+    get_or_compute on the global cache, falling back to compute() when caching is disabled
+    (globally or via ttl=0) or the cache file is unusable.
+
+    Returns:
+        Tuple[Any, bool]: (value, cache_hit)
+    """
+    if shared_cache is None or ttl <= 0:
+        return compute(), False
+    started = False
+
+    def tracked_compute() -> Any:
+        nonlocal started
+        started = True
+        return compute()
+
+    try:
+        return shared_cache.get_or_compute(key, tracked_compute, ttl)
+    except sqlite3.Error as e:
+        if started:
+            raise  # Raised by compute() itself; running it again would repeat the work
+        logger.warning(f"Shared cache unavailable ({e}); computing {key} directly")
+        return compute(), False
@@ -0,0 +1,38 @@
+"""
+Test configuration
+Makes the backend modules importable the way the application imports them (flat, by module name)
+and points them at a temporary database and cache, so tests never touch quiz_history.db
+"""
+import os
+import sys
+import tempfile
+
+import pytest
+
+_tmp_dir = tempfile.mkdtemp(prefix="quiz-tests-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_tmp_dir, 'test.db')}"
+os.environ["SHARED_CACHE_PATH"] = os.path.join(_tmp_dir, "shared_cache.db")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+@pytest.fixture
+def db_session():
+    """A session on an empty temporary database (all tables, including the search index)"""
+    # Imported here so that DATABASE_URL above is set before database.py reads it
+    from sqlalchemy import text
+
+    import content_store
+    import search_index
+    from database import Base, SessionLocal, create_tables, engine
+
+    create_tables()
+    search_index.ensure_search_index()
+    with SessionLocal() as session:
+        yield session
+    Base.metadata.drop_all(bind=engine)
+    with engine.begin() as conn:
+        conn.execute(text(f"DROP TABLE IF EXISTS {search_index.SEARCH_TABLE}"))
+    # Row ids start over in the next test's tables
+    content_store._dictionaries.clear()
+    content_store._active_dictionary_ids.clear()
+    content_store._local.__dict__.clear()
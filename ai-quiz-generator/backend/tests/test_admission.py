@@ -0,0 +1,150 @@
+"""
+Tests for admission control
+Fair queueing, cancellation bookkeeping and load shedding in admission.AdmissionController
+"""
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+from admission import AdmissionController
+
+def _controller(concurrency=1, queue_size=10, max_wait=60.0, per_client=5, expected_seconds=1.0) -> AdmissionController:
+    return AdmissionController(
+        "test",
+        concurrency=concurrency,
+        queue_size=queue_size,
+        max_wait=max_wait,
+        per_client=per_client,
+        expected_seconds=expected_seconds
+    )
+
+def _assert_idle(controller: AdmissionController) -> None:
+    assert controller.active == 0
+    assert controller.queued == 0
+    assert controller._clients == {}
+    assert not controller._waiters
+
+async def _settle() -> None:
+    """Let every runnable task reach its next await"""
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+def test_waiting_clients_are_admitted_round_robin():
+    async def scenario():
+        controller = _controller()
+        admitted = []
+        releases = {}
+
+        async def hold(client, name):
+            releases[name] = asyncio.Event()
+            async with controller.admit(client):
+                admitted.append(name)
+                await releases[name].wait()
+
+        tasks = [asyncio.create_task(hold("a", "a1"))]
+        await _settle()
+        # Client a queues two requests before client b arrives with two of its own
+        for client, name in (("a", "a2"), ("a", "a3"), ("b", "b1"), ("b", "b2")):
+            tasks.append(asyncio.create_task(hold(client, name)))
+            await _settle()
+        assert (controller.active, controller.queued) == (1, 4)
+
+        for _ in range(4):
+            releases[admitted[-1]].set()
+            await _settle()
+        releases[admitted[-1]].set()
+        await asyncio.gather(*tasks)
+
+        assert admitted == ["a1", "a2", "b1", "a3", "b2"]
+        _assert_idle(controller)
+
+    asyncio.run(scenario())
+
+def test_waiter_cancelled_before_its_slot_is_granted():
+    async def scenario():
+        controller = _controller()
+        await controller._acquire("a")
+        waiter = asyncio.create_task(controller._acquire("b"))
+        await _settle()
+        assert (controller.active, controller.queued) == (1, 1)
+
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        assert (controller.active, controller.queued) == (1, 0)
+        assert controller._clients == {"a": 1}
+
+        controller._release("a", 0.5)
+        _assert_idle(controller)
+
+    asyncio.run(scenario())
+
+def test_waiter_cancelled_after_its_slot_is_granted():
+    async def scenario():
+        controller = _controller()
+        await controller._acquire("a")
+        waiter = asyncio.create_task(controller._acquire("b"))
+        await _settle()
+
+        # The slot passes to b, but b is cancelled before it gets to run
+        controller._release("a", 0.5)
+        assert (controller.active, controller.queued) == (1, 0)
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+
+        _assert_idle(controller)
+
+    asyncio.run(scenario())
+
+def test_client_over_its_limit_gets_429():
+    async def scenario():
+        controller = _controller(concurrency=4, per_client=1, expected_seconds=7.2)
+        await controller._acquire("a")
+        with pytest.raises(HTTPException) as rejected:
+            await controller._acquire("a")
+        assert rejected.value.status_code == 429
+        assert rejected.value.headers["Retry-After"] == "8"
+
+        await controller._acquire("b")  # Other clients are unaffected
+        controller._release("a", None)
+        controller._release("b", None)
+        _assert_idle(controller)
+
+    asyncio.run(scenario())
+
+def test_full_queue_gets_503():
+    async def scenario():
+        controller = _controller(queue_size=1, expected_seconds=2.0)
+        await controller._acquire("a")
+        waiter = asyncio.create_task(controller._acquire("b"))
+        await _settle()
+
+        with pytest.raises(HTTPException) as rejected:
+            await controller._acquire("c")
+        assert rejected.value.status_code == 503
+        assert rejected.value.headers["Retry-After"] == "4"  # Two in line at 2s each
+        assert "c" not in controller._clients
+
+        controller._release("a", None)
+        await waiter
+        controller._release("b", None)
+        _assert_idle(controller)
+
+    asyncio.run(scenario())
+
+def test_long_estimated_wait_gets_503():
+    async def scenario():
+        controller = _controller(max_wait=5.0, expected_seconds=10.0)
+        await controller._acquire("a")
+        with pytest.raises(HTTPException) as rejected:
+            await controller._acquire("b")
+        assert rejected.value.status_code == 503
+        assert rejected.value.headers["Retry-After"] == "10"
+        assert controller.queued == 0
+
+        controller._release("a", None)
+        _assert_idle(controller)
+
+    asyncio.run(scenario())
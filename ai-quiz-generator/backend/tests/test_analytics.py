@@ -0,0 +1,94 @@
+"""
+Tests for incremental analytics
+Startup backfill locking and rebuilding aggregates in analytics.py
+"""
+import json
+import threading
+import time
+
+from sqlalchemy import event
+
+import analytics
+from content_store import QUIZ, store_contents
+from database import Quiz, SessionLocal, engine, locked_transaction
+
+def test_concurrent_startup_backfills_rebuild_once(db_session, monkeypatch):
+    rebuilds = []
+    rebuild = analytics.rebuild
+
+    def slow_rebuild(session):
+        rebuilds.append(threading.get_ident())
+        time.sleep(0.2)  # Give the other workers time to reach the lock
+        return rebuild(session)
+
+    monkeypatch.setattr(analytics, "rebuild", slow_rebuild)
+    start = threading.Barrier(4)
+    errors = []
+
+    def worker_startup():
+        try:
+            start.wait()
+            with SessionLocal() as db, locked_transaction(db, "analytics_backfill"):
+                if not analytics.is_initialized(db):
+                    analytics.rebuild(db)
+        except Exception as e:
+            errors.append(e)
+
+    workers = [threading.Thread(target=worker_startup) for _ in range(4)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+    assert errors == []
+    assert len(rebuilds) == 1
+    assert analytics.is_initialized(db_session)
+
+def test_locked_transaction_rolls_back_on_error(db_session):
+    try:
+        with locked_transaction(db_session, "test"):
+            analytics.record_quiz_created(db_session, 5)
+            raise RuntimeError("boom")
+    except RuntimeError:
+        pass
+    assert not analytics.is_initialized(db_session)
+
+    with locked_transaction(db_session, "test"):
+        analytics.record_quiz_created(db_session, 5)
+    assert analytics.is_initialized(db_session)
+
+def _quiz_json(answers) -> str:
+    return json.dumps({"quiz": [
+        {"question": f"Q{n}", "options": ["a", "b", "c", "d"], "answer": answer, "difficulty": "easy", "explanation": ""}
+        for n, answer in enumerate(answers)
+    ]})
+
+def test_rebuild_aggregates_stored_and_legacy_quizzes_per_batch(db_session):
+    blobs = store_contents(db_session, QUIZ, [_quiz_json(["a", "b"]), _quiz_json(["a", "b", "c"])])
+    db_session.add_all([
+        Quiz(url="u1", title="One", quiz_content=blobs[0], user_answers=json.dumps({"0": "a", "1": "c"})),
+        Quiz(url="u2", title="Two", quiz_content=blobs[1]),
+        # Saved before content_blobs existed
+        Quiz(url="u3", title="Three", full_quiz_data_legacy=_quiz_json(["d"]), user_answers=json.dumps({"0": "d"})),
+    ])
+    db_session.commit()
+
+    selects = []
+
+    def count_selects(conn, cursor, statement, *args):
+        if "FROM quizzes" in statement or "FROM content_blobs" in statement:
+            selects.append(statement)
+
+    event.listen(engine, "before_cursor_execute", count_selects)
+    try:
+        assert analytics.rebuild(db_session) == 3
+    finally:
+        event.remove(engine, "before_cursor_execute", count_selects)
+
+    assert len(selects) <= 3  # The batch, its blobs, then the empty page
+    stats = analytics.get_stats(db_session)
+    assert stats["total_quizzes"] == 3
+    assert stats["total_questions"] == 6
+    assert stats["total_submissions"] == 2
+    assert stats["questions_answered"] == 3
+    assert stats["correct_answers"] == 2
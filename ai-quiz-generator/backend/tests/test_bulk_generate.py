@@ -0,0 +1,41 @@
+"""
+Tests for bulk generation bookkeeping
+URL extraction and the resumable checkpoint in bulk_generate.py
+"""
+import threading
+
+from bulk_generate import Checkpoint, read_urls
+
+def test_read_urls_ignores_notes_and_duplicates():
+    lines = [
+        "# comment https://en.wikipedia.org/wiki/Ignored",
+        "1. https://en.wikipedia.org/wiki/Alan_Turing (mathematician)",
+        "see https://en.wikipedia.org/wiki/Python_(programming_language).",
+        "https://en.wikipedia.org/wiki/Alan_Turing",
+    ]
+    assert read_urls(lines) == [
+        "https://en.wikipedia.org/wiki/Alan_Turing",
+        "https://en.wikipedia.org/wiki/Python_(programming_language)",
+    ]
+
+def test_checkpoint_resumes_from_concurrent_records(tmp_path):
+    path = str(tmp_path / "urls.checkpoint")
+    checkpoint = Checkpoint(path)
+
+    def record(prefix, status):
+        for n in range(200):
+            checkpoint.record([{"url": f"{prefix}{n}", "status": status, "error": "x" * 5000}])
+
+    threads = [threading.Thread(target=record, args=(prefix, status)) for prefix, status in (("done", "done"), ("failed", "failed"))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    checkpoint.record([{"url": "failed0", "status": "done"}])
+    checkpoint.close()
+
+    resumed = Checkpoint(path)
+    assert len(resumed.done) == 201
+    assert "failed0" not in resumed.failed
+    assert len(resumed.failed) == 199
+    resumed.close()
@@ -0,0 +1,58 @@
+"""
+Tests for compressed content storage
+Round trips with and without dictionaries, deduplication and dictionary switching in content_store.py
+"""
+import content_store
+from content_store import ARTICLE, QUIZ, compress, decompress, store_contents, train_dictionary
+from database import CompressionDictionary
+
+def _article(n: int) -> str:
+    return " ".join(
+        f"Paragraph {p} of article {n}: the {['castle', 'river', 'bridge', 'tower'][(n + p) % 4]} was built in {1200 + n * 7 + p}"
+        f" by the {['duke', 'abbot', 'guild', 'crown'][(n * p) % 4]} of region {n % 13}, and rebuilt after the fire of {1500 + p * n % 300}."
+        for p in range(20)
+    )
+
+def _train(session, kind: str = ARTICLE) -> CompressionDictionary:
+    store_contents(session, kind, [_article(n) for n in range(60)])
+    record = train_dictionary(session, kind)
+    assert record is not None
+    return record
+
+def test_round_trip_without_a_dictionary(db_session):
+    text = _article(1) + " ünïcödé ✓"
+    data, dictionary_id = compress(db_session, ARTICLE, text)
+    assert dictionary_id is None
+    assert len(data) < len(text.encode("utf-8"))
+    assert decompress(db_session, data, dictionary_id, len(text.encode("utf-8"))) == text
+
+def test_round_trip_with_a_dictionary(db_session):
+    record = _train(db_session)
+    text = _article(1000)
+    data, dictionary_id = compress(db_session, ARTICLE, text)
+    assert dictionary_id == record.id
+    assert decompress(db_session, data, dictionary_id, len(text.encode("utf-8"))) == text
+
+    # Another process only has the id: the dictionary is loaded from the database
+    content_store._dictionaries.clear()
+    content_store._local.__dict__.clear()
+    assert decompress(db_session, data, dictionary_id, len(text.encode("utf-8"))) == text
+
+def test_store_contents_deduplicates_and_keeps_order(db_session):
+    texts = [_article(1), _article(2), _article(1)]
+    blobs = store_contents(db_session, QUIZ, texts)
+    assert blobs[0] is blobs[2]
+    assert [blob.text for blob in blobs] == texts
+    assert store_contents(db_session, QUIZ, [_article(2)])[0].id == blobs[1].id
+
+def test_new_dictionary_is_picked_up_after_the_cache_ttl(db_session, monkeypatch):
+    assert content_store._active_dictionary_id(db_session, ARTICLE) is None
+    # Trained by another process: this one's cached answer is still "no dictionary"
+    record = _train(db_session)
+    content_store._set_active_dictionary_id(ARTICLE, None)
+    assert content_store._active_dictionary_id(db_session, ARTICLE) is None
+
+    monkeypatch.setattr(content_store, "DICTIONARY_CACHE_TTL", 0)
+    content_store._set_active_dictionary_id(ARTICLE, None)
+    assert content_store._active_dictionary_id(db_session, ARTICLE) == record.id
+    assert compress(db_session, ARTICLE, _article(5))[1] == record.id
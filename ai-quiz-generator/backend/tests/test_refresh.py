@@ -0,0 +1,141 @@
+"""
+Tests for incremental quiz regeneration
+Passage splitting, change detection and question reuse in refresh.py
+"""
+import refresh
+from refresh import PASSAGE_MAX_CHARS, PASSAGE_MIN_CHARS, RefreshPlan, split_passages
+
+SENTENCES = 120
+
+def _sentence(n: int) -> str:
+    return f"The marker{n} of region{n} was recorded by the survey{n} team in the year {1800 + n}."
+
+def _article(sentences=None) -> str:
+    return " ".join(sentences if sentences is not None else [_sentence(n) for n in range(SENTENCES)])
+
+def _question(n: int) -> dict:
+    return {
+        "question": f"What was recorded in region{n} by the survey{n} team?",
+        "options": [f"The marker{n}", "A river", "A castle", "A road"],
+        "answer": f"The marker{n}",
+        "difficulty": "easy",
+        "explanation": f"The marker{n} of region{n} was recorded by the survey{n} team.",
+    }
+
+# Nothing in the article supports or contradicts this one
+UNATTRIBUTABLE = {
+    "question": "Which colour is the sky on a clear day?",
+    "options": ["Blue", "Green", "Red", "Black"],
+    "answer": "Blue",
+    "difficulty": "easy",
+    "explanation": "Scattering of sunlight.",
+}
+
+class StubGenerator:
+    """Stands in for QuizGenerator and records what it was asked for"""
+
+    def __init__(self):
+        self.calls = []
+
+    def generate_quiz(self, article_text, article_title):
+        raise AssertionError("full regeneration was not expected")
+
+    def generate_questions(self, context, article_title, count, existing_questions):
+        self.calls.append((context, count))
+        return [dict(_question(1000 + index), question=f"New question {index}?") for index in range(count)]
+
+def _quiz(questions) -> dict:
+    return {"title": "Survey", "summary": "Survey records.", "quiz": questions}
+
+def test_split_passages_covers_text_in_order():
+    text = _article()
+    passages = split_passages(text)
+
+    assert len(passages) > 5
+    assert " ".join(passages) == text
+    for passage in passages[:-1]:
+        assert len(passage) + 1 >= PASSAGE_MIN_CHARS
+        assert len(passage) < PASSAGE_MAX_CHARS + len(_sentence(SENTENCES))
+
+def test_split_passages_edit_only_moves_nearby_boundaries():
+    sentences = [_sentence(n) for n in range(SENTENCES)]
+    old_passages = split_passages(_article(sentences))
+    sentences[60] = "An entirely different sentence replaced this one."
+    new_passages = split_passages(_article(sentences))
+
+    # Passages before the edit are identical, and the split resynchronizes a few passages after it
+    prefix = next(index for index, (old, new) in enumerate(zip(old_passages, new_passages)) if old != new)
+    suffix = next(index for index, (old, new) in enumerate(zip(old_passages[::-1], new_passages[::-1])) if old != new)
+    assert "marker60 " in old_passages[prefix]
+    assert len(old_passages) - prefix - suffix <= 4
+    assert len(new_passages) - prefix - suffix <= 4
+
+def test_plan_without_edits_keeps_every_question():
+    questions = [_question(n) for n in (5, 30, 60, 90, 110)] + [UNATTRIBUTABLE]
+    plan = RefreshPlan(_article(), _article(), questions)
+
+    assert plan.changed == []
+    assert plan.changed_fraction == 0
+    assert plan.unchanged
+    assert plan.reused == len(questions)
+    assert plan.replacements_needed() == 0
+
+def test_refresh_without_edits_makes_no_llm_call():
+    generator = StubGenerator()
+    quiz_data = _quiz([_question(n) for n in (5, 30, 60, 90, 110)] + [UNATTRIBUTABLE])
+    result, stats = refresh.refresh_quiz(generator, _article(), _article(), "Survey", quiz_data)
+
+    assert result is quiz_data
+    assert stats["mode"] == "unchanged"
+    assert stats["new_questions"] == 0
+    assert stats["llm_input_chars"] == 0
+    assert generator.calls == []
+
+def test_plan_one_sentence_edit_replaces_only_its_questions():
+    questions = [_question(n) for n in (5, 30, 60, 90, 110)] + [UNATTRIBUTABLE]
+    sentences = [_sentence(n) for n in range(SENTENCES)]
+    sentences[60] = "The marker60 was later moved to a museum in the capital."
+    plan = RefreshPlan(_article(), _article(sentences), questions)
+
+    assert 1 <= len(plan.changed) <= 4
+    assert 0 < plan.changed_fraction < refresh.REFRESH_FULL_THRESHOLD
+    assert [question is not None for question in plan.kept] == [True, True, False, True, True, True]
+    assert plan.replacements_needed() == 1
+    assert "moved to a museum" in plan.context()
+
+    generator = StubGenerator()
+    result, stats = refresh.refresh_quiz(generator, _article(), _article(sentences), "Survey", _quiz(questions))
+    assert stats["mode"] == "incremental"
+    assert (stats["reused_questions"], stats["new_questions"]) == (5, 1)
+    assert result["quiz"][2]["question"] == "New question 0?"
+    assert stats["llm_input_chars"] == len(generator.calls[0][0]) < len(_article()) / 2
+
+def test_plan_removed_passage_drops_its_questions():
+    text = _article()
+    passages = split_passages(text)
+    removed = passages[3]
+    in_removed = [n for n in range(SENTENCES) if f"marker{n} " in removed]
+    outside = [n for n in (0, SENTENCES - 1) if n not in in_removed]
+    questions = [_question(n) for n in in_removed[:2] + outside]
+
+    plan = RefreshPlan(text, " ".join(passages[:3] + passages[4:]), questions)
+
+    # The following passages split exactly as before, so nothing counts as new text
+    assert plan.changed == []
+    assert plan.changed_fraction > 0
+    assert not plan.unchanged
+    assert plan.reused == len(outside)
+    assert plan.replacements_needed() == max(2, refresh.MIN_QUESTIONS - len(outside))
+    assert removed not in plan.context()
+
+def test_full_regeneration_reports_the_text_actually_sent():
+    class FullGenerator(StubGenerator):
+        def generate_quiz(self, article_text, article_title):
+            return _quiz([_question(n) for n in range(5)])
+
+    long_text = _article() * 20
+    _, stats = refresh.refresh_quiz(FullGenerator(), None, long_text, "Survey", _quiz([_question(1)] * 5))
+
+    assert stats["mode"] == "full"
+    assert len(long_text) > refresh.MAX_ARTICLE_CHARS
+    assert stats["llm_input_chars"] == refresh.MAX_ARTICLE_CHARS
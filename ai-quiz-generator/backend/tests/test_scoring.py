@@ -0,0 +1,67 @@
+"""
+Tests for server-side scoring
+Grading, score summaries and the answer key cache in scoring.py
+"""
+import json
+
+import scoring
+from content_store import QUIZ, store_contents
+from database import Quiz
+from scoring import AnswerKey, AnswerKeyCache, load_answer_key
+
+QUESTIONS = [
+    {"question": "Q0", "answer": "Paris", "difficulty": "easy"},
+    {"question": "Q1", "answer": "1066", "difficulty": "hard"},
+    {"question": "Q2", "answer": "Danube"},
+]
+
+def test_from_questions_keeps_order_and_defaults_difficulty():
+    key = AnswerKey.from_questions(7, QUESTIONS)
+    assert key.quiz_id == 7
+    assert key.answers == ("Paris", "1066", "Danube")
+    assert key.difficulties == ("easy", "hard", "")
+    assert len(key) == 3
+
+def test_grade_ignores_unknown_and_malformed_indices():
+    key = AnswerKey.from_questions(1, QUESTIONS)
+    graded = key.grade({"0": "Paris", "1": "1067", "5": "x", "-1": "Danube", "two": "Danube"})
+    assert graded == {0: True, 1: False}
+
+def test_score_summarizes_graded_answers():
+    key = AnswerKey.from_questions(1, QUESTIONS)
+    result = key.score(key.grade({"2": "Danube", "0": "Paris"}))
+    assert result["score"] == 2
+    assert result["total"] == 3
+    assert result["answered"] == 2
+    assert result["percentage"] == 66.7
+    assert result["results"] == [
+        {"index": 0, "correct": True, "correct_answer": "Paris"},
+        {"index": 2, "correct": True, "correct_answer": "Danube"},
+    ]
+
+def test_score_of_an_empty_quiz():
+    key = AnswerKey(1, (), ())
+    assert key.score(key.grade({"0": "x"}))["percentage"] == 0.0
+
+def test_cache_evicts_least_recently_used():
+    cache = AnswerKeyCache(max_size=2)
+    for quiz_id in (1, 2):
+        cache.put(AnswerKey(quiz_id, (), ()))
+    assert cache.get(1) is not None  # 2 is now least recently used
+    cache.put(AnswerKey(3, (), ()))
+    assert cache.get(2) is None
+    assert cache.get(1).quiz_id == 1
+    assert cache.get(3).quiz_id == 3
+
+def test_load_answer_key_reads_the_quiz_once(db_session, monkeypatch):
+    monkeypatch.setattr(scoring, "answer_keys", AnswerKeyCache())
+    blob = store_contents(db_session, QUIZ, [json.dumps({"quiz": QUESTIONS})])[0]
+    quiz = Quiz(url="u", title="T", quiz_content=blob)
+    db_session.add(quiz)
+    db_session.commit()
+
+    key = load_answer_key(db_session, quiz.id)
+    assert key.answers == ("Paris", "1066", "Danube")
+    db_session.expunge_all()
+    assert load_answer_key(db_session, quiz.id) is key
+    assert load_answer_key(db_session, quiz.id + 1) is None
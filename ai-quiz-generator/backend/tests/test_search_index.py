@@ -0,0 +1,75 @@
+"""
+Tests for full-text search
+FTS5 query building, ranking and rebuilding in search_index.py (SQLite backend)
+"""
+from sqlalchemy import text
+
+import search_index
+from models import QuizOutput
+from persistence import NewQuiz, save_quizzes
+
+def _quiz(summary: str, questions=(), people=()) -> QuizOutput:
+    question_texts = list(questions) + [f"Filler question {n}?" for n in range(5 - len(questions))]
+    return QuizOutput(
+        summary=summary,
+        key_entities={"people": list(people), "organizations": [], "locations": []},
+        sections=["History"],
+        quiz=[
+            {"question": question, "options": ["a", "b", "c", "d"], "answer": "a", "difficulty": "easy", "explanation": "-"}
+            for question in question_texts
+        ],
+        related_topics=[],
+    )
+
+def _save(session, *quizzes) -> list:
+    records = save_quizzes(session, [
+        NewQuiz(f"https://en.wikipedia.org/wiki/{title.replace(' ', '_')}", title, None, quiz) for title, quiz in quizzes
+    ])
+    session.commit()
+    return [record.id for record in records]
+
+def test_fts5_query_quotes_words_and_prefixes_the_last():
+    assert search_index._fts5_query("alan turing") == '"alan" "turing"*'
+    assert search_index._fts5_query("enig") == '"enig"*'
+
+def test_fts5_query_neutralizes_fts_syntax():
+    assert search_index._fts5_query('title:turing OR "x" NEAR(a b) -c*') == '"title" "turing" "OR" "x" "NEAR" "a" "b" "c"*'
+    assert search_index._fts5_query('" * ( ) :') == ""
+    assert search_index._fts5_query("") == ""
+
+def test_search_ranks_title_matches_first(db_session):
+    in_title, in_question, unrelated = _save(
+        db_session,
+        ("Enigma machine", _quiz("A cipher device used in the Second World War.")),
+        ("Bletchley Park", _quiz("A country house in Buckinghamshire.", questions=["Which Enigma variant was broken here?"])),
+        ("Cheese", _quiz("A dairy product.")),
+    )
+
+    total, results = search_index.search(db_session, "enigma")
+    assert total == 2
+    assert [result["id"] for result in results] == [in_title, in_question]
+    assert results[0]["score"] >= results[1]["score"]
+
+    # The last word matches as a prefix, while typing
+    assert [result["id"] for result in search_index.search(db_session, "bletch")[1]] == [in_question]
+    # Stemming: "devices" finds "device"
+    assert [result["id"] for result in search_index.search(db_session, "devices")[1]] == [in_title]
+    assert search_index.search(db_session, "zeppelin") == (0, [])
+    assert search_index.search(db_session, '"(') == (0, [])
+
+def test_search_pages_results(db_session):
+    ids = _save(db_session, *[(f"Castle {n}", _quiz("A castle.")) for n in range(5)])
+    total, first = search_index.search(db_session, "castle", limit=2)
+    _, rest = search_index.search(db_session, "castle", limit=10, offset=2)
+    assert total == 5
+    assert sorted(result["id"] for result in first + rest) == ids
+
+def test_rebuild_restores_a_lost_index(db_session):
+    ids = _save(db_session, ("Alan Turing", _quiz("A mathematician.", people=["Alan Turing"])), ("Cheese", _quiz("Food.")))
+    db_session.execute(text(f"DELETE FROM {search_index.SEARCH_TABLE}"))
+    db_session.commit()
+    assert not search_index.is_initialized(db_session)
+
+    assert search_index.rebuild(db_session) == 2
+    assert search_index.is_initialized(db_session)
+    assert [result["id"] for result in search_index.search(db_session, "mathematician")[1]] == [ids[0]]
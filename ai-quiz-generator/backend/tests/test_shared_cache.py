@@ -0,0 +1,42 @@
+"""
+Tests for the shared cache
+Values, single-flight computation and lease polling in shared_cache.SharedCache
+"""
+import sqlite3
+import time
+
+from shared_cache import SharedCache
+
+def test_get_or_compute_caches_the_value(tmp_path):
+    cache = SharedCache(str(tmp_path / "cache.db"), max_bytes=1 << 20)
+    calls = []
+
+    def compute():
+        calls.append(1)
+        return {"answer": 42}
+
+    assert cache.get_or_compute("k", compute, ttl=60) == ({"answer": 42}, False)
+    assert cache.get_or_compute("k", compute, ttl=60) == ({"answer": 42}, True)
+    assert len(calls) == 1
+
+def test_waiting_for_a_live_lease_does_not_take_the_write_lock(tmp_path):
+    path = str(tmp_path / "cache.db")
+    cache = SharedCache(path, max_bytes=1 << 20)
+    assert cache._acquire_lease("k", "owner", timeout=60)
+
+    # Another process holds the write lock; a waiter must still be able to poll
+    writer = sqlite3.connect(path, timeout=0, isolation_level=None)
+    writer.execute("BEGIN IMMEDIATE")
+    try:
+        started = time.monotonic()
+        assert not cache._acquire_lease("k", "waiter", timeout=60)
+        assert time.monotonic() - started < 1
+    finally:
+        writer.execute("ROLLBACK")
+        writer.close()
+
+def test_expired_lease_is_taken_over(tmp_path):
+    cache = SharedCache(str(tmp_path / "cache.db"), max_bytes=1 << 20)
+    assert cache._acquire_lease("k", "owner", timeout=-1)
+    assert cache._acquire_lease("k", "waiter", timeout=60)
+    assert not cache._acquire_lease("k", "third", timeout=60)
@@ -0,0 +1,100 @@
+"""
+Tests for the entity and topic index
+Row creation under concurrent inserts, topic degree bookkeeping and rebuilding in topic_index.py
+"""
+import json
+
+from sqlalchemy import event, insert, select
+
+import topic_index
+from content_store import QUIZ, store_contents
+from database import Entity, Quiz, Topic, TopicLink, engine
+
+def _quiz_data(related_topics, people=()) -> dict:
+    return {
+        "summary": "Summary.",
+        "key_entities": {"people": list(people), "organizations": [], "locations": []},
+        "sections": ["History"],
+        "quiz": [],
+        "related_topics": list(related_topics),
+    }
+
+def _degrees(session) -> dict:
+    return dict(session.execute(select(Topic.name, Topic.degree)).all())
+
+def _topic_ids(session, *names) -> list:
+    ids = topic_index._ensure_rows(session, Topic, {(topic_index.name_key(name),): name for name in names}, ("name_key",))
+    return [ids[(topic_index.name_key(name),)] for name in names]
+
+def test_ensure_rows_falls_back_when_a_concurrent_insert_wins(db_session, monkeypatch):
+    begin_nested = db_session.begin_nested
+    raced = []
+
+    def racing_begin_nested():
+        # Another transaction commits "beta" between the lookup and the batched insert
+        if not raced:
+            raced.append(True)
+            db_session.execute(insert(Topic).values(name_key="beta", name="Beta (other writer)"))
+        return begin_nested()
+
+    monkeypatch.setattr(db_session, "begin_nested", racing_begin_nested)
+    names = {("alpha",): "Alpha", ("beta",): "Beta", ("gamma",): "Gamma"}
+    ids = topic_index._ensure_rows(db_session, Topic, names, ("name_key",))
+
+    rows = {row.name_key: row for row in db_session.execute(select(Topic)).scalars()}
+    assert set(rows) == {"alpha", "beta", "gamma"}
+    assert ids == {(key,): rows[key].id for key in rows}
+    assert rows["beta"].name == "Beta (other writer)"
+
+def test_ensure_rows_keys_entities_by_name_and_kind(db_session):
+    names = {("paris", "locations"): "Paris", ("paris", "people"): "Paris"}
+    ids = topic_index._ensure_rows(db_session, Entity, names, ("name_key", "kind"))
+    assert len(set(ids.values())) == 2
+    assert topic_index._ensure_rows(db_session, Entity, names, ("name_key", "kind")) == ids
+
+def test_degree_changes_counts_links_created_with_their_reverse_once(db_session):
+    a, b, c = _topic_ids(db_session, "A", "B", "C")
+    assert topic_index._degree_changes(db_session, {(a, b), (b, a), (a, c)}) == {a: 2, b: 1, c: 1}
+
+def test_degree_changes_ignores_links_whose_reverse_exists(db_session):
+    a, b, c = _topic_ids(db_session, "A", "B", "C")
+    db_session.execute(insert(TopicLink).values(source_topic_id=b, target_topic_id=a, quiz_count=1))
+    assert topic_index._degree_changes(db_session, {(a, b), (a, c)}) == {a: 1, c: 1}
+
+def test_index_quizzes_counts_distinct_neighbours(db_session):
+    topic_index.index_quizzes(db_session, [
+        (1, "Alpha", _quiz_data(["Beta", "Gamma"], people=["José"])),
+        (2, "Beta", _quiz_data(["alpha"], people=["Jose"])),
+    ])
+    topic_index.index_quizzes(db_session, [(3, "Alpha", _quiz_data(["Beta"], people=["josé"]))])
+
+    assert _degrees(db_session) == {"Alpha": 2, "Beta": 1, "Gamma": 1}
+    link = db_session.execute(select(TopicLink).join(Topic, Topic.id == TopicLink.target_topic_id).where(Topic.name == "Beta")).scalar_one()
+    assert link.quiz_count == 2
+    people = dict(db_session.execute(select(Entity.name, Entity.quiz_count).where(Entity.kind == "people")).all())
+    assert people == {"José": 2, "Jose": 1}
+
+def test_rebuild_loads_quiz_content_per_batch_not_per_quiz(db_session):
+    documents = [_quiz_data([f"Topic {n}"]) for n in range(6)]
+    blobs = store_contents(db_session, QUIZ, [json.dumps(document) for document in documents[:4]])
+    db_session.add_all([Quiz(url=f"u{n}", title=f"Article {n}", quiz_content=blob) for n, blob in enumerate(blobs)])
+    # Rows saved before content_blobs existed keep their JSON in the legacy column
+    db_session.add_all([Quiz(url=f"u{n}", title=f"Article {n}", full_quiz_data_legacy=json.dumps(documents[n])) for n in (4, 5)])
+    db_session.commit()
+
+    selects = []
+
+    def count_selects(conn, cursor, statement, *args):
+        if statement.lstrip().upper().startswith("SELECT"):
+            selects.append(statement)
+
+    event.listen(engine, "before_cursor_execute", count_selects)
+    try:
+        assert topic_index.rebuild(db_session, batch_size=3) == 6
+    finally:
+        event.remove(engine, "before_cursor_execute", count_selects)
+
+    quiz_selects = [statement for statement in selects if "FROM quizzes" in statement or "FROM content_blobs" in statement]
+    assert len(quiz_selects) <= 5  # Two batches of (quizzes, blobs), then the empty page
+    assert _degrees(db_session)["Topic 5"] == 1
+    assert len(_degrees(db_session)) == 12
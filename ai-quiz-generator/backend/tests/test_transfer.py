@@ -0,0 +1,92 @@
+"""
+Tests for bulk export and import
+Dedupe keys and export/import round trips (plain and zstd) in transfer.py
+"""
+import io
+import json
+from datetime import datetime
+
+from sqlalchemy import select
+
+import content_store
+import search_index
+from database import Base, Quiz, create_tables, engine
+from models import QuizOutput
+from persistence import NewQuiz, save_quizzes
+from transfer import _dedupe_key, export_quizzes, import_quizzes, open_export, zstd_stream
+
+GENERATED = datetime(2024, 5, 1, 12, 30)
+
+def _quiz(summary: str) -> QuizOutput:
+    return QuizOutput(
+        summary=summary,
+        key_entities={"people": [], "organizations": [], "locations": []},
+        sections=["History"],
+        quiz=[
+            {"question": f"Question {n}?", "options": ["a", "b", "c", "d"], "answer": "a", "difficulty": "easy", "explanation": "-"}
+            for n in range(5)
+        ],
+        related_topics=[],
+    )
+
+def _seed(session) -> None:
+    save_quizzes(session, [
+        NewQuiz("https://en.wikipedia.org/wiki/Alan_Turing", "Alan Turing", "Article text ünïcödé", _quiz("A mathematician."),
+                date_generated=GENERATED, user_answers=json.dumps({"0": "a"})),
+        NewQuiz("https://en.wikipedia.org/wiki/Cheese", "Cheese", None, _quiz("A dairy product."), date_generated=GENERATED),
+    ])
+    session.commit()
+
+def _snapshot(session) -> list:
+    return [
+        (quiz.url, quiz.title, quiz.date_generated, quiz.scraped_content, json.loads(quiz.full_quiz_data), quiz.user_answers)
+        for quiz in session.execute(select(Quiz).order_by(Quiz.id)).scalars()
+    ]
+
+def _reset_database(session) -> None:
+    """Start over with empty tables, as if importing into a fresh installation"""
+    session.close()
+    Base.metadata.drop_all(bind=engine)
+    create_tables()
+    search_index.ensure_search_index()
+    content_store._dictionaries.clear()
+    content_store._active_dictionary_ids.clear()
+    content_store._local.__dict__.clear()
+
+def test_dedupe_key_modes():
+    url = "https://en.wikipedia.org/wiki/Cheese"
+    later = datetime(2024, 6, 1)
+    assert _dedupe_key(url, GENERATED, "quiz") != _dedupe_key(url, later, "quiz")
+    assert _dedupe_key(url, GENERATED, "url") == _dedupe_key(url, later, "url")
+    assert _dedupe_key(url, GENERATED, "quiz") == _dedupe_key(url, GENERATED, "quiz")
+    assert len(_dedupe_key(url, GENERATED, "url")) == 32
+
+def test_round_trip_into_an_empty_database(db_session):
+    _seed(db_session)
+    expected = _snapshot(db_session)
+    export = b"".join(export_quizzes(db_session, batch_size=1))
+    assert export.count(b"\n") == 2
+
+    _reset_database(db_session)
+    stats = import_quizzes(db_session, open_export(io.BytesIO(export)), batch_size=1)
+    assert (stats.rows, stats.skipped, stats.invalid) == (2, 0, 0)
+    assert _snapshot(db_session) == expected
+    assert [result["title"] for result in search_index.search(db_session, "mathematician")[1]] == ["Alan Turing"]
+
+def test_zstd_round_trip_and_reimport_skips_duplicates(db_session):
+    _seed(db_session)
+    expected = _snapshot(db_session)
+    compressed = b"".join(zstd_stream(export_quizzes(db_session, include_content=False)))
+
+    stats = import_quizzes(db_session, open_export(io.BytesIO(compressed)))
+    assert (stats.rows, stats.skipped) == (0, 2)
+    assert _snapshot(db_session) == expected
+
+    # "url" mode also skips a quiz generated at another time; "quiz" mode keeps it
+    line = json.loads(open_export(io.BytesIO(compressed)).readline())
+    line["date_generated"] = datetime(2024, 6, 1).isoformat()
+    lines = [json.dumps(line).encode("utf-8"), b"not json\n"]
+    assert import_quizzes(db_session, lines, dedupe="url").skipped == 1
+    stats = import_quizzes(db_session, lines, dedupe="quiz")
+    assert (stats.rows, stats.invalid) == (1, 1)
+    assert len(_snapshot(db_session)) == 3
@@ -0,0 +1,163 @@
+"""
+Tests for the answer write-behind buffer
+Flushing, re-queueing on failure, max_pending rejection and isolation of bad submissions
+"""
+import asyncio
+import json
+
+from sqlalchemy import exc
+
+from scoring import AnswerKey
+from write_behind import AnswerWriteBuffer, Submission
+
+class FakeDatabase:
+    """Session factory recording written batches; fails batches containing a poison quiz or while down"""
+
+    def __init__(self, poison=(), down_after=None):
+        self.poison = set(poison)
+        self.down = False
+        self.down_after = down_after
+        self.batches = []
+        self.attempts = 0
+
+    def __call__(self):
+        return FakeSession(self)
+
+class FakeSession:
+    def __init__(self, database: FakeDatabase):
+        self.database = database
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+    async def run_sync(self, fn, batch):
+        self.database.attempts += 1
+        if self.database.attempts == self.database.down_after:
+            self.database.down = True
+        if self.database.down:
+            raise exc.OperationalError("UPDATE quizzes", {}, Exception("database is locked"))
+        if any(submission.answer_key.quiz_id in self.database.poison for submission in batch):
+            raise exc.IntegrityError("UPDATE quizzes", {}, Exception("constraint failed"))
+        self.database.batches.append([submission.answer_key.quiz_id for submission in batch])
+
+    async def commit(self):
+        pass
+
+def _submission(quiz_id: int, answer: str = "a") -> Submission:
+    key = AnswerKey(quiz_id, ("a", "b"), ("easy", "hard"))
+    answers = {"0": answer}
+    return Submission(key, answers, key.grade(answers))
+
+def _written(database: FakeDatabase):
+    return sorted(quiz_id for batch in database.batches for quiz_id in batch)
+
+def test_flush_writes_pending_in_one_batch_and_forgets_read_your_writes():
+    async def scenario():
+        database = FakeDatabase()
+        buffer = AnswerWriteBuffer(session_factory=database, batch_size=100)
+        for quiz_id in range(3):
+            assert await buffer.submit(_submission(quiz_id))
+        assert buffer.pending_answers(1) == json.dumps({"0": "a"})
+
+        assert await buffer.flush()
+        assert database.batches == [[0, 1, 2]]
+        assert buffer.pending_count == 0
+        assert buffer.pending_answers(1) is None
+        assert buffer.flushed_submissions == 3
+
+    asyncio.run(scenario())
+
+def test_failed_flush_requeues_the_batch_in_order():
+    async def scenario():
+        database = FakeDatabase()
+        buffer = AnswerWriteBuffer(session_factory=database)
+        await buffer.submit(_submission(1))
+        database.down = True
+        assert not await buffer.flush()
+        await buffer.submit(_submission(2))
+        assert [s.answer_key.quiz_id for s in buffer._pending] == [1, 2]
+        assert buffer.pending_answers(1) is not None
+
+        database.down = False
+        assert await buffer.flush()
+        assert database.batches == [[1, 2]]
+
+    asyncio.run(scenario())
+
+def test_submit_is_rejected_at_max_pending_while_flushes_fail():
+    async def scenario():
+        database = FakeDatabase()
+        buffer = AnswerWriteBuffer(session_factory=database, max_pending=2)
+        database.down = True
+        assert await buffer.submit(_submission(1))
+        assert await buffer.submit(_submission(2))
+        assert not await buffer.submit(_submission(3))
+        assert buffer.rejected_submissions == 1
+        assert buffer.pending_count == 2
+
+        # Once the database recovers, a submission at the cap waits for a flush and is queued
+        database.down = False
+        buffer._last_flush_failed = False
+        assert await buffer.submit(_submission(3))
+        assert _written(database) == [1, 2]
+        assert buffer.pending_count == 1
+
+    asyncio.run(scenario())
+
+def test_poison_submission_is_isolated_and_dead_lettered(tmp_path):
+    async def scenario():
+        database = FakeDatabase(poison={5})
+        dead_letter = tmp_path / "dead.ndjson"
+        buffer = AnswerWriteBuffer(session_factory=database, max_attempts=2, dead_letter_path=str(dead_letter))
+        for quiz_id in range(8):
+            await buffer.submit(_submission(quiz_id))
+
+        assert not await buffer.flush()
+        assert buffer.pending_count == 8
+        assert await buffer.flush()
+
+        assert _written(database) == [0, 1, 2, 3, 4, 6, 7]
+        assert buffer.pending_count == 0
+        assert buffer.dead_lettered_submissions == 1
+        assert buffer.pending_answers(5) is None
+        records = [json.loads(line) for line in dead_letter.read_text().splitlines()]
+        assert [record["quiz_id"] for record in records] == [5]
+        assert records[0]["answers"] == {"0": "a"}
+
+        # Later submissions are no longer blocked
+        await buffer.submit(_submission(9))
+        assert await buffer.flush()
+        assert database.batches[-1] == [9]
+
+    asyncio.run(scenario())
+
+def test_unavailable_database_never_drops_submissions():
+    async def scenario():
+        database = FakeDatabase()
+        buffer = AnswerWriteBuffer(session_factory=database, max_attempts=2)
+        for quiz_id in range(4):
+            await buffer.submit(_submission(quiz_id))
+        database.down = True
+        for _ in range(5):
+            assert not await buffer.flush()
+        assert buffer.pending_count == 4
+        assert buffer.dead_lettered_submissions == 0
+
+    asyncio.run(scenario())
+
+def test_database_lost_during_isolation_requeues_the_unwritten_rest():
+    async def scenario():
+        # The whole batch fails, [0, 1] fails, 0 fails alone, then the database goes away
+        database = FakeDatabase(poison={0}, down_after=4)
+        buffer = AnswerWriteBuffer(session_factory=database, max_attempts=1)
+        for quiz_id in range(4):
+            await buffer.submit(_submission(quiz_id))
+
+        assert not await buffer.flush()
+        assert buffer.dead_lettered_submissions == 1
+        assert [s.answer_key.quiz_id for s in buffer._pending] == [1, 2, 3]
+
+    asyncio.run(scenario())
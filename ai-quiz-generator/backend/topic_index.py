@@ -0,0 +1,447 @@
+"""
+Inverted index over key entities, sections and related topics
+Normalized entity and topic-graph tables maintained at save time, so lookups never deserialize quizzes
+"""
+import argparse
+import json
+import logging
+import re
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy import bindparam, delete, exists, insert, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session, selectinload, undefer
+
+from database import Entity, Quiz, QuizEntity, SessionLocal, Topic, TopicLink, create_tables
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+ENTITY_KINDS = ("people", "organizations", "locations", "sections")
+MAX_NAME_LENGTH = 200  # Entity.name / Topic.name column size
+CHUNK = 500  # Keys per IN (...) lookup
+
+def name_key(name: str) -> str:
+    """Lookup form of a name: case-folded, underscores as spaces, whitespace collapsed"""
+    return re.sub(r"\s+", " ", name.replace("_", " ")).strip().casefold()[:MAX_NAME_LENGTH]
+
+def _clean_names(names: Iterable[Any]) -> Dict[str, str]:
+    """{name_key: display name} for the non-empty names, first spelling wins"""
+    cleaned: Dict[str, str] = {}
+    for name in names:
+        if not isinstance(name, str):
+            continue
+        key = name_key(name)
+        if key and key not in cleaned:
+            cleaned[key] = re.sub(r"\s+", " ", name.replace("_", " ")).strip()[:MAX_NAME_LENGTH]
+    return cleaned
+
+def _ensure_rows(session: Session, model, names: Dict[tuple, str], key_columns: Tuple[str, ...]) -> Dict[tuple, int]:
+    """
+    Look up rows by their key columns, inserting the missing ones.
+
+    Args:
+        session (Session): Database session
+        model: Entity or Topic
+        names (Dict[tuple, str]): Display name per key (values of key_columns, name_key first)
+        key_columns (Tuple[str, ...]): Unique key columns
+
+    Returns:
+        Dict[tuple, int]: Row id per key
+
+    Raises:
+        ValueError: If some keys have no row even after inserting them (the key columns
+            compare differently from the keys, e.g. a case- or accent-insensitive collation)
+    """
+    table = model.__table__
+    ids: Dict[tuple, int] = {}
+
+    def load(keys: List[tuple]) -> None:
+        leading = list({key[0] for key in keys})
+        for start in range(0, len(leading), CHUNK):
+            rows = session.execute(
+                select(table.c.id, *(table.c[column] for column in key_columns))
+                .where(table.c[key_columns[0]].in_(leading[start:start + CHUNK]))
+            )
+            for row in rows:
+                key = tuple(row[1:])
+                if key in names:
+                    ids[key] = row[0]
+
+    load(list(names))
+    missing = [key for key in names if key not in ids]
+    if not missing:
+        return ids
+    rows = [{**dict(zip(key_columns, key)), "name": names[key]} for key in missing]
+    try:
+        with session.begin_nested():
+            session.execute(insert(table), rows)
+    except IntegrityError:
+        # A concurrent transaction added some of them - insert the rest one by one
+        for row in rows:
+            try:
+                with session.begin_nested():
+                    session.execute(insert(table).values(**row))
+            except IntegrityError:
+                pass
+    load(missing)
+    unmatched = [key for key in missing if key not in ids]
+    if unmatched:
+        raise ValueError(f"No {table.name} row matches {len(unmatched)} keys after inserting them, e.g. {unmatched[0]!r}")
+    return ids
+
+def _add_counts(session: Session, model, column: str, deltas: Dict[int, int]) -> None:
+    """column += delta per row id, with one executemany UPDATE (atomic on every backend)"""
+    if not deltas:
+        return
+    table = model.__table__
+    session.execute(
+        update(table).where(table.c.id == bindparam("row_id")).values({column: table.c[column] + bindparam("delta")}),
+        [{"row_id": row_id, "delta": delta} for row_id, delta in deltas.items()]
+    )
+
+def _link_pairs(session: Session, model, source_column: str, target_column: str, pairs: Counter, count_column: Optional[str] = None) -> Set[tuple]:
+    """
+    Insert link rows, or add to their count column when they exist.
+
+    Returns:
+        Set[tuple]: The pairs that did not exist before
+    """
+    table = model.__table__
+    sources = list({source for source, _ in pairs})
+    existing: Set[tuple] = set()
+    for start in range(0, len(sources), CHUNK):
+        existing.update(
+            tuple(row) for row in session.execute(
+                select(table.c[source_column], table.c[target_column]).where(table.c[source_column].in_(sources[start:start + CHUNK]))
+            )
+        )
+    if count_column:
+        updates = [{"s": source, "t": target, "delta": count} for (source, target), count in pairs.items() if (source, target) in existing]
+        if updates:
+            session.execute(
+                update(table)
+                .where(table.c[source_column] == bindparam("s"), table.c[target_column] == bindparam("t"))
+                .values({count_column: table.c[count_column] + bindparam("delta")}),
+                updates
+            )
+
+    new_pairs = [pair for pair in pairs if pair not in existing]
+    rows = [
+        {source_column: source, target_column: target, **({count_column: pairs[(source, target)]} if count_column else {})}
+        for source, target in new_pairs
+    ]
+    if not rows:
+        return set()
+    try:
+        with session.begin_nested():
+            session.execute(insert(table), rows)
+        return set(new_pairs)
+    except IntegrityError:
+        # A concurrent transaction created some of these links first
+        created = set()
+        for pair, row in zip(new_pairs, rows):
+            try:
+                with session.begin_nested():
+                    session.execute(insert(table).values(**row))
+                created.add(pair)
+            except IntegrityError:
+                if count_column:
+                    session.execute(
+                        update(table)
+                        .where(table.c[source_column] == pair[0], table.c[target_column] == pair[1])
+                        .values({count_column: table.c[count_column] + pairs[pair]})
+                    )
+        return created
+
+def index_quizzes(session: Session, quizzes: List[Tuple[int, str, Dict[str, Any]]]) -> None:
+    """
+    Add quizzes to the entity and topic index (call inside the transaction that saves them).
+
+    Each entity counts the quizzes that mention it. Each quiz links its article title to its
+    related topics; a topic's degree counts the distinct topics it is linked with.
+
+    Args:
+        session (Session): Database session
+        quizzes (List[Tuple[int, str, Dict[str, Any]]]): (quiz_id, title, quiz_data) per new quiz
+    """
+    if not quizzes:
+        return
+
+    entity_names: Dict[tuple, str] = {}
+    quiz_entity_keys: List[Tuple[int, List[tuple]]] = []
+    topic_names: Dict[tuple, str] = {}
+    quiz_links: List[Tuple[tuple, List[tuple]]] = []
+    for quiz_id, title, quiz_data in quizzes:
+        entities = quiz_data.get("key_entities") or {}
+        keys = []
+        for kind in ENTITY_KINDS:
+            names = quiz_data.get("sections") if kind == "sections" else entities.get(kind)
+            for key, name in _clean_names(names or []).items():
+                entity_names.setdefault((key, kind), name)
+                keys.append((key, kind))
+        quiz_entity_keys.append((quiz_id, keys))
+
+        title_names = _clean_names([title])
+        if not title_names:
+            continue
+        source = next(iter(title_names))
+        topic_names.setdefault((source,), title_names[source])
+        targets = []
+        for key, name in _clean_names(quiz_data.get("related_topics") or []).items():
+            if key != source:
+                topic_names.setdefault((key,), name)
+                targets.append((key,))
+        quiz_links.append(((source,), targets))
+
+    entity_ids = _ensure_rows(session, Entity, entity_names, ("name_key", "kind"))
+    # Looked up by quiz (a handful of rows each), not by entity (popular ones have thousands)
+    mentions = Counter(
+        (quiz_id, entity_ids[key]) for quiz_id, keys in quiz_entity_keys for key in keys
+    )
+    new_mentions = _link_pairs(session, QuizEntity, "quiz_id", "entity_id", mentions)
+    _add_counts(session, Entity, "quiz_count", Counter(entity_id for _, entity_id in new_mentions))
+
+    topic_ids = _ensure_rows(session, Topic, topic_names, ("name_key",))
+    links = Counter(
+        (topic_ids[source], topic_ids[target]) for source, targets in quiz_links for target in targets
+    )
+    new_links = _link_pairs(session, TopicLink, "source_topic_id", "target_topic_id", links, "quiz_count")
+    _add_counts(session, Topic, "degree", _degree_changes(session, new_links))
+
+def _degree_changes(session: Session, new_links: Set[tuple]) -> Counter:
+    """
+    Degree increments for newly created links.
+
+    Degree counts distinct neighbours, so a link whose reverse already existed adds nothing,
+    and a link created together with its reverse counts once.
+    """
+    reverse_sources = list({target for _, target in new_links})
+    existing_reverse: Set[tuple] = set()
+    for start in range(0, len(reverse_sources), CHUNK):
+        existing_reverse.update(
+            tuple(row) for row in session.execute(
+                select(TopicLink.source_topic_id, TopicLink.target_topic_id)
+                .where(TopicLink.source_topic_id.in_(reverse_sources[start:start + CHUNK]))
+            )
+        )
+
+    degrees: Counter = Counter()
+    for source, target in new_links:
+        if (target, source) in new_links:
+            if source > target:
+                continue  # Counted with its reverse
+        elif (target, source) in existing_reverse:
+            continue
+        degrees[source] += 1
+        degrees[target] += 1
+    return degrees
+
+def index_quiz(session: Session, quiz_id: int, title: str, quiz_data: Dict[str, Any]) -> None:
+    """
+    Add a quiz to the entity and topic index (call inside the transaction that saves the quiz).
+
+    Args:
+        session (Session): Database session
+        quiz_id (int): Quiz ID
+        title (str): Article title
+        quiz_data (Dict[str, Any]): Quiz data matching the QuizOutput schema
+    """
+    index_quizzes(session, [(quiz_id, title, quiz_data)])
+
+def _entity_dict(entity) -> Dict[str, Any]:
+    return {"id": entity.id, "kind": entity.kind, "name": entity.name, "quiz_count": entity.quiz_count}
+
+def search_entities(session: Session, query: str, kind: Optional[str] = None, limit: int = 20) -> List[Dict[str, Any]]:
+    """
+    Entities whose normalized name starts with the query, most-quizzed first.
+
+    Args:
+        session (Session): Database session
+        query (str): Name prefix (any case)
+        kind (Optional[str]): Restrict to one of ENTITY_KINDS
+        limit (int): Maximum number of entities
+
+    Returns:
+        List[Dict[str, Any]]: Entities with id, kind, name and quiz_count
+    """
+    prefix = name_key(query)
+    if not prefix:
+        return []
+    # A range on the indexed key instead of LIKE, which ignores the index on most backends
+    statement = select(Entity).where(Entity.name_key >= prefix, Entity.name_key < prefix + "\U0010ffff")
+    if kind:
+        statement = statement.where(Entity.kind == kind)
+    rows = session.execute(statement.order_by(Entity.quiz_count.desc(), Entity.name_key).limit(limit)).scalars()
+    return [_entity_dict(entity) for entity in rows]
+
+def entity_quizzes(session: Session, entity_id: int, limit: int = 20, offset: int = 0) -> Optional[Dict[str, Any]]:
+    """
+    An entity and a page of the quizzes that mention it, newest first.
+
+    Args:
+        session (Session): Database session
+        entity_id (int): Entity ID
+        limit (int): Page size
+        offset (int): Number of quizzes to skip
+
+    Returns:
+        Optional[Dict[str, Any]]: Entity fields plus "quizzes" (id, url, title, date_generated), or None if not found
+    """
+    entity = session.get(Entity, entity_id)
+    if entity is None:
+        return None
+    rows = session.execute(
+        select(Quiz.id, Quiz.url, Quiz.title, Quiz.date_generated)
+        .join(QuizEntity, QuizEntity.quiz_id == Quiz.id)
+        .where(QuizEntity.entity_id == entity_id)
+        .order_by(Quiz.id.desc())
+        .limit(limit)
+        .offset(offset)
+    ).mappings().all()
+    return {**_entity_dict(entity), "quizzes": [dict(row) for row in rows]}
+
+def neighbors(session: Session, name: str, limit: int = 20) -> Optional[Dict[str, Any]]:
+    """
+    Topics linked to a topic, in either direction, strongest links first.
+
+    Args:
+        session (Session): Database session
+        name (str): Topic name (any case)
+        limit (int): Maximum topics per direction
+
+    Returns:
+        Optional[Dict[str, Any]]: Topic fields plus "related" (topics this one suggests) and
+            "referenced_by" (topics that suggest this one), each with quiz_count; None if unknown
+    """
+    topic = session.execute(select(Topic).where(Topic.name_key == name_key(name))).scalar_one_or_none()
+    if topic is None:
+        return None
+
+    def linked(own_column, other_column) -> List[Dict[str, Any]]:
+        rows = session.execute(
+            select(Topic.id, Topic.name, Topic.degree, TopicLink.quiz_count)
+            .join(TopicLink, other_column == Topic.id)
+            .where(own_column == topic.id)
+            .order_by(TopicLink.quiz_count.desc(), Topic.degree.desc(), Topic.id)
+            .limit(limit)
+        ).mappings().all()
+        return [dict(row) for row in rows]
+
+    return {
+        "id": topic.id,
+        "name": topic.name,
+        "degree": topic.degree,
+        "related": linked(TopicLink.source_topic_id, TopicLink.target_topic_id),
+        "referenced_by": linked(TopicLink.target_topic_id, TopicLink.source_topic_id),
+    }
+
+def most_connected(session: Session, limit: int = 20) -> List[Dict[str, Any]]:
+    """
+    Topics with the most distinct linked topics.
+
+    Args:
+        session (Session): Database session
+        limit (int): Maximum number of topics
+
+    Returns:
+        List[Dict[str, Any]]: Topics with id, name and degree
+    """
+    rows = session.execute(
+        select(Topic.id, Topic.name, Topic.degree).order_by(Topic.degree.desc(), Topic.id).limit(limit)
+    ).mappings().all()
+    return [dict(row) for row in rows]
+
+def is_initialized(session: Session) -> bool:
+    """Whether the index has been built (or there is nothing to build it from)"""
+    if session.execute(select(exists().where(Topic.id.isnot(None)))).scalar():
+        return True
+    if session.execute(select(exists().where(Entity.id.isnot(None)))).scalar():
+        return True
+    return not session.execute(select(exists().where(Quiz.id.isnot(None)))).scalar()
+
+def rebuild(session: Session, batch_size: int = 200) -> int:
+    """
+    Rebuild the entity and topic index from all stored quizzes.
+
+    Args:
+        session (Session): Database session
+        batch_size (int): Quizzes loaded per query
+
+    Returns:
+        int: Number of quizzes indexed
+    """
+    for model in (QuizEntity, TopicLink, Entity, Topic):
+        session.execute(delete(model))
+
+    indexed = 0
+    last_id = 0
+    while True:
+        # Quiz JSON blobs (or the legacy column) for the whole batch in two queries, not one per quiz
+        batch = session.execute(
+            select(Quiz)
+            .options(selectinload(Quiz.quiz_content), undefer(Quiz.full_quiz_data_legacy))
+            .where(Quiz.id > last_id)
+            .order_by(Quiz.id)
+            .limit(batch_size)
+        ).scalars().all()
+        if not batch:
+            break
+
+        documents = []
+        for quiz in batch:
+            try:
+                documents.append((quiz.id, quiz.title, json.loads(quiz.full_quiz_data)))
+            except ValueError:
+                logger.warning(f"Skipping quiz {quiz.id}: quiz data is not valid JSON")
+        index_quizzes(session, documents)
+        indexed += len(documents)
+
+        last_id = batch[-1].id
+        session.expunge_all()
+
+    session.commit()
+    logger.info(f"Topic index rebuilt with {indexed} quizzes")
+    return indexed
+
+def main() -> None:
+    """Command line entry point: rebuild or query the index"""
+    parser = argparse.ArgumentParser(description="Entity and related-topic index")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("rebuild", help="Re-index all existing quizzes")
+    entity_parser = subparsers.add_parser("entity", help="Find entities by name prefix")
+    entity_parser.add_argument("query")
+    entity_parser.add_argument("--kind", choices=ENTITY_KINDS)
+    entity_parser.add_argument("--limit", type=int, default=10)
+    neighbors_parser = subparsers.add_parser("neighbors", help="Topics linked to a topic")
+    neighbors_parser.add_argument("name")
+    neighbors_parser.add_argument("--limit", type=int, default=10)
+    top_parser = subparsers.add_parser("top", help="Most connected topics")
+    top_parser.add_argument("--limit", type=int, default=10)
+    args = parser.parse_args()
+
+    create_tables()
+    with SessionLocal() as session:
+        if args.command == "rebuild":
+            print(f"Indexed {rebuild(session)} quizzes")
+        elif args.command == "entity":
+            for entity in search_entities(session, args.query, args.kind, args.limit):
+                print(f"{entity['quiz_count']:>6}  #{entity['id']}  [{entity['kind']}]  {entity['name']}")
+        elif args.command == "neighbors":
+            result = neighbors(session, args.name, args.limit)
+            if result is None:
+                print(f"Unknown topic: {args.name}")
+                return
+            print(f"{result['name']} (degree {result['degree']})")
+            for label in ("related", "referenced_by"):
+                print(f"  {label}:")
+                for topic in result[label]:
+                    print(f"  {topic['quiz_count']:>6}  {topic['name']}")
+        else:
+            for topic in most_connected(session, args.limit):
+                print(f"{topic['degree']:>6}  #{topic['id']}  {topic['name']}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,327 @@
+"""
+Bulk export and import of quiz history
+Streams quizzes as NDJSON (optionally zstd-compressed) with constant memory in both directions
+"""
+import argparse
+import hashlib
+import io
+import json
+import logging
+import os
+import sys
+import time
+from datetime import datetime
+from typing import BinaryIO, Dict, Iterable, Iterator, List, Optional, Set
+
+import zstandard as zstd
+from pydantic import ValidationError
+from sqlalchemy import select
+from sqlalchemy.orm import Session, aliased
+
+from content_store import decompress, load_dictionaries
+from database import ContentBlob, Quiz, SessionLocal, begin_write, create_tables
+from models import QuizOutput
+from persistence import NewQuiz, save_quizzes
+from search_index import ensure_search_index
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "500"))     # Rows fetched per cursor round trip
+IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", "1000"))    # Rows inserted per transaction
+EXPORT_CHUNK_BYTES = 256 * 1024  # Output is yielded in chunks of about this size
+EXPORT_COMPRESSION_LEVEL = 3     # Fast streaming level; stored blobs already use trained dictionaries
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+
+# Dedupe modes for imports: "quiz" skips a quiz whose URL and generation time already exist
+# (re-importing the same export is a no-op); "url" skips any quiz for an already known URL
+DEDUPE_MODES = ("quiz", "url")
+
+class TransferStats:
+    """Row and byte counts for one export or import run"""
+
+    def __init__(self):
+        self.rows = 0
+        self.skipped = 0
+        self.invalid = 0
+        self.bytes = 0
+        self.started = time.perf_counter()
+        self.finished: Optional[float] = None
+
+    @property
+    def elapsed(self) -> float:
+        return (self.finished or time.perf_counter()) - self.started
+
+    @property
+    def rows_per_sec(self) -> float:
+        return self.rows / self.elapsed if self.elapsed > 0 else 0.0
+
+    def summary(self) -> str:
+        details = f"{self.rows} rows in {self.elapsed:.2f}s ({self.rows_per_sec:.0f} rows/s, {self.bytes / 1e6:.1f} MB)"
+        if self.skipped or self.invalid:
+            details += f", {self.skipped} duplicates skipped, {self.invalid} invalid"
+        return details
+
+def _export_row(session: Session, row, include_content: bool) -> bytes:
+    """Serialize one result row as an NDJSON line, splicing in the stored quiz JSON as-is"""
+    if row.quiz_data is not None:
+        quiz_json = decompress(session, row.quiz_data, row.quiz_dictionary_id, row.quiz_raw_size)
+    else:
+        quiz_json = row.full_quiz_data_legacy
+
+    user_answers = None
+    if row.user_answers:
+        try:
+            user_answers = json.loads(row.user_answers)
+        except ValueError:
+            logger.warning(f"Exporting quiz {row.id} without its unreadable user answers")
+
+    header = {
+        "id": row.id,
+        "url": row.url,
+        "title": row.title,
+        "date_generated": row.date_generated.isoformat(),
+        "user_answers": user_answers,
+    }
+    if include_content:
+        if row.article_data is not None:
+            header["scraped_content"] = decompress(session, row.article_data, row.article_dictionary_id, row.article_raw_size)
+        else:
+            header["scraped_content"] = row.scraped_content_legacy
+    # The quiz JSON is already serialized - append it instead of parsing and re-encoding it
+    return (json.dumps(header, ensure_ascii=False)[:-1] + ', "quiz": ' + quiz_json + "}\n").encode("utf-8")
+
+def export_quizzes(
+    session: Session,
+    include_content: bool = True,
+    batch_size: int = EXPORT_BATCH_SIZE,
+    stats: Optional[TransferStats] = None
+) -> Iterator[bytes]:
+    """
+    Stream all quizzes as NDJSON, one quiz per line, in id order.
+
+    Rows are read through a server-side cursor (yield_per), so memory use does not
+    grow with the size of the table.
+
+    Args:
+        session (Session): Database session (must stay open until the iterator is exhausted)
+        include_content (bool): Include the scraped article text
+        batch_size (int): Rows fetched per cursor round trip
+        stats (Optional[TransferStats]): Updated with row and byte counts as lines are produced
+
+    Yields:
+        bytes: Chunks of NDJSON lines
+    """
+    stats = stats or TransferStats()
+    # Load dictionaries up front - the connection is busy with the open cursor while streaming
+    load_dictionaries(session)
+
+    quiz_blob = aliased(ContentBlob)
+    columns = [
+        Quiz.id, Quiz.url, Quiz.title, Quiz.date_generated, Quiz.user_answers, Quiz.full_quiz_data_legacy,
+        quiz_blob.data.label("quiz_data"),
+        quiz_blob.dictionary_id.label("quiz_dictionary_id"),
+        quiz_blob.raw_size.label("quiz_raw_size"),
+    ]
+    query = select(*columns).outerjoin(quiz_blob, Quiz.quiz_content_id == quiz_blob.id)
+    if include_content:
+        article_blob = aliased(ContentBlob)
+        query = query.add_columns(
+            Quiz.scraped_content_legacy,
+            article_blob.data.label("article_data"),
+            article_blob.dictionary_id.label("article_dictionary_id"),
+            article_blob.raw_size.label("article_raw_size"),
+        ).outerjoin(article_blob, Quiz.article_content_id == article_blob.id)
+
+    result = session.execute(query.order_by(Quiz.id).execution_options(yield_per=batch_size))
+    chunk: List[bytes] = []
+    chunk_size = 0
+    for row in result:
+        line = _export_row(session, row, include_content)
+        chunk.append(line)
+        chunk_size += len(line)
+        stats.rows += 1
+        if chunk_size >= EXPORT_CHUNK_BYTES:
+            stats.bytes += chunk_size
+            yield b"".join(chunk)
+            chunk, chunk_size = [], 0
+    if chunk:
+        stats.bytes += chunk_size
+        yield b"".join(chunk)
+    stats.finished = time.perf_counter()
+
+def zstd_stream(chunks: Iterable[bytes], level: int = EXPORT_COMPRESSION_LEVEL) -> Iterator[bytes]:
+    """
+    Compress a stream of chunks into a single zstd frame.
+
+    Args:
+        chunks (Iterable[bytes]): Uncompressed chunks
+        level (int): zstd compression level
+
+    Yields:
+        bytes: Compressed chunks
+    """
+    compressor = zstd.ZstdCompressor(level=level).compressobj()
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+def open_export(stream: BinaryIO) -> BinaryIO:
+    """
+    Wrap an export stream for line reading, transparently decompressing zstd input.
+
+    Args:
+        stream (BinaryIO): Raw export file or stdin
+
+    Returns:
+        BinaryIO: Buffered stream of NDJSON lines
+    """
+    buffered = stream if isinstance(stream, io.BufferedReader) else io.BufferedReader(stream)
+    if buffered.peek(4)[:4] == ZSTD_MAGIC:
+        return io.BufferedReader(zstd.ZstdDecompressor().stream_reader(buffered))
+    return buffered
+
+def _dedupe_key(url: str, date_generated: datetime, mode: str) -> bytes:
+    """Fixed-size key identifying a quiz for deduplication"""
+    identity = url if mode == "url" else f"{url}\0{date_generated.isoformat()}"
+    return hashlib.sha256(identity.encode("utf-8")).digest()
+
+def _parse_line(line: bytes) -> NewQuiz:
+    """Parse and validate one NDJSON line"""
+    record = json.loads(line)
+    user_answers = record.get("user_answers")
+    if user_answers is not None and not isinstance(user_answers, dict):
+        raise ValueError("user_answers must be an object")
+    return NewQuiz(
+        url=record["url"],
+        title=record["title"],
+        scraped_content=record.get("scraped_content"),
+        quiz=QuizOutput.model_validate(record["quiz"]),
+        date_generated=datetime.fromisoformat(record["date_generated"]),
+        user_answers=json.dumps(user_answers) if user_answers is not None else None
+    )
+
+def _import_batch(session: Session, batch: List[NewQuiz], mode: str, stats: TransferStats) -> None:
+    """Insert one batch of parsed quizzes, skipping duplicates, and commit it"""
+    # The duplicate check reads before save_quizzes writes; on SQLite, hold the write lock throughout
+    begin_write(session)
+    existing: Set[bytes] = {
+        _dedupe_key(url, date_generated, mode)
+        for url, date_generated in session.execute(
+            select(Quiz.url, Quiz.date_generated).where(Quiz.url.in_({new_quiz.url for new_quiz in batch}))
+        )
+    }
+
+    new_quizzes = []
+    for new_quiz in batch:
+        key = _dedupe_key(new_quiz.url, new_quiz.date_generated, mode)
+        if key in existing:
+            stats.skipped += 1
+            continue
+        existing.add(key)  # Duplicates within the file
+        new_quizzes.append(new_quiz)
+
+    save_quizzes(session, new_quizzes)
+    session.commit()
+    session.expunge_all()
+    stats.rows += len(new_quizzes)
+
+def import_quizzes(
+    session: Session,
+    lines: Iterable[bytes],
+    dedupe: str = "quiz",
+    batch_size: int = IMPORT_BATCH_SIZE,
+    stats: Optional[TransferStats] = None
+) -> TransferStats:
+    """
+    Import quizzes from NDJSON lines produced by export_quizzes.
+
+    Lines are inserted in batches (one transaction each) through the same persistence
+    path as generated quizzes, so content blobs, analytics and the search index stay
+    consistent. Invalid lines are logged and skipped.
+
+    Args:
+        session (Session): Database session
+        lines (Iterable[bytes]): NDJSON lines
+        dedupe (str): Dedupe mode (see DEDUPE_MODES)
+        batch_size (int): Rows inserted per transaction
+        stats (Optional[TransferStats]): Updated as batches are committed
+
+    Returns:
+        TransferStats: Imported, skipped and invalid counts with throughput
+    """
+    if dedupe not in DEDUPE_MODES:
+        raise ValueError(f"Unknown dedupe mode: {dedupe}")
+    stats = stats or TransferStats()
+    load_dictionaries(session)
+    session.commit()  # Each batch starts its own write transaction
+
+    batch: List[NewQuiz] = []
+    for line_number, line in enumerate(lines, start=1):
+        stats.bytes += len(line)
+        if not line.strip():
+            continue
+        try:
+            batch.append(_parse_line(line))
+        except (ValueError, KeyError, TypeError, ValidationError) as e:
+            stats.invalid += 1
+            logger.warning(f"Skipping line {line_number}: {str(e).splitlines()[0]}")
+            continue
+        if len(batch) >= batch_size:
+            _import_batch(session, batch, dedupe, stats)
+            logger.info(f"Imported {stats.rows} quizzes ({stats.rows_per_sec:.0f} rows/s)")
+            batch = []
+    if batch:
+        _import_batch(session, batch, dedupe, stats)
+
+    stats.finished = time.perf_counter()
+    return stats
+
+def main() -> None:
+    """Command line entry point: export or import"""
+    parser = argparse.ArgumentParser(description="Bulk export/import of quiz history as NDJSON")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    export_parser = subparsers.add_parser("export", help="Write all quizzes as NDJSON")
+    export_parser.add_argument("-o", "--output", default="-", help="Output file (default: stdout)")
+    export_parser.add_argument("--zstd", action="store_true", help="zstd-compress the output")
+    export_parser.add_argument("--no-content", action="store_true", help="Leave out the scraped article text")
+
+    import_parser = subparsers.add_parser("import", help="Load quizzes from an NDJSON export (plain or zstd)")
+    import_parser.add_argument("input", help="Export file ('-' for stdin)")
+    import_parser.add_argument("--dedupe", choices=DEDUPE_MODES, default="quiz",
+                               help="quiz: skip quizzes already present (same URL and time); url: skip known URLs")
+    import_parser.add_argument("--batch-size", type=int, default=IMPORT_BATCH_SIZE)
+    args = parser.parse_args()
+
+    create_tables()
+    ensure_search_index()
+    with SessionLocal() as session:
+        if args.command == "export":
+            stats = TransferStats()
+            chunks = export_quizzes(session, include_content=not args.no_content, stats=stats)
+            if args.zstd:
+                chunks = zstd_stream(chunks)
+            output = sys.stdout.buffer if args.output == "-" else open(args.output, "wb")
+            written = 0
+            try:
+                for chunk in chunks:
+                    output.write(chunk)
+                    written += len(chunk)
+            finally:
+                if output is not sys.stdout.buffer:
+                    output.close()
+            print(f"Exported {stats.summary()}; wrote {written / 1e6:.1f} MB", file=sys.stderr)
+        else:
+            source = sys.stdin.buffer if args.input == "-" else open(args.input, "rb")
+            try:
+                stats = import_quizzes(session, open_export(source), dedupe=args.dedupe, batch_size=args.batch_size)
+            finally:
+                source.close()
+            print(f"Imported {stats.summary()}", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,287 @@
+"""
+Write-behind persistence for submitted answers
+Buffers answer submissions in memory and writes them in periodic bulk transactions
+"""
+import asyncio
+import json
+import logging
+import os
+import time
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+from sqlalchemy import exc, update
+from sqlalchemy.orm import Session
+
+import analytics
+from database import AsyncSessionLocal, Quiz
+from scoring import AnswerKey
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# "write_behind" batches answer writes; "sync" commits every submission before responding
+ANSWER_WRITE_MODE = os.getenv("ANSWER_WRITE_MODE", "write_behind")
+ANSWER_FLUSH_INTERVAL_MS = int(os.getenv("ANSWER_FLUSH_INTERVAL_MS", "500"))
+ANSWER_FLUSH_BATCH_SIZE = int(os.getenv("ANSWER_FLUSH_BATCH_SIZE", "500"))
+# Submissions wait for a flush once this many are pending, and are rejected while the
+# database cannot take them, bounding memory under overload
+ANSWER_MAX_PENDING = int(os.getenv("ANSWER_MAX_PENDING", "20000"))
+# A batch that fails this many flushes is bisected to find and dead-letter the submissions
+# that fail on their own; the rest are written
+ANSWER_FLUSH_MAX_ATTEMPTS = int(os.getenv("ANSWER_FLUSH_MAX_ATTEMPTS", "3"))
+# Dead-lettered submissions are always logged; set a path to also append them there as NDJSON
+ANSWER_DEAD_LETTER_PATH = os.getenv("ANSWER_DEAD_LETTER_PATH", "")
+
+class Submission:
+    """A graded answer submission waiting to be persisted"""
+
+    __slots__ = ("answer_key", "answers_json", "graded", "submitted_at", "attempts")
+
+    def __init__(self, answer_key: AnswerKey, answers: Dict[str, str], graded: Dict[int, bool]):
+        self.answer_key = answer_key
+        self.answers_json = json.dumps(answers)
+        self.graded = graded
+        self.submitted_at = datetime.utcnow()
+        self.attempts = 0
+
+def _is_transient(error: Exception) -> bool:
+    """Whether a flush error means the database is unavailable rather than the batch is bad"""
+    if isinstance(error, exc.DBAPIError):
+        return error.connection_invalidated or isinstance(error, (exc.OperationalError, exc.InterfaceError))
+    return isinstance(error, (exc.DisconnectionError, OSError, asyncio.TimeoutError))
+
+def write_submissions(session: Session, submissions: List[Submission]) -> None:
+    """
+    Persist submissions in the current transaction.
+
+    Answers are coalesced per quiz (the latest submission wins, as before) and written with
+    a single executemany UPDATE; every submission still counts towards the analytics, whose
+    increments are summed in memory and applied with a few executemany statements.
+
+    Args:
+        session (Session): Database session
+        submissions (List[Submission]): Submissions in arrival order
+    """
+    latest: Dict[int, str] = {}
+    for submission in submissions:
+        latest[submission.answer_key.quiz_id] = submission.answers_json
+
+    session.execute(
+        update(Quiz),
+        [{"id": quiz_id, "user_answers": answers_json} for quiz_id, answers_json in latest.items()]
+    )
+    aggregates = analytics.AnalyticsBatch()
+    for submission in submissions:
+        aggregates.submission(submission.answer_key, submission.graded, submission.submitted_at)
+    aggregates.apply(session)
+
+class AnswerWriteBuffer:
+    """
+    Batches answer submissions into periodic bulk transactions.
+
+    Call start() on application startup and stop() on shutdown; stop() flushes everything
+    still pending, so a clean shutdown loses no answers. A crash loses at most one flush
+    interval of submissions - use ANSWER_WRITE_MODE=sync where that is not acceptable.
+    """
+
+    def __init__(
+        self,
+        session_factory: Callable = AsyncSessionLocal,
+        flush_interval: float = ANSWER_FLUSH_INTERVAL_MS / 1000,
+        batch_size: int = ANSWER_FLUSH_BATCH_SIZE,
+        max_pending: int = ANSWER_MAX_PENDING,
+        max_attempts: int = ANSWER_FLUSH_MAX_ATTEMPTS,
+        dead_letter_path: str = ANSWER_DEAD_LETTER_PATH
+    ):
+        self.session_factory = session_factory
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.max_pending = max_pending
+        self.max_attempts = max_attempts
+        self.dead_letter_path = dead_letter_path
+        self._pending: List[Submission] = []
+        self._latest_answers: Dict[int, str] = {}
+        self._flush_requested = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+        self._last_flush_failed = False
+        self.flushes = 0
+        self.flushed_submissions = 0
+        self.failed_flushes = 0
+        self.rejected_submissions = 0
+        self.dead_lettered_submissions = 0
+
+    @property
+    def pending_count(self) -> int:
+        return len(self._pending)
+
+    def pending_answers(self, quiz_id: int) -> Optional[str]:
+        """Latest not-yet-flushed answers JSON for a quiz (for read-your-writes)"""
+        return self._latest_answers.get(quiz_id)
+
+    async def start(self) -> None:
+        if self._task is None:
+            # Bind the synchronization primitives to the running loop
+            self._flush_requested = asyncio.Event()
+            self._flush_lock = asyncio.Lock()
+            self._stopping = False
+            self._task = asyncio.create_task(self._run())
+            logger.info(f"Answer write-behind buffer started (flush every {self.flush_interval:.2f}s)")
+
+    async def stop(self) -> None:
+        """Stop the background flusher and persist everything still pending"""
+        if self._task is not None:
+            # Let an in-progress flush finish - cancelling it could leave its transaction open
+            self._stopping = True
+            self._flush_requested.set()
+            await self._task
+            self._task = None
+        failures = 0
+        while self._pending:
+            if not await self.flush():
+                # Give a failing batch enough flushes to reach isolation before giving up
+                failures += 1
+                if failures >= self.max_attempts:
+                    logger.error(f"Dropping {len(self._pending)} unsaved answer submissions on shutdown")
+                    break
+        logger.info(f"Answer write-behind buffer stopped ({self.flushed_submissions} submissions in {self.flushes} flushes)")
+
+    async def submit(self, submission: Submission) -> bool:
+        """
+        Queue a submission for the next flush.
+
+        Returns:
+            bool: False if the submission was rejected: max_pending submissions are waiting
+                and the database is not accepting writes (nothing was queued)
+        """
+        if len(self._pending) >= self.max_pending:
+            # Backpressure: make the caller wait for a flush instead of growing without bound.
+            # While flushes are failing, reject at once rather than retrying per request.
+            if self._last_flush_failed or not await self.flush():
+                if len(self._pending) >= self.max_pending:
+                    self.rejected_submissions += 1
+                    return False
+        self._pending.append(submission)
+        self._latest_answers[submission.answer_key.quiz_id] = submission.answers_json
+        if len(self._pending) >= self.batch_size:
+            self._flush_requested.set()
+        return True
+
+    async def flush(self) -> bool:
+        """
+        Write all pending submissions in one transaction.
+
+        A batch that has failed max_attempts flushes is bisected instead: halves that write
+        are kept, and a submission that fails on its own is dead-lettered. Errors that mean
+        the database is unavailable (OperationalError, lost connections) never drop anything.
+
+        Returns:
+            bool: False if the write failed (unwritten submissions are re-queued for the next flush)
+        """
+        async with self._flush_lock:
+            batch, self._pending = self._pending, []
+            if not batch:
+                return True
+
+            started = time.perf_counter()
+            error = await self._write(batch)
+            if error is not None:
+                self.failed_flushes += 1
+                logger.error(f"Failed to flush {len(batch)} answer submissions: {error}")
+                for submission in batch:
+                    submission.attempts += 1
+                if _is_transient(error) or batch[0].attempts < self.max_attempts:
+                    retry = batch
+                elif len(batch) == 1:
+                    self._dead_letter(batch[0], error)
+                    retry = []
+                else:
+                    logger.warning(f"Batch of {len(batch)} answer submissions failed {batch[0].attempts} times; isolating bad submissions")
+                    retry = await self._isolate(batch)
+                if retry:
+                    self._last_flush_failed = True
+                    self._pending[:0] = retry
+                    return False
+
+            self._last_flush_failed = False
+            self.flushes += 1
+            logger.debug(f"Flushed {len(batch)} answer submissions in {time.perf_counter() - started:.3f}s")
+            return True
+
+    async def _write(self, batch: List[Submission]) -> Optional[Exception]:
+        """Write submissions in one transaction; returns the error if it failed"""
+        try:
+            async with self.session_factory() as session:
+                await session.run_sync(write_submissions, batch)
+                await session.commit()
+        except Exception as e:
+            return e
+        self._forget(batch)
+        self.flushed_submissions += len(batch)
+        return None
+
+    async def _isolate(self, batch: List[Submission]) -> List[Submission]:
+        """
+        Write a failing batch half by half, dead-lettering submissions that fail alone.
+
+        Args:
+            batch (List[Submission]): At least two submissions, in arrival order
+
+        Returns:
+            List[Submission]: Submissions left unwritten because the database became unavailable
+        """
+        middle = len(batch) // 2
+        halves = (batch[:middle], batch[middle:])
+        for index, half in enumerate(halves):
+            error = await self._write(half)
+            if error is None:
+                continue
+            if _is_transient(error):
+                return [submission for rest in halves[index:] for submission in rest]
+            if len(half) == 1:
+                self._dead_letter(half[0], error)
+                continue
+            retry = await self._isolate(half)
+            if retry:
+                return retry + [submission for rest in halves[index + 1:] for submission in rest]
+        return []
+
+    def _dead_letter(self, submission: Submission, error: Exception) -> None:
+        """Drop a submission that cannot be written, keeping a record of it"""
+        self.dead_lettered_submissions += 1
+        self._forget([submission])
+        record = {
+            "quiz_id": submission.answer_key.quiz_id,
+            "answers": json.loads(submission.answers_json),
+            "submitted_at": submission.submitted_at.isoformat(),
+            "error": str(error)
+        }
+        logger.error(f"Dead-lettered answer submission after {submission.attempts} failed flushes: {json.dumps(record)}")
+        if self.dead_letter_path:
+            try:
+                with open(self.dead_letter_path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(record) + "\n")
+            except OSError as e:
+                logger.error(f"Could not write to {self.dead_letter_path}: {e}")
+
+    def _forget(self, submissions: List[Submission]) -> None:
+        """Forget read-your-writes entries for submissions that left the buffer (unless superseded)"""
+        for submission in submissions:
+            quiz_id = submission.answer_key.quiz_id
+            if self._latest_answers.get(quiz_id) is submission.answers_json:
+                del self._latest_answers[quiz_id]
+
+    async def _run(self) -> None:
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._flush_requested.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._flush_requested.clear()
+            await self.flush()
+
+# Global buffer for use in FastAPI endpoints (None when ANSWER_WRITE_MODE=sync)
+answer_buffer: Optional[AnswerWriteBuffer] = AnswerWriteBuffer() if ANSWER_WRITE_MODE == "write_behind" else None